@@ -0,0 +1,84 @@
+"""
+output of ``where`` on a deep recursion, captured as a whole (as before)
+or streamed to VIM by chunks of lines
+
+Reports when VIM gets the first lines and how many bytes are held by the
+debugged process at most.
+
+    $ python benchmarks/bench_capture.py
+"""
+import sys
+import time
+
+from vimpdb.debugger import OutputSink
+from vimpdb.debugger import VimPdb
+
+DEPTH = 900
+
+
+class ToVim(object):
+
+    def __init__(self):
+        self.first = None
+        self.chunks = 0
+
+    def showFeedback(self, feedback):
+        if not feedback:
+            return
+        if self.first is None:
+            self.first = time.time()
+        self.chunks += 1
+
+    appendFeedback = showFeedback
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+class MeasuredSink(OutputSink):
+
+    peak = 0
+
+    def write(self, text):
+        OutputSink.write(self, text)
+        MeasuredSink.peak = max(MeasuredSink.peak, self.pending)
+
+
+def recurse(depth, debugger):
+    if depth:
+        return recurse(depth - 1, debugger)
+    frame = sys._getframe()
+    debugger.stack, debugger.curindex = debugger.get_stack(frame, None)
+    debugger.curframe = frame
+    start = time.time()
+    debugger.do_where('')
+    return start
+
+
+def measure(chunk_size):
+    import vimpdb.debugger
+    MeasuredSink.CHUNK_SIZE = chunk_size
+    MeasuredSink.MAX_LINE_SIZE = chunk_size
+    MeasuredSink.peak = 0
+    vimpdb.debugger.OutputSink = MeasuredSink
+    to_vim = ToVim()
+    debugger = VimPdb(to_vim, None)
+    debugger.capture_max_size = 0
+    debugger.reset()
+    start = recurse(DEPTH, debugger)
+    total = time.time() - start
+    return to_vim.first - start, total, to_vim.chunks, MeasuredSink.peak
+
+
+def main():
+    sys.setrecursionlimit(DEPTH + 100)
+    for label, chunk_size in (('whole output', sys.maxint),
+        ('streamed', OutputSink.CHUNK_SIZE)):
+        first, total, chunks, peak = measure(chunk_size)
+        print "%-12s: first lines after %6.1f ms, done in %6.1f ms, " \
+            "%3d chunks, %7d bytes held at most" % (label, first * 1000,
+            total * 1000, chunks, peak)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
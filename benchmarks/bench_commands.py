@@ -0,0 +1,71 @@
+"""
+time for a command sent as VIM does to reach the debugger,
+for each command protocol
+
+    $ python benchmarks/bench_commands.py
+"""
+import logging
+import socket
+import sys
+import time
+
+from vimpdb import config
+from vimpdb import protocol
+from vimpdb import proxy
+
+PORT = 16666
+RUNS = 5000
+
+
+class Configuration(object):
+
+    port = PORT
+
+    def __init__(self, command_protocol):
+        self.command_protocol = command_protocol
+
+
+def udp_sender(from_vim):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return lambda command: sender.sendto(command, ('127.0.0.1', PORT))
+
+
+def tcp_sender(from_vim):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sender.connect(('127.0.0.1', PORT))
+    return lambda command: sender.sendall(protocol.encode_frame([command]))
+
+
+def unix_sender(from_vim):
+    sender = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sender.connect(from_vim.getAddress())
+    return lambda command: sender.sendall(protocol.encode_frame([command]))
+
+
+def measure(command_protocol, make_sender):
+    from_vim = proxy.get_receiver(Configuration(command_protocol))
+    from_vim.bindSocket()
+    try:
+        send = make_sender(from_vim)
+        start = time.time()
+        for i in xrange(RUNS):
+            send('n')
+            from_vim.waitFor(None)
+        return (time.time() - start) / RUNS
+    finally:
+        from_vim.closeSocket()
+
+
+def main():
+    config.logger.setLevel(logging.INFO)
+    for command_protocol, make_sender in (
+        (config.UDP, udp_sender),
+        (config.TCP, tcp_sender),
+        (config.UNIX, unix_sender)):
+        elapsed = measure(command_protocol, make_sender)
+        print "%-4s: %6.1f us per command" % (command_protocol,
+            elapsed * 1e6)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+scripted debugging sessions against a VIM stand-in, to check performance
+changes for regressions without a real VIM
+
+Each scenario drives a real VimPdb with a list of commands, in a child
+process. ``stub`` (default) sends updates to the controller running in
+process on a fake ``vim`` module; ``client`` launches a fake VIM client
+subprocess per command, as ``vim --remote-send`` would.
+
+Reported per scenario: time to show a stop (step latency), round-trips
+to VIM and bytes sent per stop, time formatting locals, time of the other
+commands and peak memory of the child process.
+
+    $ python benchmarks/bench_fakevim.py [stub|client] [sync|async]
+"""
+import logging
+import os
+import resource
+import sys
+
+from vimpdb import config
+from vimpdb import debugger
+from vimpdb import proxy
+from vimpdb import stats
+from vimpdb.tests import fakevim
+
+STEPS = 50
+
+
+class ScriptedReceiver(object):
+    """
+    stands for ProxyFromVim: commands come from a script
+    """
+
+    persistent = False
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+    def waitFor(self, pdb):
+        return self.commands.pop(0)
+
+    def getAddress(self):
+        return None
+
+    def hasPending(self):
+        return False
+
+    def releaseSocket(self):
+        pass
+
+    def closeSocket(self):
+        pass
+
+
+def nested(depth, function, *args):
+    if depth:
+        return nested(depth - 1, function, *args)
+    return function(*args)
+
+
+def steps_scenario(instance, steps):
+    instance.set_trace()
+    total = 0
+    for i in xrange(steps):
+        total += i
+    return total
+
+
+def big_locals_scenario(instance, steps):
+    big = dict([(str(i), range(50)) for i in range(2000)])
+    deep = [[[range(10)] * 10] * 10] * 10
+    text = 'x' * 100000
+    instance.set_trace()
+    total = 0
+    for i in xrange(steps):
+        total += i
+    return total
+
+
+def deep_stack_scenario(instance, steps):
+    nested(200, steps_scenario, instance, steps)
+
+
+SCENARIOS = (
+    ('steps', steps_scenario, ['n'] * STEPS + ['c']),
+    ('big locals', big_locals_scenario,
+        ['n'] * STEPS + ['expand big', 'expand deep', 'c']),
+    ('deep stack', deep_stack_scenario,
+        ['w'] * 5 + ['u'] * 20 + ['d'] * 20 + ['c']),
+    ('long feedback', steps_scenario,
+        ['!print "\\n".join(map(str, range(20000)))'] * 5 +
+        ['!range(20000)'] * 5 + ['c']),
+    )
+
+
+def make_to_vim(mode, sending, recorder):
+    if mode == 'client':
+        script = '%s %s' % (sys.executable, os.path.join(
+            os.path.dirname(fakevim.__file__), 'scripts', 'remoteclient.py'))
+        communicator = proxy.Communicator(script, 'VIM')
+    else:
+        configuration = config.Config('vim', 'gvim', 'VIM', 6666)
+        vim = fakevim.FakeVim()
+        vim.add_buffer(__file__)
+        communicator = fakevim.FakeServer(
+            fakevim.start_controller(vim, configuration))
+    if sending == 'async':
+        return proxy.AsyncProxyToVim(communicator, recorder)
+    return proxy.ProxyToVim(communicator, recorder)
+
+
+def run(mode, sending, scenario, commands):
+    recorder = stats.Recorder()
+    to_vim = make_to_vim(mode, sending, recorder)
+    instance = debugger.VimPdb(to_vim, ScriptedReceiver(commands),
+        recorder=recorder)
+    scenario(instance, STEPS)
+    to_vim.flush()
+    return recorder.records
+
+
+def mean(values):
+    if not values:
+        return 0
+    return sum(values) / float(len(values))
+
+
+def report(name, records, peak):
+    stops = [record for record in records if record['command'] == stats.STOP]
+    others = [record for record in records
+        if record['command'] not in (stats.STOP, 'c')]
+    latencies = [record['wall'] * 1000 for record in stops]
+    latencies.sort()
+    commands = [record['wall'] * 1000 for record in others]
+    commands.sort()
+    print "%-14s %8.2f %8.2f %8.1f %9d %9.2f %8.2f %8.2f %7.1f" % (name,
+        stats.percentile(latencies, 50), stats.percentile(latencies, 90),
+        mean([record['round_trips'] for record in stops]),
+        mean([record['bytes'] for record in stops]),
+        mean([record['render'] * 1000 for record in stops]),
+        stats.percentile(commands, 50), stats.percentile(commands, 90),
+        peak / 1024.0)
+
+
+def in_child(mode, sending, name, scenario, commands):
+    """
+    run scenario in a child process, for its peak memory
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read_end)
+        config.logger.setLevel(logging.INFO)
+        records = run(mode, sending, scenario, commands)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        output = os.fdopen(write_end, 'w')
+        output.write(repr((records, peak)))
+        output.close()
+        os._exit(0)
+    os.close(write_end)
+    data = os.fdopen(read_end).read()
+    os.waitpid(pid, 0)
+    records, peak = eval(data)
+    report(name, records, peak)
+
+
+def main():
+    args = sys.argv[1:] + ['stub', 'sync'][len(sys.argv[1:]):]
+    mode, sending = args[:2]
+    print "VIM stand-in: %s, %s sends" % (mode, sending)
+    print "%-14s %8s %8s %8s %9s %9s %8s %8s %7s" % ('scenario',
+        'stop p50', 'stop p90', 'trips', 'bytes', 'render', 'cmd p50',
+        'cmd p90', 'MB')
+    print "%-14s %8s %8s %8s %9s %9s %8s %8s %7s" % ('',
+        'ms', 'ms', '/stop', '/stop', 'ms/stop', 'ms', 'ms', 'peak')
+    for name, scenario, commands in SCENARIOS:
+        in_child(mode, sending, name, scenario, commands)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
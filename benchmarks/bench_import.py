@@ -0,0 +1,45 @@
+"""
+time to import vimpdb in a new interpreter, compared with the import of
+the whole debugger as before
+
+Each time is the median of RUNS interpreters, minus the time of an empty
+interpreter.
+
+    $ python benchmarks/bench_import.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+RUNS = 15
+
+CASES = (
+    ('import vimpdb', 'import vimpdb'),
+    ('set_trace() not firing',
+        'import vimpdb; vimpdb.set_trace(condition=False)'),
+    ('import vimpdb.debugger', 'import vimpdb.debugger'),
+    )
+
+
+def median_time(code):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+    times = []
+    for i in range(RUNS):
+        start = time.time()
+        subprocess.call([sys.executable, '-c', code], env=environment)
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    base = median_time('pass')
+    print "empty interpreter: %6.1f ms" % (base * 1000)
+    for label, code in CASES:
+        print "%-22s: %6.1f ms" % (label, (median_time(code) - base) * 1000)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
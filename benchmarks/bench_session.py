@@ -0,0 +1,83 @@
+"""
+compare cold and warm set_trace() setup
+
+cold: a new VimPdb, its proxies and configuration, as for the first
+set_trace() of a process.
+warm: the VimPdb instance kept by debugger.Session.
+
+Uses the VIM stand-in scripts of the test suite: no VIM needed. Only the
+setup is measured; no debugging session is started.
+
+    $ python benchmarks/bench_session.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+from vimpdb import config
+from vimpdb import debugger
+from vimpdb.tests import test_config
+
+RUNS = 20
+
+
+def timed(function, runs=RUNS):
+    start = time.time()
+    for i in range(runs):
+        function()
+    return (time.time() - start) / runs
+
+
+def main():
+    handle, rc_name = tempfile.mkstemp()
+    os.close(handle)
+    configuration = config.Config(
+        test_config.build_script("rightserverlist.py"),
+        test_config.build_script("compatiblevim.py"), 'VIM', 0)
+    config.write_to_file(rc_name, configuration)
+    handle, cache_name = tempfile.mkstemp()
+    os.close(handle)
+    os.remove(cache_name)
+
+    get_configuration = config.get_configuration
+    config.probe_cache = config.ProbeCache(cache_name)
+    config.get_configuration = lambda: get_configuration(rc_name,
+        config.probe_cache)
+
+    def cold_without_cache_file():
+        if os.path.exists(cache_name):
+            os.remove(cache_name)
+        cold()
+
+    def cold():
+        cache = config.ProbeCache(cache_name)
+        instance = debugger.make_instance(get_configuration(rc_name, cache))
+        instance.from_vim.bindSocket()
+        instance.from_vim.closeSocket()
+
+    session = debugger.Session()
+
+    def warm():
+        instance = session.get_instance()
+        instance.from_vim.bindSocket()
+        instance.from_vim.releaseSocket()
+
+    try:
+        first = timed(cold_without_cache_file)
+        cold_time = timed(cold)
+        warm()
+        warm_time = timed(warm)
+    finally:
+        session.close()
+        config.get_configuration = get_configuration
+        os.remove(rc_name)
+        if os.path.exists(cache_name):
+            os.remove(cache_name)
+    print "cold, no probe cache file: %8.2f ms" % (first * 1000)
+    print "cold:                      %8.2f ms" % (cold_time * 1000)
+    print "warm:                      %8.2f ms" % (warm_time * 1000)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
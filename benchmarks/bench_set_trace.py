@@ -0,0 +1,38 @@
+"""
+cost of set_trace() calls that do not start debugging, compared to a plain
+function call
+
+    $ python benchmarks/bench_set_trace.py
+"""
+import sys
+import timeit
+
+SETUP = """
+from vimpdb import debugger
+
+def noop(condition=True, hit_count=None, enabled=True):
+    pass
+"""
+
+CASES = [
+    ("plain function call", "noop(enabled=False)"),
+    ("set_trace(enabled=False)", "debugger.set_trace(enabled=False)"),
+    ("set_trace(condition=False)", "debugger.set_trace(condition=False)"),
+    ("disabled set_trace()", "debugger.set_trace()"),
+    ]
+
+NUMBER = 1000000
+
+
+def main():
+    for label, statement in CASES:
+        setup = SETUP
+        if label.startswith('disabled'):
+            setup += "debugger.disable()\n"
+        timer = timeit.Timer(statement, setup)
+        best = min(timer.repeat(3, NUMBER))
+        print "%-28s %6.3f us" % (label, best * 1e6 / NUMBER)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+compare vimpdb configuration at startup with and without the probe cache
+
+Uses the VIM stand-in scripts of the test suite: no VIM needed.
+
+    $ python benchmarks/bench_startup.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+from vimpdb import config
+from vimpdb.tests import test_config
+
+RUNS = 20
+
+
+def write_rc_file():
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    configuration = config.Config(
+        test_config.build_script("rightserverlist.py"),
+        test_config.build_script("compatiblevim.py"), 'VIM', 6666)
+    config.write_to_file(name, configuration)
+    return name
+
+
+def timed(function, runs=RUNS):
+    start = time.time()
+    for i in range(runs):
+        function()
+    return (time.time() - start) / runs
+
+
+def main():
+    rc_name = write_rc_file()
+    handle, cache_name = tempfile.mkstemp()
+    os.close(handle)
+    os.remove(cache_name)
+
+    def uncached():
+        config.Detector(config.getRawConfiguration(rc_name)
+            ).check_serverlist()
+
+    cache = config.ProbeCache(cache_name)
+
+    def cached():
+        config.get_configuration(rc_name, cache)
+
+    try:
+        cold = timed(uncached)
+        cached()
+        warm = timed(cached)
+    finally:
+        os.remove(rc_name)
+        if os.path.exists(cache_name):
+            os.remove(cache_name)
+    print "without probe cache: %8.2f ms" % (cold * 1000)
+    print "with probe cache:    %8.2f ms" % (warm * 1000)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+time spent by the debugged process to show each step in VIM, with
+synchronous and asynchronous sends (``async_send`` option)
+
+A stand-in communicator takes DELAY seconds per command, like a VIM client
+launched by ``vim --remote-send``. Steps come faster than VIM can show them,
+as with a quick ``n n n`` sequence.
+
+    $ python benchmarks/bench_steps.py
+"""
+import logging
+import sys
+import time
+
+from vimpdb import config
+from vimpdb import proxy
+
+DELAY = 0.03
+STEPS = 20
+STEP_INTERVAL = 0.005
+
+
+class Communicator(object):
+
+    def __init__(self):
+        self.sent = 0
+
+    def _send(self, command):
+        time.sleep(DELAY)
+        self.sent += 1
+
+    def _remote_expr(self, expr):
+        time.sleep(DELAY)
+        return '1'
+
+
+def steps(to_vim):
+    blocked = 0.0
+    for step in range(STEPS):
+        start = time.time()
+        to_vim.showFileAtLine(__file__, step + 1)
+        to_vim.updateLocals(['step = ', '    %d' % step])
+        blocked += time.time() - start
+        time.sleep(STEP_INTERVAL)
+    return blocked
+
+
+def main():
+    config.logger.setLevel(logging.INFO)
+    for klass in (proxy.ProxyToVim, proxy.AsyncProxyToVim):
+        communicator = Communicator()
+        to_vim = klass(communicator)
+        to_vim.remote_state = proxy.REMOTE_READY
+        start = time.time()
+        blocked = steps(to_vim)
+        to_vim.flush()
+        total = time.time() - start
+        print "%-16s: %6.1f ms per step in debugged process, " \
+            "%3d commands, %5.2f s until VIM is up to date" % (
+            klass.__name__, blocked / STEPS * 1000, communicator.sent, total)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+slowdown of code traced by VimPdb after c(ontinue), with N breakpoints
+that are never reached
+
+Breakpoints are set either in the module of the traced code or in another
+module. Each case runs with the standard pdb tracing and with the indexed
+continue mode.
+
+    $ python benchmarks/bench_trace.py
+"""
+import imp
+import os
+import sys
+import tempfile
+import time
+
+from vimpdb.debugger import VimPdb
+
+WORKLOAD = '''
+def leaf(value):
+    return value * 2
+
+
+def work(count):
+    total = 0
+    for index in xrange(count):
+        total += leaf(index)
+    return total
+
+
+def unused():
+%s
+'''
+
+ITERATIONS = 200000
+BREAKPOINTS = (1, 10, 100)
+
+
+class ToVim(object):
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def load_module(name, unused_lines):
+    body = "\n".join(["    x = %d" % i for i in range(unused_lines)])
+    handle, filename = tempfile.mkstemp(suffix='.py')
+    os.write(handle, WORKLOAD % body)
+    os.close(handle)
+    module = imp.load_source(name, filename)
+    return module, filename
+
+
+def traced(debugger, function, *args):
+    """
+    run function as after c(ontinue) in a session started here
+    """
+    debugger.reset()
+    debugger.botframe = sys._getframe()
+    debugger.set_continue()
+    sys.settrace(debugger.trace_dispatch)
+    try:
+        return function(*args)
+    finally:
+        sys.settrace(None)
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def make_debugger(module, filename, count, fast_continue):
+    debugger = VimPdb(ToVim(), ToVim())
+    debugger.fast_continue = fast_continue
+    # lines in the body of unused()
+    first = module.unused.func_code.co_firstlineno + 1
+    for line in range(first, first + count):
+        debugger.set_break(filename, line)
+    return debugger
+
+
+def main():
+    work_module, work_file = load_module('bench_work', max(BREAKPOINTS))
+    other_module, other_file = load_module('bench_other', max(BREAKPOINTS))
+    try:
+        base = timed(work_module.work, ITERATIONS)
+        print "untraced: %6.3f s" % base
+        for count in BREAKPOINTS:
+            for label, module, filename in (
+                ('same module', work_module, work_file),
+                ('other module', other_module, other_file)):
+                for mode, fast_continue in (('standard', False),
+                    ('indexed', True)):
+                    debugger = make_debugger(module, filename, count,
+                        fast_continue)
+                    elapsed = timed(traced, debugger, work_module.work,
+                        ITERATIONS)
+                    debugger.clear_all_breaks()
+                    print "%3d breakpoints, %-12s, %-8s: %6.3f s (x %.1f)" % (
+                        count, label, mode, elapsed, elapsed / base)
+    finally:
+        for filename in (work_file, other_file):
+            for name in (filename, filename + 'c'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,25 @@
-from vimpdb.debugger import set_trace
-from vimpdb.debugger import hook
+import sys
+
+# the debugger and what it needs to talk to VIM are imported
+# only when debugging starts
+from vimpdb.trigger import disable
+from vimpdb.trigger import enable
+from vimpdb.trigger import should_trace
+
+
+def set_trace(condition=True, hit_count=None, enabled=True):
+    """
+    can be called like pdb.set_trace(); see vimpdb.debugger.set_trace
+    """
+    frame = sys._getframe().f_back
+    if should_trace(frame, condition, hit_count, enabled):
+        from vimpdb import debugger
+        debugger.session.get_instance().set_trace(frame)
+
+
+def hook(klass):
+    from vimpdb import debugger
+    debugger.hook(klass)
 
 
 def hookPdb():
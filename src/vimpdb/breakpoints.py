@@ -0,0 +1,125 @@
+from bdb import Breakpoint
+
+
+def last_line(code):
+    """
+    last line number of code, computed from its line number table
+    """
+    increments = code.co_lnotab[1::2]
+    return code.co_firstlineno + sum([ord(char) for char in increments])
+
+
+def has_enabled_breakpoint(breaks):
+    """
+    tells if one of the breakpoints in breaks (as in bdb.Bdb.breaks)
+    is enabled
+    """
+    for filename, lines in breaks.items():
+        for line in lines:
+            for breakpoint in Breakpoint.bplist.get((filename, line), []):
+                if breakpoint.enabled:
+                    return True
+    return False
+
+
+class BreakpointIndex(object):
+    """
+    tells which code objects may stop at a breakpoint of a debugger
+
+    Answers are kept per code object until breakpoints change.
+    """
+
+    def __init__(self):
+        self.codes = dict()
+
+    def invalidate(self):
+        self.codes.clear()
+
+    def may_break(self, code, breaks, canonic):
+        try:
+            return self.codes[code]
+        except KeyError:
+            pass
+        result = False
+        lines = breaks.get(canonic(code.co_filename))
+        if lines:
+            first = code.co_firstlineno
+            last = last_line(code)
+            for line in lines:
+                if first <= line <= last:
+                    result = True
+                    break
+        self.codes[code] = result
+        return result
+
+
+def breakpoint_lines(breaks):
+    """
+    {filename: {line: enabled}} for the breakpoints in breaks;
+    a line is enabled when one of its breakpoints is
+    """
+    lines = dict()
+    for filename, numbers in breaks.items():
+        states = lines[filename] = dict()
+        for line in numbers:
+            enabled = False
+            for breakpoint in Breakpoint.bplist.get((filename, line), []):
+                enabled = enabled or bool(breakpoint.enabled)
+            states[line] = enabled
+    return lines
+
+
+def lines_delta(old, new):
+    """
+    what changed from old to new breakpoint lines (see breakpoint_lines)
+
+    Returns a [filename, placed, removed] list for each file that changed:
+    placed holds [line, enabled] for new or changed lines, removed
+    the lines without breakpoint anymore.
+    """
+    filenames = dict.fromkeys(old.keys() + new.keys()).keys()
+    filenames.sort()
+    changes = []
+    for filename in filenames:
+        old_states = old.get(filename, {})
+        new_states = new.get(filename, {})
+        if old_states == new_states:
+            continue
+        placed = []
+        for line, enabled in sorted(new_states.items()):
+            if old_states.get(line) != enabled:
+                placed.append([line, int(enabled)])
+        removed = [line for line in sorted(old_states)
+            if line not in new_states]
+        changes.append([filename, placed, removed])
+    return changes
+
+
+def breakpoint_entries():
+    """
+    {number: (filename, line, condition, hits, enabled, temporary)}
+    for all bdb breakpoints
+    """
+    entries = dict()
+    for breakpoint in Breakpoint.bpbynumber:
+        # deleted breakpoints leave None in bpbynumber
+        if breakpoint is None:
+            continue
+        entries[breakpoint.number] = (breakpoint.file, breakpoint.line,
+            breakpoint.cond or '', breakpoint.hits,
+            int(bool(breakpoint.enabled)), int(bool(breakpoint.temporary)))
+    return entries
+
+
+def entries_delta(old, new):
+    """
+    what changed from old to new breakpoint entries (see
+    breakpoint_entries): [number, filename, line, ...] lists of new or
+    changed breakpoints, and numbers of deleted ones
+    """
+    changed = []
+    for number, entry in sorted(new.items()):
+        if old.get(number) != entry:
+            changed.append([number] + list(entry))
+    removed = [number for number in sorted(old) if number not in new]
+    return changed, removed
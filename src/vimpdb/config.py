@@ -5,15 +5,46 @@ import logging
 import time
 import ConfigParser
 import subprocess
+import socket
+import stat
+import tempfile
+import copy
+import cPickle
+import StringIO
 
 from vimpdb import bbbconfig
 from vimpdb import errors
 
 RCNAME = os.path.expanduser('~/.vimpdbrc')
+CACHENAME = os.path.expanduser('~/.vimpdbcache')
 
 CLIENT = 'CLIENT'
 SERVER = 'SERVER'
 
+# transports used to send commands to VIM
+REMOTE = 'remote'
+CHANNEL = 'channel'
+TRANSPORTS = (REMOTE, CHANNEL)
+
+# protocols used by VIM to send commands to vimpdb
+UDP = 'udp'
+TCP = 'tcp'
+UNIX = 'unix'
+COMMAND_PROTOCOLS = (UDP, TCP, UNIX)
+
+# tracing after c(ontinue)
+INDEXED = 'indexed'
+STANDARD = 'standard'
+CONTINUE_MODES = (INDEXED, STANDARD)
+
+# budgets used to format each local in the watch window
+DEFAULT_WATCH_MAXDEPTH = 3
+DEFAULT_WATCH_MAXLENGTH = 30
+DEFAULT_WATCH_MAXBYTES = 4000
+
+# bytes of output of a command shown as feedback
+DEFAULT_CAPTURE_MAX_SIZE = 1000000
+
 
 logger = logging.getLogger('vimpdb')
 logger.setLevel(logging.DEBUG)
@@ -32,13 +63,27 @@ def get_package_path(instance):
 class Config(object):
 
     def __init__(self, vim_client_script, vim_server_script, server_name,
-        port, loglevel=logging.INFO):
+        port, loglevel=logging.INFO, transport=REMOTE,
+        watch_maxdepth=DEFAULT_WATCH_MAXDEPTH,
+        watch_maxlength=DEFAULT_WATCH_MAXLENGTH,
+        watch_maxbytes=DEFAULT_WATCH_MAXBYTES, continue_mode=INDEXED,
+        command_protocol=UDP, async_send=False, feedback_scrollback=0,
+        capture_max_size=DEFAULT_CAPTURE_MAX_SIZE):
         self.scripts = dict()
         self.vim_client_script = self.scripts[CLIENT] = vim_client_script
         self.vim_server_script = self.scripts[SERVER] = vim_server_script
         self.server_name = server_name
         self.port = port
         self.loglevel = loglevel
+        self.transport = transport
+        self.watch_maxdepth = watch_maxdepth
+        self.watch_maxlength = watch_maxlength
+        self.watch_maxbytes = watch_maxbytes
+        self.continue_mode = continue_mode
+        self.command_protocol = command_protocol
+        self.async_send = async_send
+        self.feedback_scrollback = feedback_scrollback
+        self.capture_max_size = capture_max_size
 
     def __repr__(self):
         return ("<vimpdb Config : Script %s; Server name %s, Port %s>" %
@@ -72,7 +117,9 @@ defaultConfig = Config(DEFAULT_CLIENT_SCRIPT, DEFAULT_SERVER_SCRIPT,
 defaultConfig.vim_client_script = defaultConfig.scripts[CLIENT]
 
 
-def get_configuration(filename=RCNAME):
+def get_configuration(filename=RCNAME, cache=None):
+    if cache is None:
+        cache = get_probe_cache()
     if not os.path.exists(filename):
         mustCheck = True
         mustWrite = True
@@ -84,7 +131,7 @@ def get_configuration(filename=RCNAME):
         mustCheck = False
         mustWrite = False
         try:
-            config = read_from_file(filename, Config)
+            config = read_cached(filename, Config)
         except errors.BadRCFile, e:
             try:
                 config_4_0 = bbbconfig.read_from_file_4_0(filename, Config)
@@ -94,16 +141,43 @@ def get_configuration(filename=RCNAME):
             mustCheck = True
     initial = config
     if mustCheck:
-        config = Detector(config).checkConfiguration()
+        config = Detector(config, cache=cache).checkConfiguration()
     if mustWrite or initial != config:
         write_to_file(filename, config)
-    Detector(config).check_serverlist()
+    Detector(config, cache=cache).check_serverlist()
     logger.setLevel(config.loglevel)
     return config
 
 
 def getRawConfiguration(filename=RCNAME):
-    return read_from_file(filename, Config)
+    return read_cached(filename, Config)
+
+
+def file_stamp(filename):
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+    return info.st_mtime, info.st_size
+
+
+# configurations read from rc files, by (filename, class),
+# with the stamp of the file when read
+parsed = dict()
+
+
+def read_cached(filename, klass):
+    """
+    as read_from_file, parsing the file again only when it changed;
+    returns a copy that the caller may change
+    """
+    key = (filename, klass)
+    stamp = file_stamp(filename)
+    cached = parsed.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = parsed[key] = (stamp, read_from_file(filename, klass))
+    # deep: the scripts dict is changed too
+    return copy.deepcopy(cached[1])
 
 
 def read_from_file(filename, klass):
@@ -123,8 +197,29 @@ def read_from_file(filename, klass):
         loglevel = parser.get('vimpdb', 'loglevel')
         if loglevel == 'DEBUG':
             loglevel = logging.DEBUG
+    transport = read_choice_option(parser, 'transport', TRANSPORTS,
+        filename)
+    continue_mode = read_choice_option(parser, 'continue_mode',
+        CONTINUE_MODES, filename)
+    command_protocol = read_choice_option(parser, 'command_protocol',
+        COMMAND_PROTOCOLS, filename)
+    async_send = read_boolean_option(parser, 'async_send', False, filename)
+    feedback_scrollback = read_int_option(parser, 'feedback_scrollback', 0,
+        filename)
+    capture_max_size = read_int_option(parser, 'capture_max_size',
+        DEFAULT_CAPTURE_MAX_SIZE, filename)
+    watch_maxdepth = read_int_option(parser, 'watch_maxdepth',
+        DEFAULT_WATCH_MAXDEPTH, filename)
+    watch_maxlength = read_int_option(parser, 'watch_maxlength',
+        DEFAULT_WATCH_MAXLENGTH, filename)
+    watch_maxbytes = read_int_option(parser, 'watch_maxbytes',
+        DEFAULT_WATCH_MAXBYTES, filename)
     return klass(vim_client_script, vim_server_script, server_name, port,
-        loglevel)
+        loglevel, transport, watch_maxdepth=watch_maxdepth,
+        watch_maxlength=watch_maxlength, watch_maxbytes=watch_maxbytes,
+        continue_mode=continue_mode, command_protocol=command_protocol,
+        async_send=async_send, feedback_scrollback=feedback_scrollback,
+        capture_max_size=capture_max_size)
 
 
 def read_option(parser, name, error_msg):
@@ -134,16 +229,71 @@ def read_option(parser, name, error_msg):
         raise errors.BadRCFile(error_msg % name)
 
 
+def read_choice_option(parser, name, choices, filename):
+    """
+    value of an option among choices; first choice is the default
+    """
+    if not parser.has_option('vimpdb', name):
+        return choices[0]
+    value = parser.get('vimpdb', name)
+    if value not in choices:
+        raise errors.BadRCFile("'%s' option in '%s' should be one of %s."
+            % (name, filename, ", ".join(choices)))
+    return value
+
+
+def read_int_option(parser, name, default, filename):
+    if not parser.has_option('vimpdb', name):
+        return default
+    try:
+        return parser.getint('vimpdb', name)
+    except ValueError:
+        raise errors.BadRCFile("'%s' option in '%s' should be an integer."
+            % (name, filename))
+
+
+def read_boolean_option(parser, name, default, filename):
+    if not parser.has_option('vimpdb', name):
+        return default
+    try:
+        return parser.getboolean('vimpdb', name)
+    except ValueError:
+        raise errors.BadRCFile("'%s' option in '%s' should be a boolean."
+            % (name, filename))
+
+
 def write_to_file(filename, config):
+    """
+    write the options found by detection, keeping the other options;
+    the file is left untouched when its content would not change.
+    Returns True when the file is written.
+    """
     parser = ConfigParser.RawConfigParser()
-    parser.add_section('vimpdb')
+    parser.read(filename)
+    if not parser.has_section('vimpdb'):
+        parser.add_section('vimpdb')
+    # replaced by vim_client_script and vim_server_script since 0.4.1
+    parser.remove_option('vimpdb', 'script')
     parser.set('vimpdb', 'vim_client_script', config.scripts[CLIENT])
     parser.set('vimpdb', 'vim_server_script', config.scripts[SERVER])
     parser.set('vimpdb', 'server_name', config.server_name)
     parser.set('vimpdb', 'port', config.port)
+    output = StringIO.StringIO()
+    parser.write(output)
+    content = output.getvalue()
+    try:
+        rcfile = open(filename)
+        try:
+            if rcfile.read() == content:
+                return False
+        finally:
+            rcfile.close()
+    except IOError:
+        pass
     rcfile = open(filename, 'w')
-    parser.write(rcfile)
+    rcfile.write(content)
     rcfile.close()
+    return True
 
 
 def getCommandOutputPosix(parts):
@@ -160,6 +310,170 @@ def getCommandOutputPosix(parts):
     return output.strip()
 
 
+def which(name):
+    """
+    path of the executable file launched by name, None if not found
+    """
+    if os.path.dirname(name):
+        candidates = [name]
+    else:
+        candidates = [os.path.join(directory, name) for directory in
+            os.environ.get('PATH', '').split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def script_stamp(command):
+    """
+    modification times of the files run by command;
+    it changes when the script (or VIM) is upgraded.
+    """
+    stamp = []
+    for index, part in enumerate(command):
+        if index == 0:
+            path = which(part)
+        elif os.path.isfile(part):
+            path = part
+        else:
+            continue
+        if path is not None:
+            stamp.append((path, os.path.getmtime(path)))
+    return tuple(stamp)
+
+
+class ProbeCache(object):
+    """
+    results of Detector probes, kept in memory and in a file beside
+    the RC file
+
+    VIM versions are kept until the script launching VIM is modified.
+    A VIM server found in the server list is assumed alive for
+    SERVER_TTL seconds.
+    """
+
+    SERVER_TTL = 30.0
+
+    def __init__(self, filename=CACHENAME):
+        self.filename = filename
+        self.versions = dict()
+        self.servers = dict()
+        self.load()
+
+    def load(self):
+        try:
+            cache_file = open(self.filename, 'rb')
+        except IOError:
+            return
+        try:
+            try:
+                self.versions, self.servers = cPickle.load(cache_file)
+            except Exception:
+                logger.debug("ignoring unreadable cache %s" % self.filename)
+        finally:
+            cache_file.close()
+
+    def save(self):
+        try:
+            cache_file = open(self.filename, 'wb')
+        except IOError:
+            return
+        try:
+            cPickle.dump((self.versions, self.servers), cache_file,
+                cPickle.HIGHEST_PROTOCOL)
+        finally:
+            cache_file.close()
+
+    def get_version(self, command):
+        key = " ".join(command)
+        cached = self.versions.get(key)
+        if cached is not None and cached[0] == script_stamp(command):
+            return cached[1]
+        return None
+
+    def set_version(self, command, version):
+        key = " ".join(command)
+        self.versions[key] = (script_stamp(command), version)
+        self.save()
+
+    def is_server_alive(self, script, server_name):
+        seen = self.servers.get((script, server_name.lower()))
+        return seen is not None and 0 <= time.time() - seen < self.SERVER_TTL
+
+    def set_server_alive(self, script, server_name):
+        self.servers[(script, server_name.lower())] = time.time()
+        self.save()
+
+    def forget_server(self, script, server_name):
+        if self.servers.pop((script, server_name.lower()), None) is not None:
+            self.save()
+
+
+probe_cache = None
+
+
+def get_probe_cache():
+    """
+    probe cache shared by the whole process
+    """
+    global probe_cache
+    if probe_cache is None:
+        probe_cache = ProbeCache()
+    return probe_cache
+
+
+def socket_directory():
+    """
+    directory holding the Unix domain sockets of debugged processes
+    """
+    return os.path.join(tempfile.gettempdir(), 'vimpdb-%d' % os.getuid())
+
+
+def socket_path(pid):
+    return os.path.join(socket_directory(), '%d.sock' % pid)
+
+
+def is_private_directory(directory):
+    """
+    directory is a real directory (not a symlink) of the current user,
+    without permissions for group or others
+    """
+    try:
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid()
+        and not info.st_mode & 077)
+
+
+def find_sockets():
+    """
+    paths of the Unix domain sockets of debugged processes,
+    most recently bound first; none if the socket directory
+    is not private
+    """
+    directory = socket_directory()
+    if not is_private_directory(directory):
+        return []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    stamped = []
+    for name in names:
+        if not name.endswith('.sock'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stamped.append((os.stat(path).st_mtime, path))
+        except OSError:
+            pass
+    stamped.sort()
+    stamped.reverse()
+    return [path for stamp, path in stamped]
+
+
 NO_SERVER_SUPPORT = ("'%s' launches a VIM instance without "
     "clientserver support.")
 NO_PYTHON_SUPPORT = "'%s' launches a VIM instance without python support."
@@ -170,11 +484,47 @@ NO_CLIENTSERVER_IN_VERSION = ("Calling --version returned no information "
 RETURN_CODE = "'%s' returned exit code '%d'."
 
 
+# VIM command that tells a ReadinessListener the server is ready
+READY_COMMAND = ('python import socket; socket.socket(socket.AF_INET, '
+    'socket.SOCK_DGRAM).sendto("ready", ("127.0.0.1", %d))')
+
+
+class ReadinessListener(object):
+    """
+    UDP socket on which a VIM server launched by vimpdb notifies
+    that it is up and running
+    """
+
+    socket_factory = socket.socket
+
+    def __init__(self):
+        self.socket = self.socket_factory(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.notified = False
+
+    def wait(self, timeout):
+        if self.notified:
+            time.sleep(timeout)
+            return True
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.recvfrom(64)
+        except socket.timeout:
+            return False
+        self.notified = True
+        return True
+
+    def close(self):
+        self.socket.close()
+
+
 class DetectorBase(object):
 
     MAX_TIMEOUT = 5
+    FIRST_DELAY = 0.1
 
-    def __init__(self, config, commandParser):
+    def __init__(self, config, commandParser, cache=None):
         self.scripts = dict()
         self.scripts[CLIENT] = config.scripts[CLIENT]
         self.scripts[SERVER] = config.scripts[SERVER]
@@ -182,6 +532,8 @@ class DetectorBase(object):
         self.port = config.port
         self.loglevel = config.loglevel
         self.commandParser = commandParser
+        self.cache = cache
+        self.launched = False
 
     def checkConfiguration(self):
         while not self._checkConfiguration():
@@ -227,9 +579,16 @@ class DetectorBase(object):
             return False
         return True
 
-    def launch_vim_server(self):
+    def launch_vim_server(self, ready_port=None):
         raise NotImplemented
 
+    def build_server_command(self, ready_port=None):
+        command = self.build_command(SERVER, '--servername',
+            self.server_name)
+        if ready_port is not None:
+            command.extend(['-c', READY_COMMAND % ready_port])
+        return command
+
     def build_command(self, script_type, *args):
         script = self.scripts[script_type]
         command = script.split()
@@ -257,32 +616,76 @@ class DetectorBase(object):
         return False
 
     def check_serverlist(self):
-        if not self.serverAvailable():
+        cache = self.cache
+        if cache is not None and cache.is_server_alive(self.scripts[CLIENT],
+            self.server_name):
+            return True
+        self._check_serverlist()
+        if cache is not None:
+            cache.set_server_alive(self.scripts[CLIENT], self.server_name)
+        return True
+
+    def forget_server(self):
+        """
+        VIM server stopped answering: next check_serverlist probes again
+        """
+        if self.cache is not None:
+            self.cache.forget_server(self.scripts[CLIENT], self.server_name)
+
+    def _check_serverlist(self):
+        if self.serverAvailable():
+            return True
+        listener = ReadinessListener()
+        try:
             try:
-                self.launch_vim_server()
+                self.launch_vim_server(listener.port)
+                self.launched = True
             except errors.ReturnCodeError, e:
                 return_code = e.args[0]
                 command = e.args[1]
                 raise ValueError(RETURN_CODE % (command, return_code))
             except OSError, e:
                 raise ValueError(str(e))
-        timeout = 0.0
-        INCREMENT = 0.1
-        while timeout < self.MAX_TIMEOUT:
-            if self.serverAvailable():
-                break
-            time.sleep(INCREMENT)
-            timeout += INCREMENT
-        else:
-            serverlist = self.get_serverlist()
-            if not self.serverAvailable():
-                msg = "'%s' server name not available in server list:\n%s"
-                raise ValueError(msg % (self.server_name, serverlist))
+            if self.wait_for_server(listener):
+                return True
+        finally:
+            listener.close()
+        serverlist = self.get_serverlist()
+        if not self.serverAvailable():
+            msg = "'%s' server name not available in server list:\n%s"
+            raise ValueError(msg % (self.server_name, serverlist))
         return True
 
+    def wait_for_server(self, listener):
+        """
+        wait until the launched server tells it is ready;
+        meanwhile, poll the server list with exponential backoff.
+        """
+        elapsed = 0.0
+        delay = self.FIRST_DELAY
+        while elapsed < self.MAX_TIMEOUT:
+            delay = min(delay, self.MAX_TIMEOUT - elapsed)
+            start = time.time()
+            listener.wait(delay)
+            elapsed += time.time() - start
+            if self.serverAvailable():
+                return True
+            delay *= 2
+        return False
+
     def get_vim_version(self, script_type):
+        command = self.build_command(script_type, '--version')
+        if self.cache is not None:
+            version = self.cache.get_version(command)
+            if version is not None:
+                return version
+        version = self._get_vim_version(command)
+        if self.cache is not None:
+            self.cache.set_version(command, version)
+        return version
+
+    def _get_vim_version(self, command):
         try:
-            command = self.build_command(script_type, '--version')
             return self.commandParser(command)
         except errors.ReturnCodeError, e:
             return_code = e.args[0]
@@ -337,8 +740,10 @@ if sys.platform == 'win32':
 
     class Detector(DetectorBase):
 
-        def __init__(self, config, commandParser=getCommandOutputWindows):
-            return super(Detector, self).__init__(config, commandParser)
+        def __init__(self, config, commandParser=getCommandOutputWindows,
+            cache=None):
+            return super(Detector, self).__init__(config, commandParser,
+                cache)
 
         def check_python_support(self):
             command = self.build_command(SERVER, 'dummy.txt',
@@ -358,9 +763,8 @@ if sys.platform == 'win32':
             else:
                 return True
 
-        def launch_vim_server(self):
-            command = self.build_command(SERVER, '--servername',
-                self.server_name)
+        def launch_vim_server(self, ready_port=None):
+            command = self.build_server_command(ready_port)
             subprocess.Popen(command)
             return True
 
@@ -368,8 +772,10 @@ else:
 
     class Detector(DetectorBase):
 
-        def __init__(self, config, commandParser=getCommandOutputPosix):
-            return super(Detector, self).__init__(config, commandParser)
+        def __init__(self, config, commandParser=getCommandOutputPosix,
+            cache=None):
+            return super(Detector, self).__init__(config, commandParser,
+                cache)
 
         def check_python_support(self):
             version = self.get_vim_version(SERVER)
@@ -383,10 +789,11 @@ else:
         def check_server_clientserver_support(self):
             return self.check_clientserver_support(SERVER)
 
-        def launch_vim_server(self):
-            command = self.build_command(SERVER, '--servername',
-                self.server_name)
+        def launch_vim_server(self, ready_port=None):
+            command = self.build_server_command(ready_port)
             return_code = subprocess.call(command)
             if return_code:
+                # report the command without the readiness notification
+                command = self.build_server_command()
                 raise errors.ReturnCodeError(return_code, " ".join(command))
             return True
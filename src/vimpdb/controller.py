@@ -2,6 +2,7 @@ import socket
 import vim_bridge
 
 from vimpdb import config
+from vimpdb import protocol
 
 # after call of initialize function,
 # pointer to vim module
@@ -20,119 +21,728 @@ def initialize(module):
     controller = Controller()
 
 
-def buffer_create():
-    source_buffer = vim.current.buffer.name
-    vim.command('silent rightbelow 5new -vimpdb-')
+# base names of the feedback and watch buffers;
+# buffers of a registered session are suffixed with its name
+FEEDBACK = '-vimpdb-'
+WATCH = '-watch-'
+# shows the breakpoints of the current session
+BREAKPOINTS = '-breakpoints-'
+
+
+def buffer_name(kind, session=''):
+    session = controller.resolve(session)
+    if not session:
+        return kind
+    return '%s%s-' % (kind, session)
+
+
+class BufferTracker(object):
+    """
+    numbers of the buffers created by the controller
+
+    Buffers are checked by number instead of walking all windows or
+    buffers; walking is left for buffers not known yet or wiped out.
+    """
+
+    def __init__(self):
+        self.numbers = dict()
+        # true when VIM has window ids (VIM 8)
+        self.window_ids = None
+
+    def has_window_ids(self):
+        if self.window_ids is None:
+            self.window_ids = vim.eval("exists('*win_gotoid')") == '1'
+        return self.window_ids
+
+    def remember(self, name, buffer):
+        self.numbers[name] = buffer.number
+
+    def forget(self, name):
+        if name in self.numbers:
+            del self.numbers[name]
+
+    def number(self, name):
+        """
+        number of the buffer called name, shown or hidden;
+        None when there is no such buffer
+        """
+        number = self.numbers.get(name)
+        if number is not None:
+            if vim.eval('bufexists(%d)' % number) == '1':
+                return number
+            del self.numbers[name]
+        for buffer in vim.buffers:
+            if has_name(buffer, name):
+                self.numbers[name] = buffer.number
+                return buffer.number
+        return None
+
+    def window(self, name):
+        """
+        window of the current tab showing the buffer called name, or None
+        """
+        number = self.number(name)
+        if number is None:
+            return None
+        index = int(vim.eval('bufwinnr(%d)' % number))
+        if index < 1:
+            return None
+        return vim.windows[index - 1]
+
+
+def window_mark():
+    """
+    current window, to come back to with window_return
+    """
+    if controller.buffers.has_window_ids():
+        return vim.eval('win_getid()')
+    return vim.current.buffer.name
+
+
+def window_return(mark):
+    if controller.buffers.has_window_ids():
+        vim.command('call win_gotoid(%s)' % mark)
+        return
+    while True:
+        vim.command('wincmd w')  # switch back window
+        if mark == vim.current.buffer.name:
+            break
+
+
+def buffer_setup():
     vim.command('set buftype=nofile')
+    # keep the content while the session is not shown
+    vim.command('set bufhidden=hide')
     vim.command('set noswapfile')
     vim.command('set nonumber')
     vim.command('set nowrap')
+
+
+def buffer_create(session=''):
+    mark = window_mark()
+    name = buffer_name(FEEDBACK, session)
+    vim.command('silent rightbelow 5new %s' % name)
+    buffer_setup()
     buffer = vim.current.buffer
-    while True:
-        vim.command('wincmd w')  # switch back window
-        if source_buffer == vim.current.buffer.name:
-            break
+    controller.buffers.remember(name, buffer)
+    window_return(mark)
     return buffer
 
 
-def buffer_find():
-    for win in vim.windows:
-        try:  # FIXME: Error while new a unnamed buffer
-            if '-vimpdb-' in win.buffer.name:
-                return win.buffer
-        except:
-            pass
-    return None
+def has_name(buffer, name):
+    try:  # FIXME: Error while new a unnamed buffer
+        return buffer.name is not None and (
+            buffer.name == name or buffer.name.endswith('/' + name))
+    except:
+        return False
+
+
+def buffer_find(session=''):
+    win = controller.buffers.window(buffer_name(FEEDBACK, session))
+    if win is None:
+        return None
+    return win.buffer
+
+
+def buffer_hide(name):
+    number = controller.buffers.number(name)
+    if number is None:
+        return
+    for index in range(len(vim.windows)):
+        window_number = int(vim.eval('bufwinnr(%d)' % number))
+        if window_number < 0:
+            break
+        vim.command('silent! %dclose' % window_number)
+
+
+def buffer_show(name, split):
+    number = controller.buffers.number(name)
+    if number is None or int(vim.eval('bufwinnr(%d)' % number)) > 0:
+        return
+    mark = window_mark()
+    vim.command('silent rightbelow %s' % split)
+    vim.command('buffer %d' % number)
+    window_return(mark)
+
+
+def buffer_wipeout(name):
+    vim.command('silent! bwipeout %s' % name)
+    controller.buffers.forget(name)
 
 
 @vim_bridge.bridged
-def _PDB_buffer_write(message):
-    pdb_buffer = buffer_find()
+def _PDB_buffer_write(message, session):
+    pdb_buffer = buffer_find(session)
     if pdb_buffer is None:
-        pdb_buffer = buffer_create()
+        pdb_buffer = buffer_create(session)
 
-    pdb_buffer[:] = None
+    if not controller.scrollback:
+        pdb_buffer[:] = message
+        return
+    # scrollback: keep previous feedback
+    buffer_append(pdb_buffer, message, session)
 
-    for line in message:
-        pdb_buffer.append(line)
-    del pdb_buffer[0]
+
+@vim_bridge.bridged
+def _PDB_buffer_append(message, session):
+    """
+    next lines of the feedback of a command
+    """
+    pdb_buffer = buffer_find(session)
+    if pdb_buffer is None:
+        pdb_buffer = buffer_create(session)
+    buffer_append(pdb_buffer, message, session)
+
+
+def buffer_append(pdb_buffer, message, session):
+    if len(pdb_buffer) == 1 and pdb_buffer[0] == '':
+        pdb_buffer[:] = message
+    else:
+        pdb_buffer.append(message)
+    limit = controller.scrollback
+    if limit:
+        excess = len(pdb_buffer) - limit
+        if excess > 0:
+            del pdb_buffer[:excess]
+    win = controller.buffers.window(buffer_name(FEEDBACK, session))
+    if win is not None:
+        win.cursor = (len(pdb_buffer), 0)
 
 
 @vim_bridge.bridged
 def _PDB_buffer_close():
-    vim.command('silent! bwipeout -vimpdb-')
+    buffer_wipeout(buffer_name(FEEDBACK))
 
 
-def watch_create():
-    source_buffer = vim.current.buffer.name
-    vim.command('silent rightbelow 40vnew -watch-')
-    vim.command('set buftype=nofile')
-    vim.command('set noswapfile')
-    vim.command('set nonumber')
-    vim.command('set nowrap')
+def watch_create(session=''):
+    mark = window_mark()
+    name = buffer_name(WATCH, session)
+    vim.command('silent rightbelow 40vnew %s' % name)
+    buffer_setup()
+    # expand the local under the cursor
+    vim.command('nnoremap <buffer> <silent> <CR> '
+        ':call PDB_watch_expand()<CR>')
     buffer = vim.current.buffer
-    while True:
-        vim.command('wincmd w')   # switch back window
-        if source_buffer == vim.current.buffer.name:
-            break
+    controller.buffers.remember(name, buffer)
+    window_return(mark)
     return buffer
 
 
-def watch_find():
-    for win in vim.windows:
-        try:   # FIXME: Error while new a unnamed buffer
-            if '-watch-' in win.buffer.name:
-                return win.buffer
-        except:
-            pass
-    return None
+def watch_find(session=''):
+    win = controller.buffers.window(buffer_name(WATCH, session))
+    if win is None:
+        return None
+    return win.buffer
 
 
-def watch_get():
-    watch_buffer = watch_find()
+def watch_get(session=''):
+    watch_buffer = watch_find(session)
     if watch_buffer is None:
-        watch_buffer = watch_create()
+        watch_buffer = watch_create(session)
     return watch_buffer
 
 
 @vim_bridge.bridged
-def _PDB_watch_reset():
-    watch_buffer = watch_get()
+def _PDB_watch_reset(session):
+    watch_buffer = watch_get(session)
     watch_buffer[:] = None
 
 
 @vim_bridge.bridged
-def _PDB_watch_write(message):
-    watch_buffer = watch_get()
+def _PDB_watch_write(message, session):
+    watch_buffer = watch_get(session)
+    watch_buffer[:] = message
+
+
+@vim_bridge.bridged
+def _PDB_watch_append(message, session):
+    watch_buffer = watch_get(session)
+    watch_buffer.append(message)
+
 
-    for line in message:
-        watch_buffer.append(line)
-    if watch_buffer[0].strip() == '':
-        del watch_buffer[0]
+@vim_bridge.bridged
+def _PDB_watch_patch(length, ops, session):
+    watch_buffer = watch_find(session)
+    if watch_buffer is None or len(watch_buffer) != int(length):
+        return False
+    # ops are sorted; apply from last to keep line numbers valid
+    ops.reverse()
+    for start, end, lines in ops:
+        watch_buffer[int(start):int(end)] = lines
+    return True
 
 
 @vim_bridge.bridged
 def _PDB_watch_close():
-    vim.command('silent! bwipeout -watch-')
+    buffer_wipeout(buffer_name(WATCH))
+
+
+# signs defined in vimpdb.vim, for lines with enabled or disabled
+# breakpoints; ids are offset to stay clear of other plugins' signs
+SIGNS = {'1': 'PdbBreakpoint', '0': 'PdbBreakpointDisabled'}
+SIGN_ID_BASE = 7340000
+
+
+class SignKeeper(object):
+    """
+    breakpoint signs wanted by each session, by file
+
+    Signs are placed in buffers of loaded files only; the signs of
+    a file are placed when it is loaded. A line has one sign for all
+    sessions, enabled when a session has an enabled breakpoint there.
+    """
+
+    def __init__(self):
+        # {session: {filename: {line: enabled}}} as wanted
+        self.wanted = dict()
+        # {filename: {line: enabled}} as placed
+        self.placed = dict()
+        self.supported = None
+
+    def has_signs(self):
+        if self.supported is None:
+            self.supported = vim.eval("has('signs')") == '1'
+        return self.supported
+
+    def update(self, session, filename, placed, removed):
+        files = self.wanted.setdefault(session, dict())
+        wanted = files.setdefault(filename, dict())
+        for line, enabled in placed:
+            wanted[int(line)] = str(enabled)
+        for line in removed:
+            wanted.pop(int(line), None)
+        if not wanted:
+            del files[filename]
+        if not files:
+            del self.wanted[session]
+        if filename in self.placed or is_loaded(filename):
+            self.apply(filename)
+
+    def merged(self, filename):
+        """
+        signs wanted in filename by all sessions
+        """
+        merged = dict()
+        for files in self.wanted.values():
+            for line, enabled in files.get(filename, {}).items():
+                if merged.get(line) != '1':
+                    merged[line] = enabled
+        return merged
+
+    def apply(self, filename):
+        """
+        bring signs placed in the buffer of filename to those wanted
+        """
+        if not self.has_signs():
+            return
+        placed = self.placed.get(filename, {})
+        wanted = self.merged(filename)
+        escaped = filename.replace(' ', '\\ ')
+        for line in placed:
+            if line not in wanted:
+                vim.command('sign unplace %d file=%s'
+                    % (SIGN_ID_BASE + line, escaped))
+        for line, enabled in wanted.items():
+            if placed.get(line) != enabled:
+                vim.command('sign place %d line=%d name=%s file=%s'
+                    % (SIGN_ID_BASE + line, line, SIGNS[enabled], escaped))
+        if wanted:
+            self.placed[filename] = wanted
+        else:
+            self.placed.pop(filename, None)
+
+    def loaded(self, filename):
+        for files in self.wanted.values():
+            if filename in files:
+                self.apply(filename)
+                return
+
+    def unloaded(self, filename):
+        self.placed.pop(filename, None)
+
+    def clear(self, session):
+        self.wanted.pop(session, None)
+        for filename in self.placed.keys():
+            self.apply(filename)
+
+
+def is_loaded(filename):
+    return vim.eval("bufloaded('%s')" % filename.replace("'", "''")) == '1'
+
+
+@vim_bridge.bridged
+def _PDB_update_signs(changes, session):
+    """
+    changes of breakpoint lines of session,
+    as [filename, placed, removed] lists
+    """
+    session = controller.resolve(session)
+    for filename, placed, removed in changes:
+        controller.signs.update(session, filename, placed, removed)
+
+
+@vim_bridge.bridged
+def _PDB_signs_loaded(filename):
+    controller.signs.loaded(filename)
+
+
+@vim_bridge.bridged
+def _PDB_signs_unloaded(filename):
+    controller.signs.unloaded(filename)
+
+
+@vim_bridge.bridged
+def _PDB_signs_clear():
+    """
+    signs of the current session are removed, other sessions keep theirs
+    """
+    controller.signs.clear(controller.current)
+
+
+def format_breakpoint(number, entry):
+    filename, line, condition, hits, enabled, temporary = entry
+    if enabled:
+        state = 'yes'
+    else:
+        state = 'no '
+    if temporary:
+        kind = 'once'
+    else:
+        kind = 'keep'
+    text = '%3d %s %s %s:%d hits %d' % (number, state, kind, filename, line,
+        hits)
+    if condition:
+        text += ' if %s' % condition
+    return text
+
+
+class BreakpointList(object):
+    """
+    breakpoints of a debugged process, by number, as sent by vimpdb
+
+    Lines are formatted when breakpoints change; filtering only looks
+    for a pattern in them.
+    """
+
+    def __init__(self):
+        # {number: (filename, line, condition, hits, enabled, temporary)}
+        self.entries = dict()
+        self.texts = dict()
+
+    def update(self, changed, removed):
+        for item in changed:
+            number = int(item[0])
+            filename, line, condition, hits, enabled, temporary = item[1:]
+            entry = (filename, int(line), condition, int(hits),
+                int(enabled), int(temporary))
+            self.entries[number] = entry
+            self.texts[number] = format_breakpoint(number, entry)
+        for number in removed:
+            number = int(number)
+            if number in self.entries:
+                del self.entries[number]
+                del self.texts[number]
+
+    def matching(self, pattern):
+        """
+        numbers of the breakpoints whose line contains pattern
+        """
+        numbers = self.texts.keys()
+        numbers.sort()
+        if not pattern:
+            return numbers
+        return [number for number in numbers
+            if pattern in self.texts[number]]
+
+
+def breakpoint_list(session=''):
+    name = controller.resolve(session)
+    breakpoints = controller.breakpoint_lists.get(name)
+    if breakpoints is None:
+        breakpoints = controller.breakpoint_lists[name] = BreakpointList()
+    return breakpoints
+
+
+def breakpoints_write():
+    """
+    show the breakpoints of the current session matching the filter
+    in the breakpoint list window, if any
+    """
+    win = controller.buffers.window(BREAKPOINTS)
+    if win is None:
+        return
+    breakpoints = breakpoint_list()
+    controller.breakpoints_shown = breakpoints.matching(
+        controller.breakpoints_filter)
+    lines = [breakpoints.texts[number]
+        for number in controller.breakpoints_shown]
+    if not lines:
+        lines = ['no breakpoint']
+    win.buffer[:] = lines
+
+
+def breakpoints_create():
+    mark = window_mark()
+    vim.command('silent rightbelow 10new %s' % BREAKPOINTS)
+    buffer_setup()
+    for key, function in (('<CR>', 'PDB_breakpoint_jump()'),
+        ('e', 'PDB_breakpoint_action("enable")'),
+        ('d', 'PDB_breakpoint_action("disable")'),
+        ('x', 'PDB_breakpoint_action("cl")')):
+        vim.command('nnoremap <buffer> <silent> %s :call %s<CR>'
+            % (key, function))
+    controller.buffers.remember(BREAKPOINTS, vim.current.buffer)
+    window_return(mark)
+
+
+@vim_bridge.bridged
+def _PDB_update_breakpoints(changed, removed, session):
+    breakpoint_list(session).update(changed, removed)
+    if controller.resolve(session) == controller.current:
+        breakpoints_write()
+
+
+@vim_bridge.bridged
+def _PDB_show_breakpoints(pattern):
+    """
+    show the breakpoint list window, with breakpoints matching pattern
+    """
+    controller.breakpoints_filter = pattern.strip()
+    if controller.buffers.number(BREAKPOINTS) is None:
+        breakpoints_create()
+    else:
+        buffer_show(BREAKPOINTS, '10split')
+    breakpoints_write()
+
+
+def breakpoint_at(line):
+    index = int(line) - 1
+    shown = controller.breakpoints_shown
+    if index < 0 or index >= len(shown):
+        return None
+    return shown[index]
+
+
+@vim_bridge.bridged
+def _PDB_breakpoint_number(line):
+    """
+    number of the breakpoint at line of the list window, or 0
+    """
+    number = breakpoint_at(line)
+    if number is None:
+        return 0
+    return number
+
+
+@vim_bridge.bridged
+def _PDB_breakpoint_location(line):
+    """
+    [filename, line] of the breakpoint at line of the list window
+    """
+    number = breakpoint_at(line)
+    if number is None:
+        return []
+    entry = breakpoint_list().entries[number]
+    return [entry[0], entry[1]]
+
+
+@vim_bridge.bridged
+def _PDB_breakpoints_close():
+    controller.breakpoint_lists.pop(controller.current, None)
+    controller.breakpoints_shown = []
+    buffer_wipeout(BREAKPOINTS)
+
+
+class RemoteSession(object):
+    """
+    debugged process paused, as registered by its vimpdb
+    """
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        # (filename, line) last shown for the session
+        self.location = None
 
 
 # socket management
 class Controller(object):
 
+    # a stuck debugged process must not freeze VIM
+    TIMEOUT = 2.0
+
     def __init__(self):
         configuration = config.getRawConfiguration()
         self.port = configuration.port
+        self.protocol = configuration.command_protocol
+        # lines of feedback kept, or 0 to show only the last feedback
+        self.scrollback = configuration.feedback_scrollback
+        self.buffers = BufferTracker()
+        self.signs = SignKeeper()
+        # breakpoints of each session, numbers of those in the list
+        # window and the pattern they match
+        self.breakpoint_lists = dict()
+        self.breakpoints_shown = []
+        self.breakpoints_filter = ''
         self.host = '127.0.0.1'
+        # address of the current session, as announced by the debugged
+        # process: Unix domain socket path or host:port
+        self.address = None
         self.socket = None
+        self.sessions = dict()
+        # names of registered sessions, most recently registered last
+        self.order = []
+        self.current = ''
+
+    # session registry
+
+    def resolve(self, session):
+        """
+        name of session; empty session means the current one
+        """
+        return session or self.current
+
+    def register(self, name, address):
+        """
+        add a paused session; it becomes the current one only if there
+        is none, other sessions are shown with :PDBSession
+        """
+        if name in self.order:
+            self.order.remove(name)
+        self.order.append(name)
+        self.sessions[name] = RemoteSession(name, address)
+        if not self.current or name == self.current:
+            self.select(name)
+
+    def unregister(self, name=''):
+        """
+        forget a session (by default the current one);
+        returns the name of the new current session
+        """
+        name = self.resolve(name)
+        if name in self.sessions:
+            del self.sessions[name]
+            self.order.remove(name)
+        if name == self.current:
+            self.socket_close()
+            self.current = ''
+            self.address = None
+            if self.order:
+                self.select(self.order[-1])
+        return self.current
+
+    def select(self, name):
+        session = self.sessions.get(name)
+        if session is None:
+            return False
+        if session.address != self.address:
+            self.socket_close()
+        self.current = name
+        self.address = session.address
+        return True
+
+    def stopped(self, session, filename, line):
+        """
+        record where session stopped; returns whether it is shown,
+        as the current session (or an unknown one)
+        """
+        name = self.resolve(session)
+        session = self.sessions.get(name)
+        if session is None:
+            return True
+        session.location = (filename, line)
+        return name == self.current
+
+    def session_list(self):
+        lines = []
+        for name in self.order:
+            session = self.sessions[name]
+            if name == self.current:
+                marker = '*'
+            else:
+                marker = ' '
+            if session.location is None:
+                where = ''
+            else:
+                where = '%s:%s' % session.location
+            lines.append('%s %s %s' % (marker, name, where))
+        return lines
+
+    # sockets
 
     def init_socket(self):
         if self.socket is None:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
-                socket.IPPROTO_UDP)
+            if self.protocol == config.TCP:
+                new_socket = self.connect_tcp()
+            elif self.protocol == config.UNIX:
+                new_socket = self.connect_unix()
+            else:
+                new_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                    socket.IPPROTO_UDP)
+            self.socket = new_socket
+
+    def connect_tcp(self):
+        address = (self.host, self.port)
+        if self.address is not None:
+            host, port = self.address.rsplit(':', 1)
+            address = (host, int(port))
+        new_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        new_socket.settimeout(self.TIMEOUT)
+        try:
+            new_socket.connect(address)
+        except socket.error:
+            new_socket.close()
+            raise
+        return new_socket
+
+    def connect_unix(self):
+        """
+        connect to the socket of the current session,
+        or else to the most recent socket of a living debugged process
+        """
+        if self.address is not None:
+            paths = [self.address]
+        else:
+            paths = config.find_sockets()
+        for path in paths:
+            new_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            new_socket.settimeout(self.TIMEOUT)
+            try:
+                new_socket.connect(path)
+            except socket.error:
+                new_socket.close()
+                continue
+            self.address = path
+            return new_socket
+        raise socket.error('no debugged process found in %s'
+            % config.socket_directory())
 
     def socket_send(self, message):
-        self.init_socket()
-        self.socket.sendto(message, (self.host, self.port))
+        self.send_commands([message])
+
+    def send_commands(self, messages):
+        if self.protocol in (config.TCP, config.UNIX):
+            self.stream_send(protocol.encode_frame(messages))
+        else:
+            self.init_socket()
+            for message in messages:
+                self.socket.sendto(message, (self.host, self.port))
+
+    def stream_send(self, frame):
+        try:
+            self.init_socket()
+            self.socket.sendall(frame)
+        except socket.error:
+            # connection closed by vimpdb since last command
+            self.socket_close()
+            try:
+                self.init_socket()
+                self.socket.sendall(frame)
+            except socket.error:
+                # the debugged process is gone or stuck
+                self.socket_close()
+                self.unregister()
+                raise
 
     def socket_close(self):
         if self.socket is not None:
@@ -145,6 +755,56 @@ def PDB_send_command(message):
     controller.socket_send(message)
 
 
+@vim_bridge.bridged
+def PDB_send_commands(messages):
+    controller.send_commands(messages)
+
+
+@vim_bridge.bridged
+def _PDB_register_session(name, address):
+    controller.register(name, address)
+
+
+@vim_bridge.bridged
+def _PDB_unregister_session():
+    return controller.unregister()
+
+
+@vim_bridge.bridged
+def _PDB_session_stopped(session, filename, line):
+    return controller.stopped(session, filename, line)
+
+
+@vim_bridge.bridged
+def _PDB_session_list():
+    return controller.session_list()
+
+
+@vim_bridge.bridged
+def _PDB_select_session(name):
+    """
+    show session name instead of the current one;
+    returns its location, or an empty list for an unknown session
+    """
+    if name not in controller.sessions:
+        return []
+    if name != controller.current:
+        buffer_hide(buffer_name(FEEDBACK))
+        buffer_hide(buffer_name(WATCH))
+        controller.select(name)
+    location = controller.sessions[name].location
+    if location is None:
+        return []
+    return list(location)
+
+
+@vim_bridge.bridged
+def _PDB_show_session_buffers():
+    buffer_show(buffer_name(FEEDBACK), '5split')
+    buffer_show(buffer_name(WATCH), '40vsplit')
+    breakpoints_write()
+
+
 @vim_bridge.bridged
 def _PDB_socket_close():
     controller.socket_close()
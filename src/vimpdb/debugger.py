@@ -1,10 +1,14 @@
+import os
 import pdb
 from pdb import Pdb
 import sys
-import StringIO
-import pprint
+import time
 from vimpdb import proxy
 from vimpdb import config
+from vimpdb import watch
+from vimpdb import breakpoints
+from vimpdb import stats
+from vimpdb import trigger
 
 PYTHON_25_OR_BIGGER = sys.version_info >= (2, 5)
 PYTHON_26_OR_BIGGER = sys.version_info >= (2, 6)
@@ -13,9 +17,14 @@ PYTHON_26_OR_BIGGER = sys.version_info >= (2, 6)
 def capture_sys_stdout(method):
 
     def decorated(self, line):
+        if self.capturing:
+            # part of a command whose output is already captured
+            return method(self, line)
         self.capture_sys_stdout()
-        result = method(self, line)
-        self.stop_capture_sys_stdout()
+        try:
+            result = method(self, line)
+        finally:
+            self.stop_capture_sys_stdout()
         self.to_vim.showFeedback(self.pop_output())
         return result
 
@@ -25,9 +34,14 @@ def capture_sys_stdout(method):
 def capture_self_stdout(method):
 
     def decorated(self, line):
+        if self.capturing:
+            # part of a command whose output is already captured
+            return method(self, line)
         self.capture_self_stdout()
-        result = method(self, line)
-        self.stop_capture_self_stdout()
+        try:
+            result = method(self, line)
+        finally:
+            self.stop_capture_self_stdout()
         self.to_vim.showFeedback(self.pop_output())
         return result
 
@@ -53,12 +67,134 @@ def show_line(method):
 def close_socket(method):
 
     def decorated(self, line):
-        self.from_vim.closeSocket()
+        self.from_vim.releaseSocket()
         return method(self, line)
 
     return decorated
 
 
+def forget_locals(method):
+    """
+    Vim closes the watch window: next locals are sent in full
+    """
+
+    def decorated(self, line):
+        self.to_vim.forgetLocals()
+        return method(self, line)
+
+    return decorated
+
+
+def discard_updates(method):
+    """
+    Vim closes its windows: updates not sent yet are useless
+    """
+
+    def decorated(self, line):
+        self.to_vim.discardPending()
+        return method(self, line)
+
+    return decorated
+
+
+def update_breakpoints(method):
+    """
+    breakpoints changed: forget what is known about them
+    """
+
+    def decorated(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.breakpoints.invalidate()
+        self.signs_outdated = True
+        self.list_outdated = True
+        return result
+
+    return decorated
+
+
+def forget_signs(method):
+    """
+    Vim removes breakpoint signs and list: next ones are sent in full
+    """
+
+    def decorated(self, line):
+        self.to_vim.forgetBreakpoints()
+        self.signs_outdated = True
+        self.list_outdated = True
+        return method(self, line)
+
+    return decorated
+
+
+class OutputSink(object):
+    """
+    file-like object sending what is written to Vim as feedback,
+    by chunks of complete lines, as it comes
+
+    The first chunk replaces the feedback, next ones are appended.
+    Beyond max_size bytes (0 for no limit), output is dropped.
+    """
+
+    CHUNK_SIZE = 8192
+
+    # a line longer than that is sent in pieces
+    MAX_LINE_SIZE = 16 * CHUNK_SIZE
+
+    def __init__(self, to_vim, max_size=0):
+        self.to_vim = to_vim
+        self.max_size = max_size
+        self.parts = []
+        self.pending = 0
+        self.written = 0
+        self.dropped = 0
+        self.sent = False
+
+    def write(self, text):
+        if self.max_size and self.written + len(text) > self.max_size:
+            kept = max(self.max_size - self.written, 0)
+            self.dropped += len(text) - kept
+            text = text[:kept]
+        if not text:
+            return
+        self.written += len(text)
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.CHUNK_SIZE:
+            self.send()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def send(self, final=False):
+        data = ''.join(self.parts)
+        end = len(data)
+        if not final and end < self.MAX_LINE_SIZE:
+            # keep the last incomplete line for next chunk
+            end = data.rfind('\n') + 1
+        self.parts = []
+        if end < len(data):
+            self.parts.append(data[end:])
+        self.pending = len(data) - end
+        data = data[:end]
+        if not data:
+            return
+        if self.sent:
+            self.to_vim.appendFeedback(data)
+        else:
+            self.to_vim.showFeedback(data)
+            self.sent = True
+
+    def close(self):
+        if self.dropped:
+            self.parts.append('\n*** output truncated: %d bytes dropped ***'
+                % self.dropped)
+        self.send(final=True)
+
+
 class Switcher:
     """
     Helper for switching from pdb to vimpdb
@@ -73,6 +209,19 @@ class Switcher:
             frame = frame.f_back
         sys.settrace(self.trace_dispatch)
 
+    def switch_tracer(self, other):
+        """
+        frames still traced by self are now traced by other:
+        bdb dispatch methods return self.trace_dispatch as local tracer,
+        and frames of the stack, below botframe, are traced by other.
+        """
+        self.trace_dispatch = other.trace_dispatch
+        if self.stack:
+            frame = self.stack[-1][0]
+            while frame:
+                frame.f_trace = other.trace_dispatch
+                frame = frame.f_back
+
     def update_state(self, other):
         self.stack = other.stack
         self.curindex = other.curindex
@@ -87,35 +236,155 @@ class VimPdb(Pdb, Switcher):
     debugger integrated with Vim
     """
 
-    def __init__(self, to_vim, from_vim):
+    # number of files of the stack that Vim loads in advance
+    PRELOADED_FILES = 10
+
+    def __init__(self, to_vim, from_vim, renderer=None, recorder=None):
         Pdb.__init__(self)
+        if recorder is None:
+            recorder = stats.Recorder()
+        self.stats = recorder
         self.capturing = False
+        self.capture_max_size = config.DEFAULT_CAPTURE_MAX_SIZE
         self.to_vim = to_vim
         self.from_vim = from_vim
         self._textOutput = ''
-
-    def trace_dispatch(self, frame, event, arg):
-        """allow to switch to Pdb instance"""
-        if hasattr(self, 'pdb'):
-            return self.pdb.trace_dispatch(frame, event, arg)
-        else:
-            return Pdb.trace_dispatch(self, frame, event, arg)
+        self.watch = watch.WatchEngine(renderer)
+        self.active = False
+        self.breakpoints = breakpoints.BreakpointIndex()
+        # after c(ontinue), trace only frames that may hit a breakpoint
+        self.fast_continue = True
+        self.continuing = False
+        # breakpoints changed since last sent to Vim as signs,
+        # and as list (where hit counts change while running)
+        self.signs_outdated = True
+        self.list_outdated = True
 
     def execRcLines(self):
         pass
 
+    def reset(self):
+        Pdb.reset(self)
+        self.continuing = False
+
+    def interaction(self, frame, traceback):
+        self.continuing = False
+        # callers untraced by c(ontinue) are traced again,
+        # for n(ext) or r(eturn) to stop in them
+        self.retrace_frames(frame)
+        return Pdb.interaction(self, frame, traceback)
+
+    def set_continue(self):
+        Pdb.set_continue(self)
+        if not self.fast_continue:
+            return
+        self.continuing = True
+        if breakpoints.has_enabled_breakpoint(self.breaks):
+            self.untrace_frames(self.may_break)
+        else:
+            sys.settrace(None)
+            self.untrace_frames(lambda code: False)
+
+    def untrace_frames(self, keep):
+        """
+        stop tracing frames of the stack whose code is not kept
+        """
+        frame = sys._getframe().f_back
+        while frame and frame is not self.botframe:
+            if not keep(frame.f_code):
+                del frame.f_trace
+            frame = frame.f_back
+
+    def retrace_frames(self, frame):
+        """
+        trace frame and its callers, up to botframe
+        """
+        while frame and frame is not self.botframe:
+            frame.f_trace = self.trace_dispatch
+            frame = frame.f_back
+
+    def may_break(self, code):
+        return self.breakpoints.may_break(code, self.breaks, self.canonic)
+
+    def dispatch_call(self, frame, arg):
+        if (self.continuing and not self.quitting and
+            not self.may_break(frame.f_code)):
+            # frame cannot reach a breakpoint: do not trace it
+            return None
+        return Pdb.dispatch_call(self, frame, arg)
+
+    set_break = update_breakpoints(Pdb.set_break)
+    clear_break = update_breakpoints(Pdb.clear_break)
+    clear_bpbynumber = update_breakpoints(Pdb.clear_bpbynumber)
+    clear_all_file_breaks = update_breakpoints(Pdb.clear_all_file_breaks)
+    clear_all_breaks = update_breakpoints(Pdb.clear_all_breaks)
+
+    def postcmd(self, stop, line):
+        # commands received together, like breakpoints set on a range
+        # of lines, update signs once
+        if not self.from_vim.hasPending():
+            self.showBreakpoints()
+        return Pdb.postcmd(self, stop, line)
+
     def cmdloop(self):
         stop = None
-        self.preloop()
-        while not stop:
-            line = self.from_vim.waitFor(self)
-            line = self.precmd(line)
-            stop = self.onecmd(line)
-            stop = self.postcmd(stop, line)
-        self.postloop()
+        self.active = True
+        try:
+            self.stats.start(stats.STOP)
+            try:
+                self.preloop()
+            finally:
+                self.stats.stop()
+            while not stop:
+                line = self.from_vim.waitFor(self)
+                self.stats.start(stats.command_name(line))
+                try:
+                    line = self.precmd(line)
+                    stop = self.onecmd(line)
+                    stop = self.postcmd(stop, line)
+                finally:
+                    self.stats.stop()
+            self.postloop()
+        finally:
+            self.active = False
+
+    def reset_session(self):
+        """
+        prepare an instance kept by Session for a new set_trace();
+        breakpoints are kept, as pdb keeps them in bdb.Breakpoint.
+        """
+        if 'pdb' in self.__dict__:
+            del self.pdb
+        if 'trace_dispatch' in self.__dict__:
+            del self.trace_dispatch
+        if self.capturing:
+            # capture left by an interrupted command: its output is dropped
+            self.capturing = False
+            if sys.stdout is self.sink:
+                sys.stdout = self.stdout
+            if self.stdout is self.sink:
+                self.stdout = self.initial_stdout
+        self._textOutput = ''
+        self.watch.clear()
+        self.to_vim.forgetLocals()
+        # Vim may have been restarted since
+        self.signs_outdated = True
+        self.list_outdated = True
 
     def preloop(self):
+        self.registerSession()
         self.showFileAtLine()
+        if self.breaks:
+            # hit counts may have changed while running
+            self.list_outdated = True
+        self.showBreakpoints()
+
+    def registerSession(self):
+        # several debugged processes may be paused in VIM:
+        # each registers on each stop, under its process id
+        address = self.from_vim.getAddress()
+        if address is not None:
+            self.to_vim.registerSession(str(os.getpid()), address)
 
     def getFileAndLine(self):
         frame, lineno = self.stack[self.curindex]
@@ -125,55 +394,111 @@ class VimPdb(Pdb, Switcher):
     def showFileAtLine(self):
         filename, lineno = self.getFileAndLine()
         self.to_vim.showFileAtLine(filename, lineno)
-        watches = self.formatLocals()
-        self.to_vim.displayLocals(watches)
+        self.to_vim.updateLocals(self.formatLocals())
+        self.to_vim.preloadFiles(self.stackFiles())
+
+    def stackFiles(self):
+        """
+        files of the stack, innermost first, that Vim may show next
+        on up, down or return
+        """
+        filenames = []
+        for frame, lineno in reversed(self.stack):
+            filename = self.canonic(frame.f_code.co_filename)
+            if filename not in filenames:
+                filenames.append(filename)
+                if len(filenames) == self.PRELOADED_FILES:
+                    break
+        return filenames
+
+    def showBreakpoints(self):
+        if self.signs_outdated:
+            self.signs_outdated = False
+            self.to_vim.showBreakpoints(
+                breakpoints.breakpoint_lines(self.breaks))
+        if self.list_outdated:
+            self.list_outdated = False
+            self.to_vim.showBreakpointList(breakpoints.breakpoint_entries())
 
     def formatLocals(self):
-        stream = StringIO.StringIO()
-        locals = self.curframe.f_locals
-        keys = locals.keys()
-        keys.sort()
-        for key in keys:
-            stream.write('%s = \n' % key)
-            formatted_value = pprint.pformat(locals[key], width=36)
-            for line in formatted_value.splitlines():
-                stream.write('    %s\n' % line)
-        watches = stream.getvalue()
-        stream.close()
-        return watches
+        stack_frames = [frame for frame, lineno in self.stack]
+        started = time.time()
+        lines = self.watch.render(self.curframe, stack_frames)
+        self.stats.rendered(time.time() - started)
+        return lines
+
+    def do_expand(self, name):
+        """
+        'expand' command, sent from the watch window:
+        formats the local 'name' deeper and longer.
+        """
+        name = name.strip()
+        if name:
+            self.watch.expand(self.curframe, name)
+            self.to_vim.updateLocals(self.formatLocals())
 
     # stdout captures to send back to Vim
     def capture_sys_stdout(self):
         self.stdout = sys.stdout
-        sys.stdout = StringIO.StringIO()
+        self.sink = OutputSink(self.to_vim, self.capture_max_size)
+        sys.stdout = self.sink
         self.capturing = True
 
     def stop_capture_sys_stdout(self):
         if self.capturing:
             self.capturing = False
-            self.push_output(sys.stdout.getvalue())
+            self.sink.close()
             sys.stdout = self.stdout
 
     # stdout captures to send back to Vim
     def capture_self_stdout(self):
         self.initial_stdout = self.stdout
-        self.stdout = StringIO.StringIO()
+        self.sink = OutputSink(self.to_vim, self.capture_max_size)
+        self.stdout = self.sink
         self.capturing = True
 
     def stop_capture_self_stdout(self):
         if self.capturing:
             self.capturing = False
-            self.push_output(self.stdout.getvalue())
+            self.sink.close()
             self.stdout = self.initial_stdout
 
     def push_output(self, text):
-        self._textOutput += text
+        if self.capturing:
+            self.sink.write(text)
+        else:
+            self._textOutput += text
 
     def pop_output(self):
         result = self._textOutput
         self._textOutput = ''
         return result
 
+    def do_stats(self, arg):
+        """
+        'stats' command: shows percentiles of the time taken by commands;
+        'stats dump <filename>' writes all records to filename,
+        'stats clear' forgets them.
+        """
+        words = arg.split(None, 1)
+        if not words:
+            feedback = '\n'.join(self.stats.summary())
+        elif words[0] == 'dump' and len(words) == 2:
+            filename = os.path.expanduser(words[1].strip())
+            try:
+                self.stats.dump(filename)
+            except IOError, e:
+                feedback = '*** cannot write %s: %s' % (filename, e)
+            else:
+                feedback = '%d records written to %s' % (
+                    len(self.stats.records), filename)
+        elif words[0] == 'clear':
+            self.stats.clear()
+            feedback = 'records cleared'
+        else:
+            feedback = '*** usage: stats [dump <filename> | clear]'
+        self.to_vim.showFeedback(feedback)
+
     def do_pdb(self, line):
         """
         'pdb' command:
@@ -181,8 +506,13 @@ class VimPdb(Pdb, Switcher):
         except for added 'vim' command.
         """
         self.from_vim.closeSocket()
+        self.to_vim.discardPending()
+        self.to_vim.forgetBreakpoints()
+        self.signs_outdated = True
+        self.list_outdated = True
         self.pdb = get_hooked_pdb()
         self.pdb.set_trace_without_step(self.botframe)
+        self.switch_tracer(self.pdb)
         if self.has_gone_up():
             self.pdb.update_state(self)
             self.pdb.print_current_stack_entry()
@@ -194,9 +524,16 @@ class VimPdb(Pdb, Switcher):
     do_u = do_up = capture(show_line(Pdb.do_up))
     do_d = do_down = capture(show_line(Pdb.do_down))
     do_a = do_args = capture(Pdb.do_args)
+    do_w = do_where = do_bt = capture(Pdb.do_where)
     do_b = do_break = capture(Pdb.do_break)
     do_cl = do_clear = capture(Pdb.do_clear)
-    do_c = do_continue = close_socket(Pdb.do_continue)
+    do_enable = update_breakpoints(capture(Pdb.do_enable))
+    do_disable = update_breakpoints(capture(Pdb.do_disable))
+    do_condition = update_breakpoints(capture(Pdb.do_condition))
+    do_ignore = update_breakpoints(capture(Pdb.do_ignore))
+    do_c = do_continue = discard_updates(forget_locals(
+        close_socket(Pdb.do_continue)))
+    do_q = do_quit = do_exit = discard_updates(forget_signs(Pdb.do_quit))
 
     @capture
     def print_stack_entry(self, frame_lineno, prompt_prefix=pdb.line_prefix):
@@ -213,35 +550,89 @@ else:
     VimPdb.default = capture_sys_stdout(VimPdb.default)
 
 
-def make_instance():
-    configuration = config.get_configuration()
-    communicator = proxy.Communicator(configuration.vim_client_script,
-        configuration.server_name)
-    to_vim = proxy.ProxyToVim(communicator)
-    from_vim = proxy.ProxyFromVim(configuration.port)
-    return VimPdb(to_vim, from_vim)
-
+def make_instance(configuration=None):
+    if configuration is None:
+        configuration = config.get_configuration()
+    communicator = proxy.get_communicator(configuration)
+    recorder = stats.Recorder()
+    detector = config.Detector(configuration,
+        cache=config.get_probe_cache())
+    if configuration.async_send:
+        to_vim = proxy.AsyncProxyToVim(communicator, recorder, detector)
+    else:
+        to_vim = proxy.ProxyToVim(communicator, recorder, detector)
+    from_vim = proxy.get_receiver(configuration)
+    renderer = watch.Renderer(maxdepth=configuration.watch_maxdepth,
+        maxlength=configuration.watch_maxlength,
+        maxbytes=configuration.watch_maxbytes)
+    instance = VimPdb(to_vim, from_vim, renderer, recorder)
+    instance.fast_continue = configuration.continue_mode == config.INDEXED
+    instance.capture_max_size = configuration.capture_max_size
+    return instance
+
+
+class Session(object):
+    """
+    keeps one VimPdb instance, its proxies and its bound socket
+    alive across set_trace() calls in the process
+    """
 
-def set_trace():
+    def __init__(self):
+        self.instance = None
+        self.configuration = None
+
+    def get_instance(self):
+        instance = self.instance
+        if instance is None or instance.active:
+            # nested set_trace() while debugging gets its own instance
+            configuration = config.get_configuration()
+            instance = make_instance(configuration)
+            if self.instance is None:
+                instance.from_vim.persistent = True
+                self.instance = instance
+                self.configuration = configuration
+            return instance
+        detector = config.Detector(self.configuration,
+            cache=config.get_probe_cache())
+        detector.check_serverlist()
+        if detector.launched:
+            instance.to_vim.invalidateRemoteSetup()
+        instance.reset_session()
+        return instance
+
+    def close(self):
+        if self.instance is not None:
+            self.instance.to_vim.flush()
+            self.instance.from_vim.closeSocket()
+        self.instance = None
+        self.configuration = None
+
+
+session = Session()
+
+disable = trigger.disable
+enable = trigger.enable
+
+
+def set_trace(condition=True, hit_count=None, enabled=True):
     """
     can be called like pdb.set_trace()
+
+    Debugging starts only when ``enabled`` and ``condition`` (a value or a
+    callable) are true and, if ``hit_count`` is given, when this call has
+    been reached with a true condition at least ``hit_count`` times.
+    Nothing is done while vimpdb is disabled with ``disable()`` or the
+    VIMPDB_DISABLED environment variable.
     """
-    instance = make_instance()
-    instance.set_trace(sys._getframe().f_back)
+    frame = sys._getframe().f_back
+    if trigger.should_trace(frame, condition, hit_count, enabled):
+        session.get_instance().set_trace(frame)
 
 
 # hook vimpdb  #
 ################
 
 
-def trace_dispatch(self, frame, event, arg):
-    """allow to switch to Vimpdb instance"""
-    if hasattr(self, 'vimpdb'):
-        return self.vimpdb.trace_dispatch(frame, event, arg)
-    else:
-        return self._orig_trace_dispatch(frame, event, arg)
-
-
 class SwitcherToVimpdb(Switcher):
     """
     with vim command
@@ -250,8 +641,9 @@ class SwitcherToVimpdb(Switcher):
     def do_vim(self, arg):
         """v(im)
     switch to debugging with vimpdb"""
-        self.vimpdb = make_instance()
+        self.vimpdb = session.get_instance()
         self.vimpdb.set_trace_without_step(self.botframe)
+        self.switch_tracer(self.vimpdb)
         if self.has_gone_up():
             self.vimpdb.update_state(self)
             self.vimpdb.cmdloop()
@@ -265,15 +657,6 @@ class SwitcherToVimpdb(Switcher):
         self.print_stack_entry(self.stack[self.curindex])
 
 
-def setupMethod(klass, method):
-    name = method.__name__
-    orig = getattr(klass, name)
-    orig_attr = '_orig_' + name
-    if not hasattr(klass, orig_attr):
-        setattr(klass, '_orig_' + name, orig)
-        setattr(klass, name, method)
-
-
 def hook(klass):
     """
     monkey-patch pdb.Pdb class
@@ -283,7 +666,6 @@ def hook(klass):
     """
 
     if not hasattr(klass, 'do_vim'):
-        setupMethod(klass, trace_dispatch)
         klass.__bases__ += (SwitcherToVimpdb, )
 
 
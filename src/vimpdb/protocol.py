@@ -0,0 +1,46 @@
+"""
+framed protocol for commands sent by VIM over a stream socket
+
+Each frame is a 4 bytes big endian length followed by that many bytes:
+one or more commands separated by newlines.
+"""
+import struct
+
+HEADER = '!I'
+HEADER_SIZE = struct.calcsize(HEADER)
+SEPARATOR = '\n'
+
+
+def encode_frame(commands):
+    payload = SEPARATOR.join(commands)
+    return struct.pack(HEADER, len(payload)) + payload
+
+
+class FrameReader(object):
+    """
+    rebuilds commands from the bytes received on a stream
+
+    Bytes are fed as they come; complete frames are split in commands.
+    """
+
+    def __init__(self):
+        self.data = ''
+
+    def feed(self, data):
+        """
+        returns the commands of the frames completed by data
+        """
+        self.data += data
+        commands = []
+        while len(self.data) >= HEADER_SIZE:
+            length = struct.unpack(HEADER, self.data[:HEADER_SIZE])[0]
+            end = HEADER_SIZE + length
+            if len(self.data) < end:
+                break
+            payload = self.data[HEADER_SIZE:end]
+            self.data = self.data[end:]
+            commands.extend(payload.split(SEPARATOR))
+        return commands
+
+    def reset(self):
+        self.data = ''
@@ -1,9 +1,21 @@
 import os
 import socket
 import subprocess
+import tempfile
+import threading
 
+try:
+    import json
+except ImportError:
+    # Python < 2.6: channel transport falls back to clientserver
+    json = None
+
+from vimpdb import breakpoints
 from vimpdb import config
 from vimpdb import errors
+from vimpdb import protocol
+from vimpdb import stats
+from vimpdb import watch
 
 
 def get_eggs_paths():
@@ -48,23 +60,230 @@ class Communicator(object):
             raise errors.RemoteUnavailable()
 
 
+def keys_to_ex(command):
+    """
+    turn keys meant for --remote-send into the equivalent Ex command
+    """
+    for prefix in ('<C-\\><C-N>', ':'):
+        if command.startswith(prefix):
+            command = command[len(prefix):]
+    if command.endswith('<CR>'):
+        command = command[:-len('<CR>')]
+    return command
+
+
+class ChannelCommunicator(Communicator):
+    """
+    keep a single Vim channel (JSON mode) open for the whole session.
+
+    Vim is asked once, through clientserver, to connect back to a socket
+    listening in the debugged process. All later commands and expressions
+    travel through that connection. When the channel cannot be established
+    (no +channel support, no json module), clientserver subprocesses are
+    used as before.
+    """
+
+    CONNECT_TIMEOUT = 2.0
+    BUFLEN = 4096
+
+    socket_factory = socket.socket
+
+    def __init__(self, script, server_name):
+        super(ChannelCommunicator, self).__init__(script, server_name)
+        self.channel = None
+        self.channel_failed = json is None
+        self.incoming = ''
+        self.last_id = 0
+
+    def open_channel(self):
+        listener = self.socket_factory(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            listener.settimeout(self.CONNECT_TIMEOUT)
+            port = listener.getsockname()[1]
+            Communicator._send(self, ":if has('channel') | "
+                "let g:vimpdb_channel = ch_open('127.0.0.1:%d', "
+                "{'mode': 'json'}) | endif<CR>" % port)
+            try:
+                channel, address = listener.accept()
+            except (socket.timeout, socket.error):
+                config.logger.debug("channel: Vim did not connect back")
+                self.channel_failed = True
+                return False
+        finally:
+            listener.close()
+        channel.settimeout(None)
+        channel.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.channel = channel
+        self.incoming = ''
+        return True
+
+    def has_channel(self):
+        if self.channel is not None:
+            return True
+        if self.channel_failed:
+            return False
+        return self.open_channel()
+
+    def drop_channel(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+    def _write(self, *messages):
+        data = ''.join([json.dumps(message) for message in messages])
+        try:
+            self.channel.sendall(data)
+        except socket.error:
+            self.drop_channel()
+            raise errors.RemoteUnavailable()
+
+    def _read(self, expected_id):
+        decoder = json.JSONDecoder()
+        while True:
+            self.incoming = self.incoming.lstrip()
+            if self.incoming:
+                try:
+                    message, end = decoder.raw_decode(self.incoming)
+                except ValueError:
+                    # incomplete message
+                    pass
+                else:
+                    self.incoming = self.incoming[end:]
+                    if message[0] == expected_id:
+                        return message[1]
+                    continue
+            try:
+                data = self.channel.recv(self.BUFLEN)
+            except socket.error:
+                data = ''
+            if not data:
+                self.drop_channel()
+                raise errors.RemoteUnavailable()
+            self.incoming += data
+
+    def _remote_expr(self, expr):
+        if not self.has_channel():
+            return super(ChannelCommunicator, self)._remote_expr(expr)
+        # Vim answers with the (negative) id of the request
+        self.last_id -= 1
+        self._write(['expr', expr, self.last_id])
+        result = self._read(self.last_id)
+        if isinstance(result, unicode):
+            result = result.encode('utf-8')
+        return str(result).strip()
+
+    def _send(self, command):
+        if not self.has_channel():
+            return super(ChannelCommunicator, self)._send(command)
+        self._write(['ex', keys_to_ex(command)], ['redraw', ''])
+
+
+def get_communicator(configuration):
+    if configuration.transport == config.CHANNEL:
+        klass = ChannelCommunicator
+    else:
+        klass = Communicator
+    return klass(configuration.vim_client_script, configuration.server_name)
+
+
+# states of vimpdb.vim setup in Vim server, as known by ProxyToVim
+REMOTE_UNKNOWN = 'unknown'
+REMOTE_READY = 'ready'
+
+
+def split_lines(lines, max_length):
+    """
+    split lines in chunks whose repr fits in max_length characters
+    """
+    chunks = []
+    chunk = []
+    length = 2
+    for line in lines:
+        line_length = len(repr(line)) + 2
+        if chunk and length + line_length > max_length:
+            chunks.append(chunk)
+            chunk = []
+            length = 2
+        chunk.append(line)
+        length += line_length
+    chunks.append(chunk)
+    return chunks
+
+
 class ProxyToVim(object):
     """
     use subprocess to launch Vim instance that use clientserver mode
     to communicate with Vim instance used for debugging.
     """
 
-    def __init__(self, communicator):
+    # keep commands well below command-line length limits
+    MAX_COMMAND_LENGTH = 16000
+
+    def __init__(self, communicator, recorder=None, detector=None):
         self.communicator = communicator
+        if recorder is None:
+            recorder = stats.Recorder()
+        self.stats = recorder
+        # checks the VIM server again, launching it if needed,
+        # after it stopped answering
+        self.detector = detector
+        self.server_lost = False
+        self.remote_state = REMOTE_UNKNOWN
+        self.avoided_setup_probes = 0
+        # lines of the watch window as last sent to Vim
+        self.watch_lines = None
+        # breakpoint lines, by file, and breakpoint entries, by number,
+        # as last sent to Vim
+        self.breakpoint_lines = dict()
+        self.breakpoint_entries = dict()
+        # files Vim was asked to preload
+        self.preload_files = None
+        # name of the session registered in Vim, if any
+        self.session = None
 
     def _send(self, command):
-        self.communicator._send(command)
+        self.stats.round_trip(len(command))
+        try:
+            self.communicator._send(command)
+        except errors.RemoteUnavailable:
+            self.serverLost()
+            raise
         config.logger.debug("sent: %s" % command)
 
     def _remote_expr(self, expr):
-        return self.communicator._remote_expr(expr)
+        self.stats.round_trip(len(expr))
+        try:
+            return self.communicator._remote_expr(expr)
+        except errors.RemoteUnavailable:
+            self.serverLost()
+            raise
+
+    def invalidateRemoteSetup(self):
+        """
+        next setupRemote checks again if vimpdb.vim is loaded in Vim;
+        needed after a transport error or a restart of the Vim server.
+        """
+        self.remote_state = REMOTE_UNKNOWN
+
+    def serverLost(self):
+        """
+        VIM server did not answer: the probe cache no longer vouches for
+        it and next setupRemote checks the server list again.
+        """
+        self.invalidateRemoteSetup()
+        if self.detector is not None:
+            self.detector.forget_server()
+            self.server_lost = True
 
     def setupRemote(self):
+        if self.remote_state == REMOTE_READY:
+            self.avoided_setup_probes += 1
+            return
+        if self.server_lost:
+            self.server_lost = False
+            self.detector.check_serverlist()
         if not self.isRemoteSetup():
             # source vimpdb.vim
             proxy_package_path = config.get_package_path(self)
@@ -74,26 +293,123 @@ class ProxyToVim(object):
             for egg_path in get_eggs_paths():
                 self._send(':call PDB_setup_egg(%s)<CR>' % repr(egg_path))
             self._send(':call PDB_init_controller()')
+            # a new Vim has no breakpoint signs nor list; forgotten now,
+            # before the pending updates compare with them
+            ProxyToVim.forgetBreakpoints(self)
+            self.preload_files = None
+        self.remote_state = REMOTE_READY
 
     def isRemoteSetup(self):
         status = self._expr("exists('*PDB_setup_egg')")
         return status == '1'
 
+    def registerSession(self, session, address):
+        """
+        tell VIM that session is paused and where to send it commands
+        """
+        self.session = session
+        self.setupRemote()
+        self._send(':call PDB_register_session(%s, %s)<CR>'
+            % (repr(session), repr(address)))
+
+    def sessionArg(self):
+        """
+        last argument of calls to Vim functions, naming the session
+        """
+        if self.session is None:
+            return ''
+        return ', %s' % repr(self.session)
+
     def showFeedback(self, feedback):
         if not feedback:
             return
         feedback_list = feedback.splitlines()
         self.setupRemote()
-        self._send(':call PDB_show_feedback(%s)<CR>' % repr(feedback_list))
+        self._send(':call PDB_show_feedback(%s%s)<CR>'
+            % (repr(feedback_list), self.sessionArg()))
 
-    def displayLocals(self, feedback):
+    def appendFeedback(self, feedback):
         if not feedback:
             return
         feedback_list = feedback.splitlines()
         self.setupRemote()
-        self._send(':call PDB_reset_watch()<CR>')
-        for line in feedback_list:
-            self._send(':call PDB_append_watch([%s])<CR>' % repr(line))
+        self._send(':call PDB_append_feedback(%s%s)<CR>'
+            % (repr(feedback_list), self.sessionArg()))
+
+    def displayLocals(self, feedback):
+        if not feedback:
+            return
+        self.setupRemote()
+        self._writeLocals(feedback.splitlines())
+
+    def updateLocals(self, lines):
+        """
+        bring the watch window to lines;
+        only changed line ranges are sent when possible.
+        """
+        old_lines = self.watch_lines
+        if old_lines == lines or (not old_lines and not lines):
+            return
+        self.setupRemote()
+        if old_lines:
+            ops = watch.diff_lines(old_lines, lines)
+            expr = 'PDB_patch_watch(%d, %s%s)' % (len(old_lines), repr(ops),
+                self.sessionArg())
+            # Vim answers '0' when its watch window is not in sync
+            if (len(expr) <= self.MAX_COMMAND_LENGTH and
+                self._expr(expr) == '1'):
+                self.watch_lines = lines
+                return
+        self._writeLocals(lines)
+
+    def forgetLocals(self):
+        self.watch_lines = None
+
+    def showBreakpoints(self, lines):
+        """
+        bring breakpoint signs to lines (see breakpoints.breakpoint_lines);
+        only the changes of each file are sent.
+        """
+        if lines == self.breakpoint_lines:
+            return
+        self.setupRemote()
+        changes = breakpoints.lines_delta(self.breakpoint_lines, lines)
+        for change in changes:
+            # Windows compatibility, as in _showFileAtLine
+            change[0] = change[0].replace('\\', '/')
+        for chunk in split_lines(changes, self.MAX_COMMAND_LENGTH):
+            self._send(':call PDB_update_signs(%s%s)<CR>'
+                % (repr(chunk), self.sessionArg()))
+        self.breakpoint_lines = lines
+
+    def showBreakpointList(self, entries):
+        """
+        bring the breakpoint list to entries (see
+        breakpoints.breakpoint_entries); only changed entries are sent.
+        """
+        if entries == self.breakpoint_entries:
+            return
+        self.setupRemote()
+        changed, removed = breakpoints.entries_delta(self.breakpoint_entries,
+            entries)
+        for chunk in split_lines(changed, self.MAX_COMMAND_LENGTH):
+            self._send(':call PDB_update_breakpoints(%s, %s%s)<CR>'
+                % (repr(chunk), repr(removed), self.sessionArg()))
+            removed = []
+        self.breakpoint_entries = entries
+
+    def forgetBreakpoints(self):
+        self.breakpoint_lines = dict()
+        self.breakpoint_entries = dict()
+
+    def _writeLocals(self, feedback_list):
+        # first chunk replaces the watch buffer, next ones are appended
+        function = 'PDB_write_watch'
+        for chunk in split_lines(feedback_list, self.MAX_COMMAND_LENGTH):
+            self._send(':call %s(%s%s)<CR>'
+                % (function, repr(chunk), self.sessionArg()))
+            function = 'PDB_append_watch'
+        self.watch_lines = feedback_list
 
     def showFileAtLine(self, filename, lineno):
         if os.path.exists(filename):
@@ -105,8 +421,33 @@ class ProxyToVim(object):
         # So turn backslash to slash; Vim knows how to translate them back.
         filename = filename.replace('\\', '/')
         self.setupRemote()
-        self._send(':call PDB_show_file_at_line("%s", "%d")<CR>'
-            % (filename, lineno))
+        self._send(':call PDB_show_file_at_line("%s", "%d"%s)<CR>'
+            % (filename, lineno, self.sessionArg()))
+
+    def preloadFiles(self, filenames):
+        """
+        tell Vim which files it may show next (files of the stack),
+        to load them in advance; sent when they change
+        """
+        if filenames == self.preload_files:
+            return
+        self.preload_files = filenames
+        existing = [filename.replace('\\', '/') for filename in filenames
+            if os.path.exists(filename)]
+        if not existing:
+            return
+        self.setupRemote()
+        self._send(':call PDB_preload_files(%s)<CR>' % repr(existing))
+
+    def flush(self):
+        """
+        wait until updates are sent to Vim
+        """
+
+    def discardPending(self):
+        """
+        drop updates not sent to Vim yet
+        """
 
     def _expr(self, expr):
         config.logger.debug("expr: %s" % expr)
@@ -121,6 +462,130 @@ class ProxyToVim(object):
     #     return command
 
 
+class AsyncProxyToVim(ProxyToVim):
+    """
+    sends updates to Vim from a background thread,
+    so that the debugged process does not wait for Vim
+
+    A pending update of the file shown or of the watch window is replaced
+    by a newer one of the same kind; other updates, like feedback,
+    are sent in order.
+    """
+
+    COALESCED = ('file', 'watch', 'signs', 'breakpoints', 'preload')
+
+    # kept by discardPending: Vim keeps breakpoint signs and list
+    # after c(ontinue)
+    KEPT = ('signs', 'breakpoints')
+
+    def __init__(self, communicator, recorder=None, detector=None):
+        ProxyToVim.__init__(self, communicator, recorder, detector)
+        self.pid = None
+        self.coalesced = 0
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        # first update, or first one in a forked process:
+        # threads of the parent process are gone
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.pending = []
+        self.busy = False
+        worker = threading.Thread(target=self.run)
+        worker.setDaemon(True)
+        worker.start()
+
+    def post(self, kind, method, *args):
+        self.start()
+        self.condition.acquire()
+        try:
+            if kind in self.COALESCED:
+                for job in self.pending:
+                    if job[0] == kind:
+                        self.pending.remove(job)
+                        self.coalesced += 1
+                        break
+            self.pending.append((kind, method, args))
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def run(self):
+        while True:
+            self.condition.acquire()
+            try:
+                while not self.pending:
+                    self.condition.wait()
+                kind, method, args = self.pending.pop(0)
+                self.busy = True
+            finally:
+                self.condition.release()
+            try:
+                try:
+                    method(self, *args)
+                except Exception:
+                    config.logger.exception("%s update failed" % kind)
+            finally:
+                self.condition.acquire()
+                self.busy = False
+                self.condition.notifyAll()
+                self.condition.release()
+
+    def flush(self):
+        if self.pid != os.getpid():
+            return
+        self.condition.acquire()
+        try:
+            while self.pending or self.busy:
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def discardPending(self):
+        if self.pid != os.getpid():
+            return
+        self.condition.acquire()
+        try:
+            self.pending = [job for job in self.pending
+                if job[0] in self.KEPT]
+        finally:
+            self.condition.release()
+
+    def registerSession(self, session, address):
+        self.post('session', ProxyToVim.registerSession, session, address)
+
+    def showFeedback(self, feedback):
+        self.post('feedback', ProxyToVim.showFeedback, feedback)
+
+    def appendFeedback(self, feedback):
+        self.post('feedback', ProxyToVim.appendFeedback, feedback)
+
+    def displayLocals(self, feedback):
+        self.post('watch', ProxyToVim.displayLocals, feedback)
+
+    def updateLocals(self, lines):
+        self.post('watch', ProxyToVim.updateLocals, lines)
+
+    def forgetLocals(self):
+        self.post('forget', ProxyToVim.forgetLocals)
+
+    def showFileAtLine(self, filename, lineno):
+        self.post('file', ProxyToVim.showFileAtLine, filename, lineno)
+
+    def showBreakpoints(self, lines):
+        self.post('signs', ProxyToVim.showBreakpoints, lines)
+
+    def showBreakpointList(self, entries):
+        self.post('breakpoints', ProxyToVim.showBreakpointList, entries)
+
+    def preloadFiles(self, filenames):
+        self.post('preload', ProxyToVim.preloadFiles, filenames)
+
+    def forgetBreakpoints(self):
+        self.post('forget', ProxyToVim.forgetBreakpoints)
+
+
 class ProxyFromVim(object):
 
     BUFLEN = 512
@@ -130,6 +595,11 @@ class ProxyFromVim(object):
     def __init__(self, port):
         self.socket_inactive = True
         self.port = port
+        # keep the socket bound between debugging sessions
+        self.persistent = False
+        self.stale = False
+        # bound to an address of its own, not shared with other processes
+        self.private = False
 
     def bindSocket(self):
         if self.socket_inactive:
@@ -144,6 +614,30 @@ class ProxyFromVim(object):
             self.socket.close()
             self.socket_inactive = True
 
+    def releaseSocket(self):
+        """
+        end of debugging session:
+        persistent sockets with a private address stay bound, others are
+        closed; kept bound on the shared port, a socket would receive the
+        commands meant for the processes that bind it next
+        """
+        if self.persistent and self.private:
+            self.stale = not self.socket_inactive
+        else:
+            self.closeSocket()
+
+    def getAddress(self):
+        """
+        address to announce to VIM; None when VIM knows it from .vimpdbrc
+        """
+        return None
+
+    def hasPending(self):
+        """
+        tells if commands already received wait to be handed out
+        """
+        return False
+
     def waitFor(self, pdb):
         self.bindSocket()
         (message, address) = self.socket.recvfrom(self.BUFLEN)
@@ -151,6 +645,171 @@ class ProxyFromVim(object):
         return message
 
 
+class StreamProxyFromVim(ProxyFromVim):
+    """
+    receives framed commands from VIM through a TCP connection
+
+    A frame may hold several commands; they are handed out one at a time.
+    """
+
+    BUFLEN = 4096
+
+    host = '127.0.0.1'
+
+    def __init__(self, port):
+        ProxyFromVim.__init__(self, port)
+        self.connection = None
+        self.reader = protocol.FrameReader()
+        self.pending = []
+
+    def bindSocket(self):
+        if self.socket_inactive:
+            self.socket = self.socket_factory(
+                socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                self.socket.bind((self.host, self.port))
+                self.private = False
+            except socket.error:
+                # port taken by another debugged process:
+                # VIM learns the port chosen by the system from getAddress
+                self.socket.bind((self.host, 0))
+                self.private = True
+            self.socket.listen(1)
+            self.socket_inactive = False
+
+    def closeConnection(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.reader.reset()
+
+    def closeSocket(self):
+        self.closeConnection()
+        self.pending = []
+        ProxyFromVim.closeSocket(self)
+
+    def discardStaleMessages(self):
+        """
+        drop commands and connections received by a persistent socket
+        while no debugging session was active
+        """
+        self.closeConnection()
+        self.pending = []
+        self.socket.setblocking(0)
+        try:
+            while True:
+                try:
+                    connection, address = self.socket.accept()
+                except socket.error:
+                    break
+                connection.close()
+        finally:
+            self.socket.setblocking(1)
+        self.stale = False
+
+    def getAddress(self):
+        self.bindSocket()
+        return '%s:%d' % self.socket.getsockname()
+
+    def hasPending(self):
+        return bool(self.pending)
+
+    def receiveCommands(self):
+        while not self.pending:
+            if self.connection is None:
+                self.connection, address = self.socket.accept()
+            data = self.connection.recv(self.BUFLEN)
+            if not data:
+                # VIM closed the connection, it will open a new one
+                self.closeConnection()
+                continue
+            self.pending.extend(self.reader.feed(data))
+
+    def waitFor(self, pdb):
+        self.bindSocket()
+        if self.stale:
+            self.discardStaleMessages()
+        self.receiveCommands()
+        message = self.pending.pop(0)
+        config.logger.debug("command: %s" % message)
+        return message
+
+
+class UnixProxyFromVim(StreamProxyFromVim):
+    """
+    receives framed commands from VIM through a Unix domain socket
+    named after the process id
+
+    VIM learns the socket path from getAddress, or finds it
+    among the sockets of debugged processes.
+    """
+
+    def __init__(self, port):
+        StreamProxyFromVim.__init__(self, port)
+        self.pid = None
+        self.path = None
+        # one socket per process
+        self.private = True
+
+    def bindSocket(self):
+        if self.pid != os.getpid():
+            # new process, or forked one: sockets inherited from the parent
+            # process belong to it
+            if not self.socket_inactive:
+                self.socket.close()
+                self.socket_inactive = True
+            self.connection = None
+            self.reader.reset()
+            self.pending = []
+            self.pid = os.getpid()
+            self.path = config.socket_path(self.pid)
+        if self.socket_inactive:
+            directory = os.path.dirname(self.path)
+            if not os.path.lexists(directory):
+                os.makedirs(directory, 0700)
+            if not config.is_private_directory(directory):
+                # others could replace or read the socket: VIM learns
+                # the path of a socket bound elsewhere from getAddress
+                config.logger.warning("%s is not a private directory"
+                    % directory)
+                directory = tempfile.mkdtemp(prefix='vimpdb-')
+                self.path = os.path.join(directory, '%d.sock' % self.pid)
+            if os.path.exists(self.path):
+                # left over by a dead process with the same pid
+                os.remove(self.path)
+            self.socket = self.socket_factory(
+                socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.bind(self.path)
+            self.socket.listen(1)
+            self.socket_inactive = False
+
+    def closeSocket(self):
+        active = not self.socket_inactive
+        StreamProxyFromVim.closeSocket(self)
+        if active and os.path.exists(self.path):
+            os.remove(self.path)
+        if active and self.path != config.socket_path(self.pid):
+            # directory made in place of a socket directory not private
+            os.rmdir(os.path.dirname(self.path))
+            self.path = config.socket_path(self.pid)
+
+    def getAddress(self):
+        # bind first so that VIM can connect as soon as it knows the address
+        self.bindSocket()
+        return self.path
+
+
+def get_receiver(configuration):
+    if configuration.command_protocol == config.TCP:
+        klass = StreamProxyFromVim
+    elif configuration.command_protocol == config.UNIX:
+        klass = UnixProxyFromVim
+    else:
+        klass = ProxyFromVim
+    return klass(configuration.port)
+
+
 # code leftover from hacking
 # def eat_stdin(self):
 #     sys.stdout.write('-- Type Ctrl-D to continue --\n')
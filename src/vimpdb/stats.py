@@ -0,0 +1,133 @@
+"""
+timing of debugger commands, to find out what makes a step slow
+
+For each command, the recorder keeps its wall time, the number of
+round-trips to Vim, the bytes sent to Vim and the time spent rendering
+the watch window.
+"""
+import time
+
+FIELDS = ('command', 'wall', 'round_trips', 'bytes', 'render')
+
+# name of the record for the display of a stop (file, locals)
+STOP = '(stop)'
+
+# metrics shown by summary: field, label, factor
+METRICS = (
+    ('wall', 'wall ms', 1000),
+    ('round_trips', 'round-trips', 1),
+    ('bytes', 'bytes sent', 1),
+    ('render', 'render ms', 1000),
+    )
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """
+    nearest-rank percentile of sorted values
+    """
+    if not values:
+        return 0
+    rank = (len(values) * percent + 99) // 100
+    return values[max(rank, 1) - 1]
+
+
+def command_name(line):
+    """
+    first word of a command line; '!' for Python statements
+    """
+    line = line.strip()
+    if line.startswith('!'):
+        return '!'
+    words = line.split()
+    if not words:
+        return '(empty)'
+    return words[0]
+
+
+class Recorder(object):
+    """
+    records of the last MAX_RECORDS commands
+
+    Round-trips and bytes may be counted from the thread sending
+    updates to Vim: they go to the command running at that time.
+    """
+
+    MAX_RECORDS = 10000
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.records = []
+        self.current = None
+
+    def start(self, name):
+        self.current = dict(command=name, wall=0.0, round_trips=0, bytes=0,
+            render=0.0, started=self.clock())
+
+    def stop(self):
+        current = self.current
+        if current is None:
+            return
+        self.current = None
+        current['wall'] = self.clock() - current.pop('started')
+        self.records.append(current)
+        if len(self.records) > self.MAX_RECORDS:
+            del self.records[:-self.MAX_RECORDS]
+
+    def round_trip(self, size):
+        current = self.current
+        if current is not None:
+            current['round_trips'] += 1
+            current['bytes'] += size
+
+    def rendered(self, seconds):
+        current = self.current
+        if current is not None:
+            current['render'] += seconds
+
+    def clear(self):
+        self.records = []
+
+    def summary(self):
+        """
+        lines showing percentiles of each metric, by command
+        """
+        if not self.records:
+            return ['no command recorded']
+        by_command = dict()
+        for record in self.records:
+            by_command.setdefault(record['command'], []).append(record)
+        header = '%-10s %6s  %-12s' % ('command', 'count', 'metric')
+        for percent in PERCENTILES:
+            header += ' %9s' % ('p%d' % percent)
+        header += ' %9s' % 'max'
+        lines = [header]
+        names = by_command.keys()
+        names.sort()
+        for name in names:
+            records = by_command[name]
+            prefix = '%-10s %6d' % (name, len(records))
+            for field, label, factor in METRICS:
+                values = [record[field] * factor for record in records]
+                values.sort()
+                line = '%s  %-12s' % (prefix, label)
+                for percent in PERCENTILES:
+                    line += ' %9.1f' % percentile(values, percent)
+                line += ' %9.1f' % values[-1]
+                lines.append(line)
+                prefix = ' ' * len(prefix)
+        return lines
+
+    def dump(self, filename):
+        """
+        write records to filename, one tab separated line per command
+        """
+        output = open(filename, 'w')
+        try:
+            output.write('\t'.join(FIELDS) + '\n')
+            for record in self.records:
+                output.write('\t'.join([str(record[field])
+                    for field in FIELDS]) + '\n')
+        finally:
+            output.close()
@@ -0,0 +1,278 @@
+"""
+stand-ins for VIM, for tests and benchmarks
+
+FakeVim provides the parts of the vim module used by the controller.
+FakeServer replaces the communicator of ProxyToVim: it interprets the
+commands sent by vimpdb with the controller running on a FakeVim, as
+the VIM server would with vimpdb.vim.
+"""
+import re
+import sys
+
+
+class FakeBuffer(list):
+
+    def __init__(self, name, number):
+        list.__init__(self, [''])
+        self.name = name
+        self.number = number
+
+    def append(self, lines):
+        # as vim buffers: append one line or a list of lines
+        if isinstance(lines, list):
+            self.extend(lines)
+        else:
+            list.append(self, lines)
+
+    def __setslice__(self, start, end, lines):
+        # as vim buffers: None deletes lines, a buffer is never empty
+        if lines is None:
+            lines = []
+        list.__setslice__(self, start, end, lines)
+        if not self:
+            list.append(self, '')
+
+
+class FakeWindow(object):
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.cursor = (1, 0)
+
+
+class FakeCurrent(object):
+
+    def __init__(self):
+        self.buffer = None
+        self.window = None
+
+
+NEW_WINDOW = re.compile(r'silent rightbelow \d+v?new (\S+)$')
+CLOSE_WINDOW = re.compile(r'silent! (\d+)close$')
+SHOW_BUFFER = re.compile(r'buffer (\d+)$')
+WIPEOUT = re.compile(r'silent! bwipeout (\S+)$')
+SIGN_PLACE = re.compile(r'sign place (\d+) line=(\d+) name=(\w+) file=(.+)$')
+SIGN_UNPLACE = re.compile(r'sign unplace (\d+) file=(.+)$')
+CALL = re.compile(r'(\w+)\((\d+)\)$')
+LOADED = re.compile(r"bufloaded\('(.*)'\)$")
+
+
+class FakeVim(object):
+    """
+    the parts of the vim module used by the controller
+
+    Window commands of the controller are applied to buffers and windows.
+    """
+
+    def __init__(self, window_ids=True):
+        self.buffers = []
+        self.windows = []
+        self.commands = []
+        self.evaluated = []
+        self.window_ids = window_ids
+        self.current = FakeCurrent()
+        # {(filename, id): (line, name)} of signs placed
+        self.signs = dict()
+
+    def add_buffer(self, name, shown=True):
+        buffer = FakeBuffer(name, len(self.buffers) + 1)
+        self.buffers.append(buffer)
+        if shown:
+            self.show(buffer)
+        if self.current.buffer is None:
+            self.current.buffer = buffer
+        return buffer
+
+    def show(self, buffer):
+        window = FakeWindow(buffer)
+        self.windows.append(window)
+        self.current.window = window
+        self.current.buffer = buffer
+
+    def command(self, command):
+        self.commands.append(command)
+        match = NEW_WINDOW.match(command)
+        if match:
+            self.add_buffer(match.group(1))
+            return
+        match = CLOSE_WINDOW.match(command)
+        if match:
+            del self.windows[int(match.group(1)) - 1]
+            return
+        match = SHOW_BUFFER.match(command)
+        if match:
+            self.show(self.find_buffer(int(match.group(1))))
+            return
+        match = SIGN_PLACE.match(command)
+        if match:
+            number, line, name, filename = match.groups()
+            filename = filename.replace('\\ ', ' ')
+            self.signs[(filename, int(number))] = (int(line), name)
+            return
+        match = SIGN_UNPLACE.match(command)
+        if match:
+            number, filename = match.groups()
+            filename = filename.replace('\\ ', ' ')
+            del self.signs[(filename, int(number))]
+            return
+        match = WIPEOUT.match(command)
+        if match:
+            name = match.group(1)
+            for buffer in list(self.buffers):
+                if buffer.name == name:
+                    self.windows = [window for window in self.windows
+                        if window.buffer is not buffer]
+                    self.buffers.remove(buffer)
+
+    def find_buffer(self, number):
+        for index in range(len(self.buffers)):
+            if self.buffers[index].number == number:
+                return self.buffers[index]
+        return None
+
+    def eval(self, expr):
+        self.evaluated.append(expr)
+        if expr == "exists('*win_gotoid')":
+            return str(int(self.window_ids))
+        if expr == 'win_getid()':
+            return '1000'
+        if expr == "has('signs')":
+            return '1'
+        match = LOADED.match(expr)
+        if match:
+            name = match.group(1).replace("''", "'")
+            for index in range(len(self.buffers)):
+                if self.buffers[index].name == name:
+                    return '1'
+            return '0'
+        match = CALL.match(expr)
+        function, number = match.group(1), int(match.group(2))
+        if function == 'bufexists':
+            return str(int(self.find_buffer(number) is not None))
+        if function == 'bufwinnr':
+            for index, window in enumerate(self.windows):
+                if window.buffer.number == number:
+                    return str(index + 1)
+            return '-1'
+        raise ValueError(expr)
+
+
+def import_controller(vim):
+    """
+    controller module, running on vim
+    """
+    # vim module only exists inside VIM
+    sys.modules.setdefault('vim', vim)
+    from vimpdb import controller
+    controller.vim = vim
+    return controller
+
+
+def start_controller(vim, configuration):
+    """
+    controller module, running on vim with configuration
+    instead of the one read from ~/.vimpdbrc
+    """
+    from vimpdb import config
+    module = import_controller(vim)
+    getRawConfiguration = config.getRawConfiguration
+    config.getRawConfiguration = lambda: configuration
+    try:
+        module.controller = module.Controller()
+    finally:
+        config.getRawConfiguration = getRawConfiguration
+    return module
+
+
+COMMAND = re.compile(r'(?:<C-\\><C-N>)?:(\w+) (.*?)(?:<CR>)?$')
+FUNCTION = re.compile(r'(\w+)\((.*)\)$')
+
+# vimpdb.vim functions called by vimpdb with a message, and what they
+# call in the controller; the session is their optional last argument
+MESSAGE_FUNCTIONS = {
+    'PDB_show_feedback': '_PDB_buffer_write',
+    'PDB_append_feedback': '_PDB_buffer_append',
+    'PDB_write_watch': '_PDB_watch_write',
+    'PDB_append_watch': '_PDB_watch_append',
+    }
+
+
+class FakeServer(object):
+    """
+    stands for the VIM server, for ProxyToVim
+
+    Keeps the number of commands and expressions received,
+    the location last shown and the files last asked to preload.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.sourced = False
+        self.sent = 0
+        self.evaluated = 0
+        self.location = None
+        self.preloaded = []
+
+    def _send(self, command):
+        self.sent += 1
+        match = COMMAND.match(command)
+        if match is None:
+            raise ValueError(command)
+        ex, argument = match.groups()
+        if ex == 'source':
+            self.sourced = True
+        elif ex == 'call':
+            self.call(argument)
+        else:
+            raise ValueError(command)
+
+    def _remote_expr(self, expr):
+        self.evaluated += 1
+        if expr == "exists('*PDB_setup_egg')":
+            return str(int(self.sourced))
+        result = self.call(expr)
+        # as vim_bridge
+        if isinstance(result, bool):
+            return str(int(result))
+        return ''
+
+    def call(self, text):
+        match = FUNCTION.match(text)
+        if match is None:
+            raise ValueError(text)
+        function = match.group(1)
+        args = eval('[%s]' % match.group(2), {'__builtins__': {}})
+        if function in ('PDB_setup_egg', 'PDB_init_controller'):
+            return None
+        if function == 'PDB_preload_files':
+            self.preloaded = args[0]
+            return None
+        if function == 'PDB_update_signs':
+            changes = args[0]
+            session = (args[1:] or [''])[0]
+            return self.controller._PDB_update_signs(changes, session)
+        if function == 'PDB_update_breakpoints':
+            changed, removed = args[:2]
+            session = (args[2:] or [''])[0]
+            return self.controller._PDB_update_breakpoints(changed, removed,
+                session)
+        if function == 'PDB_register_session':
+            return self.controller._PDB_register_session(*args)
+        if function == 'PDB_show_file_at_line':
+            filename, line = args[:2]
+            session = (args[2:] or [''])[0]
+            if self.controller._PDB_session_stopped(session, filename, line):
+                self.location = (filename, int(line))
+            return None
+        if function == 'PDB_patch_watch':
+            length, ops = args[:2]
+            session = (args[2:] or [''])[0]
+            return self.controller._PDB_watch_patch(length, ops, session)
+        if function == 'PDB_reset_watch':
+            return self.controller._PDB_watch_reset((args or [''])[0])
+        if function in MESSAGE_FUNCTIONS:
+            message = args[0]
+            session = (args[1:] or [''])[0]
+            bridged = getattr(self.controller, MESSAGE_FUNCTIONS[function])
+            return bridged(message, session)
+        raise ValueError(text)
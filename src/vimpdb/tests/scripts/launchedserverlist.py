@@ -0,0 +1,5 @@
+import os
+if os.path.exists(os.environ['VIMPDB_TEST_MARKER']):
+    print "VIM"
+else:
+    print
@@ -0,0 +1,11 @@
+import os
+import re
+import socket
+import sys
+
+# register the server, then notify vimpdb as VIM does with '-c' command
+open(os.environ['VIMPDB_TEST_MARKER'], 'w').close()
+command = sys.argv[sys.argv.index('-c') + 1]
+port = int(re.search(r'(\d+)\)\)$', command).group(1))
+socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto("ready",
+    ("127.0.0.1", port))
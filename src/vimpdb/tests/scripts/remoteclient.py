@@ -0,0 +1,14 @@
+import optparse
+import sys
+parser = optparse.OptionParser()
+parser.add_option('--servername', dest="server_name")
+parser.add_option('--remote-expr', dest="expr")
+parser.add_option('--remote-send', dest="command")
+
+
+parser.parse_args(sys.argv)
+
+# as a VIM client talking to a VIM server where vimpdb.vim is loaded:
+# expressions asked by vimpdb are true
+if parser.values.expr is not None:
+    print 1
@@ -0,0 +1,131 @@
+def sample():
+    first = 1
+    second = 2
+    return first + second
+
+
+def test_last_line():
+    from vimpdb.breakpoints import last_line
+
+    code = sample.func_code
+
+    assert last_line(code) == code.co_firstlineno + 3
+
+
+def test_has_enabled_breakpoint():
+    from bdb import Breakpoint
+    from vimpdb.breakpoints import has_enabled_breakpoint
+
+    breakpoint = Breakpoint('/tmp/hasenabled.py', 12)
+    try:
+        breaks = {'/tmp/hasenabled.py': [12]}
+
+        assert has_enabled_breakpoint(breaks)
+
+        breakpoint.enabled = False
+
+        assert not has_enabled_breakpoint(breaks)
+        assert not has_enabled_breakpoint(dict())
+    finally:
+        breakpoint.deleteMe()
+
+
+def test_index_may_break():
+    from vimpdb.breakpoints import BreakpointIndex
+
+    code = sample.func_code
+    filename = code.co_filename
+    first = code.co_firstlineno
+    canonic = lambda filename: filename
+    index = BreakpointIndex()
+
+    assert not index.may_break(code, {filename: [first - 1]}, canonic)
+    index.invalidate()
+    assert index.may_break(code, {filename: [first + 2]}, canonic)
+    index.invalidate()
+    assert not index.may_break(code, {'other.py': [first + 2]}, canonic)
+
+
+def test_index_cached():
+    from vimpdb.breakpoints import BreakpointIndex
+
+    code = sample.func_code
+    canonic = lambda filename: filename
+    index = BreakpointIndex()
+
+    assert not index.may_break(code, dict(), canonic)
+    # stale until invalidated
+    breaks = {code.co_filename: [code.co_firstlineno + 1]}
+    assert not index.may_break(code, breaks, canonic)
+    index.invalidate()
+    assert index.may_break(code, breaks, canonic)
+
+
+def test_breakpoint_lines():
+    from bdb import Breakpoint
+    from vimpdb.breakpoints import breakpoint_lines
+
+    first = Breakpoint('/tmp/lines.py', 3)
+    second = Breakpoint('/tmp/lines.py', 5)
+    third = Breakpoint('/tmp/lines.py', 5)
+    try:
+        first.enabled = False
+        second.enabled = False
+        breaks = {'/tmp/lines.py': [3, 5]}
+
+        assert breakpoint_lines(breaks) == {'/tmp/lines.py': {3: False,
+            5: True}}
+    finally:
+        first.deleteMe()
+        second.deleteMe()
+        third.deleteMe()
+
+
+def test_lines_delta():
+    from vimpdb.breakpoints import lines_delta
+
+    old = {'/tmp/a.py': {3: True, 5: True}, '/tmp/b.py': {1: True},
+        '/tmp/c.py': {2: True}}
+    new = {'/tmp/a.py': {3: True, 5: False, 7: True}, '/tmp/b.py': {1: True},
+        '/tmp/d.py': {4: True}}
+
+    assert lines_delta(old, new) == [
+        ['/tmp/a.py', [[5, 0], [7, 1]], []],
+        ['/tmp/c.py', [], [2]],
+        ['/tmp/d.py', [[4, 1]], []]]
+    assert lines_delta(new, new) == []
+
+
+def test_breakpoint_entries():
+    from bdb import Breakpoint
+    from vimpdb.breakpoints import breakpoint_entries
+
+    first = Breakpoint('/tmp/entries.py', 3, temporary=1, cond='x > 1')
+    second = Breakpoint('/tmp/entries.py', 5)
+    deleted = Breakpoint('/tmp/entries.py', 7)
+    deleted.deleteMe()
+    try:
+        second.enabled = False
+        second.hits = 2
+
+        entries = breakpoint_entries()
+
+        assert entries[first.number] == ('/tmp/entries.py', 3, 'x > 1', 0,
+            1, 1)
+        assert entries[second.number] == ('/tmp/entries.py', 5, '', 2, 0, 0)
+        assert deleted.number not in entries
+    finally:
+        first.deleteMe()
+        second.deleteMe()
+
+
+def test_entries_delta():
+    from vimpdb.breakpoints import entries_delta
+
+    old = {1: ('/tmp/a.py', 3, '', 0, 1, 0), 2: ('/tmp/a.py', 5, '', 0, 1, 0)}
+    new = {1: ('/tmp/a.py', 3, '', 1, 1, 0), 3: ('/tmp/b.py', 1, '', 0, 1, 0)}
+
+    assert entries_delta(old, new) == (
+        [[1, '/tmp/a.py', 3, '', 1, 1, 0], [3, '/tmp/b.py', 1, '', 0, 1, 0]],
+        [2])
+    assert entries_delta(new, new) == ([], [])
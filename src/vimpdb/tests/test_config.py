@@ -50,6 +50,152 @@ server_name = server_name
     os.remove(name)
 
 
+def test_read_transport_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+transport = channel
+""")
+    file.close()
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    from vimpdb.config import CHANNEL
+    configuration = read_from_file(name, Config)
+    assert configuration.transport == CHANNEL
+    os.remove(name)
+
+
+def test_bad_transport_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+transport = pigeon
+""")
+    file.close()
+    from vimpdb.errors import BadRCFile
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    py.test.raises(BadRCFile, read_from_file, name, Config)
+    os.remove(name)
+
+
+def test_read_command_protocol_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+command_protocol = tcp
+""")
+    file.close()
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    from vimpdb.config import TCP
+    configuration = read_from_file(name, Config)
+    assert configuration.command_protocol == TCP
+    os.remove(name)
+
+
+def test_read_async_send_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+async_send = yes
+""")
+    file.close()
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    configuration = read_from_file(name, Config)
+    assert configuration.async_send
+    os.remove(name)
+
+
+def test_bad_async_send_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+async_send = sometimes
+""")
+    file.close()
+    from vimpdb.errors import BadRCFile
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    py.test.raises(BadRCFile, read_from_file, name, Config)
+    os.remove(name)
+
+
+def test_read_watch_options():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+watch_maxdepth = 1
+watch_maxlength = 2
+""")
+    file.close()
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    from vimpdb.config import DEFAULT_WATCH_MAXBYTES
+    configuration = read_from_file(name, Config)
+    assert configuration.watch_maxdepth == 1
+    assert configuration.watch_maxlength == 2
+    assert configuration.watch_maxbytes == DEFAULT_WATCH_MAXBYTES
+    os.remove(name)
+
+
+def test_bad_watch_option():
+    import tempfile
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("""
+[vimpdb]
+vim_client_script = vim_client_script
+vim_server_script = vim_server_script
+port = 1000
+server_name = server_name
+watch_maxdepth = deep
+""")
+    file.close()
+    from vimpdb.errors import BadRCFile
+    from vimpdb.config import read_from_file
+    from vimpdb.config import Config
+    py.test.raises(BadRCFile, read_from_file, name, Config)
+    os.remove(name)
+
+
 def test_no_vimpdb_section():
     import tempfile
     handle, name = tempfile.mkstemp()
@@ -535,5 +681,313 @@ def test_detector_launch_server_bad_script():
     assert info.value.args[1].endswith('returncode.py --servername VIM')
 
 
+def test_probe_cache_version():
+    import tempfile
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.remove(name)
+    command = build_script("compatiblevim.py").split() + ['--version']
+
+    cache = config.ProbeCache(name)
+    assert cache.get_version(command) is None
+    cache.set_version(command, '+clientserver +python')
+    assert cache.get_version(command) == '+clientserver +python'
+
+    cache = config.ProbeCache(name)
+    assert cache.get_version(command) == '+clientserver +python'
+    cache.versions[" ".join(command)] = ((), 'old')
+    assert cache.get_version(command) is None
+    os.remove(name)
+
+
+def test_probe_cache_server():
+    import tempfile
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.remove(name)
+
+    cache = config.ProbeCache(name)
+    assert not cache.is_server_alive('vim', 'VIM')
+    cache.set_server_alive('vim', 'VIM')
+    assert cache.is_server_alive('vim', 'vim')
+    assert not cache.is_server_alive('gvim', 'VIM')
+
+    cache = config.ProbeCache(name)
+    assert cache.is_server_alive('vim', 'VIM')
+    cache.servers[('vim', 'vim')] -= cache.SERVER_TTL
+    assert not cache.is_server_alive('vim', 'VIM')
+
+    cache.set_server_alive('vim', 'VIM')
+    cache.forget_server('vim', 'VIM')
+    assert not cache.is_server_alive('vim', 'VIM')
+    assert not config.ProbeCache(name).is_server_alive('vim', 'VIM')
+    os.remove(name)
+
+
+def test_probe_cache_unreadable():
+    import tempfile
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    file = open(name, 'w')
+    file.write("garbage")
+    file.close()
+
+    cache = config.ProbeCache(name)
+    assert cache.versions == {}
+    os.remove(name)
+
+
+def test_detector_with_cache():
+    import tempfile
+    from mock import Mock
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.remove(name)
+    cache = config.ProbeCache(name)
+    configuration = config.Config(build_script("rightserverlist.py"),
+        build_script("compatiblevim.py"), 'VIM', 6666)
+    parser = Mock(wraps=config.getCommandOutputPosix)
+
+    detector = config.Detector(configuration, parser, cache=cache)
+    detector.check_python_support()
+    detector.check_serverlist()
+    probes = parser.call_count
+    assert probes >= 2
+
+    detector = config.Detector(configuration, parser, cache=cache)
+    detector.check_python_support()
+    detector.check_serverlist()
+    assert parser.call_count == probes
+    os.remove(name)
+
+
+def test_detector_launch_ready_notification():
+    import tempfile
+    import time
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.remove(name)
+    os.environ['VIMPDB_TEST_MARKER'] = name
+    configuration = config.Config(build_script("launchedserverlist.py"),
+        build_script("readyserver.py"), 'VIM', 6666)
+
+    detector = config.Detector(configuration)
+    detector.FIRST_DELAY = detector.MAX_TIMEOUT
+    start = time.time()
+    try:
+        assert detector.check_serverlist()
+    finally:
+        del os.environ['VIMPDB_TEST_MARKER']
+        os.remove(name)
+    assert time.time() - start < detector.MAX_TIMEOUT
+
+
+def test_detector_wait_for_server_backoff():
+    import time
+    from mock import Mock
+    from vimpdb import config
+
+    configuration = config.Config('client', 'server', 'VIM', 6666)
+    detector = config.Detector(configuration)
+    detector.MAX_TIMEOUT = 1.0
+    detector.FIRST_DELAY = 0.02
+    detector.serverAvailable = Mock(return_value=False)
+    listener = Mock()
+    listener.wait.side_effect = lambda delay: time.sleep(delay)
+
+    assert not detector.wait_for_server(listener)
+    delays = [args[0] for args, kwargs in listener.wait.call_args_list]
+    assert delays[:4] == [0.02, 0.04, 0.08, 0.16]
+    assert detector.serverAvailable.call_count == len(delays) < 7
+
+
+def test_find_sockets():
+    import shutil
+    import tempfile
+    from mock import Mock
+    from mock import patch
+    from vimpdb import config
+
+    directory = tempfile.mkdtemp()
+    try:
+        for name, stamp in (('12.sock', 20), ('34.sock', 30),
+            ('notes.txt', 40)):
+            path = os.path.join(directory, name)
+            open(path, 'w').close()
+            os.utime(path, (stamp, stamp))
+        patcher = patch('vimpdb.config.socket_directory',
+            Mock(return_value=directory))
+        patcher.start()
+        try:
+            assert config.socket_path(12) == os.path.join(directory,
+                '12.sock')
+            assert config.find_sockets() == [
+                os.path.join(directory, '34.sock'),
+                os.path.join(directory, '12.sock')]
+        finally:
+            patcher.stop()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_is_private_directory():
+    import shutil
+    import tempfile
+    from vimpdb import config
+
+    directory = tempfile.mkdtemp()
+    try:
+        assert config.is_private_directory(directory)
+        link = directory + '-link'
+        os.symlink(directory, link)
+        try:
+            assert not config.is_private_directory(link)
+        finally:
+            os.remove(link)
+        os.chmod(directory, 0750)
+        assert not config.is_private_directory(directory)
+        assert not config.is_private_directory(
+            os.path.join(directory, 'missing'))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_find_sockets_not_private():
+    import shutil
+    import tempfile
+    from mock import Mock
+    from mock import patch
+    from vimpdb import config
+
+    directory = tempfile.mkdtemp()
+    try:
+        open(os.path.join(directory, '12.sock'), 'w').close()
+        os.chmod(directory, 0777)
+        patcher = patch('vimpdb.config.socket_directory',
+            Mock(return_value=directory))
+        patcher.start()
+        try:
+            assert config.find_sockets() == []
+        finally:
+            patcher.stop()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_find_sockets_no_directory():
+    from mock import Mock
+    from mock import patch
+    from vimpdb import config
+
+    patcher = patch('vimpdb.config.socket_directory',
+        Mock(return_value='/nonexistent/vimpdb'))
+    patcher.start()
+    try:
+        assert config.find_sockets() == []
+    finally:
+        patcher.stop()
+
+
+def write_rcfile(name, port):
+    rcfile = open(name, 'w')
+    rcfile.write("""[vimpdb]
+vim_client_script = vim
+vim_server_script = gvim
+server_name = VIM
+port = %d
+""" % port)
+    rcfile.close()
+
+
+def test_read_cached_parses_once():
+    import tempfile
+    from mock import patch
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    write_rcfile(name, 6666)
+    patcher = patch('vimpdb.config.read_from_file',
+        wraps=config.read_from_file)
+    mocked = patcher.start()
+    try:
+        first = config.read_cached(name, config.Config)
+        second = config.read_cached(name, config.Config)
+        assert mocked.call_count == 1
+        assert first == second
+        assert first is not second
+        first.port = 1
+        first.scripts[config.CLIENT] = 'changed'
+        third = config.read_cached(name, config.Config)
+        assert third.port == 6666
+        assert third.scripts[config.CLIENT] != 'changed'
+    finally:
+        patcher.stop()
+        os.remove(name)
+
+
+def test_read_cached_file_changed():
+    import tempfile
+    from vimpdb import config
+
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        write_rcfile(name, 6666)
+        os.utime(name, (10, 10))
+        assert config.read_cached(name, config.Config).port == 6666
+        write_rcfile(name, 7777)
+        os.utime(name, (20, 20))
+        assert config.read_cached(name, config.Config).port == 7777
+    finally:
+        os.remove(name)
+
+
+def test_write_to_file_unchanged():
+    import tempfile
+    from vimpdb.config import defaultConfig
+    from vimpdb.config import write_to_file
+
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    os.remove(name)
+    try:
+        assert write_to_file(name, defaultConfig)
+        os.utime(name, (10, 10))
+        assert not write_to_file(name, defaultConfig)
+        assert os.stat(name).st_mtime == 10
+    finally:
+        os.remove(name)
+
+
+def test_write_to_file_keeps_other_options():
+    import tempfile
+    from vimpdb.config import defaultConfig
+    from vimpdb.config import write_to_file
+
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    rcfile = open(name, 'w')
+    rcfile.write("""[vimpdb]
+script = vim
+port = 1
+transport = channel
+""")
+    rcfile.close()
+    try:
+        assert write_to_file(name, defaultConfig)
+        content = open(name).read()
+        assert 'transport = channel' in content
+        assert 'port = %d' % defaultConfig.port in content
+        assert 'script = vim' not in content.splitlines()
+    finally:
+        os.remove(name)
+
+
 if __name__ == '__main__':
     test_detector_get_vim_version_good_script()
@@ -0,0 +1,375 @@
+from mock import Mock
+from mock import patch
+
+
+def import_controller():
+    # vim module only exists inside VIM
+    import sys
+    sys.modules.setdefault('vim', Mock())
+    from vimpdb import controller
+    return controller
+
+
+def make_controller(command_protocol='unix'):
+    Controller = import_controller().Controller
+
+    configuration = Mock()
+    configuration.port = 6666
+    configuration.command_protocol = command_protocol
+    patcher = patch('vimpdb.config.getRawConfiguration',
+        Mock(return_value=configuration))
+    patcher.start()
+    try:
+        return Controller()
+    finally:
+        patcher.stop()
+
+
+def test_register_sessions():
+    controller = make_controller()
+
+    controller.register('12', '/tmp/vimpdb-0/12.sock')
+    controller.register('34', '/tmp/vimpdb-0/34.sock')
+
+    # the session shown stays current
+    assert controller.stopped('34', '/tmp/b.py', '5') is False
+    assert controller.stopped('', '/tmp/a.py', '3') is True
+    assert controller.current == '12'
+    assert controller.address == '/tmp/vimpdb-0/12.sock'
+    assert controller.session_list() == ['* 12 /tmp/a.py:3',
+        '  34 /tmp/b.py:5']
+
+    controller.register('12', '/tmp/vimpdb-0/12-bis.sock')
+    assert controller.address == '/tmp/vimpdb-0/12-bis.sock'
+
+
+def test_unregister_selects_previous_session():
+    controller = make_controller()
+    controller.register('12', '/tmp/vimpdb-0/12.sock')
+    controller.register('34', '/tmp/vimpdb-0/34.sock')
+    controller.select('34')
+    controller.socket = Mock()
+    socket = controller.socket
+
+    assert controller.unregister() == '12'
+    assert socket.close.called
+    assert controller.address == '/tmp/vimpdb-0/12.sock'
+    assert controller.unregister() == ''
+    assert controller.address is None
+
+
+def test_select_unknown_session():
+    controller = make_controller()
+    controller.register('12', '/tmp/vimpdb-0/12.sock')
+
+    assert not controller.select('56')
+    assert controller.current == '12'
+
+
+def test_send_to_current_session():
+    from vimpdb.proxy import StreamProxyFromVim
+
+    controller = make_controller('tcp')
+    receivers = [StreamProxyFromVim(0), StreamProxyFromVim(0)]
+    try:
+        controller.register('12', receivers[0].getAddress())
+        controller.register('34', receivers[1].getAddress())
+
+        controller.send_commands(['n'])
+        controller.select('34')
+        controller.send_commands(['s'])
+
+        assert receivers[0].waitFor(None) == 'n'
+        assert receivers[1].waitFor(None) == 's'
+    finally:
+        controller.socket_close()
+        for receiver in receivers:
+            receiver.closeSocket()
+
+
+def test_send_to_dead_session():
+    import socket
+    import py
+    from vimpdb.proxy import StreamProxyFromVim
+
+    controller = make_controller('tcp')
+    receiver = StreamProxyFromVim(0)
+    controller.register('12', receiver.getAddress())
+    receiver.closeSocket()
+
+    py.test.raises(socket.error, controller.send_commands, ['n'])
+    assert controller.sessions == {}
+    assert controller.current == ''
+
+
+def setup_vim(scrollback=0):
+    from vimpdb.tests.fakevim import FakeVim
+
+    module = import_controller()
+    module.controller = make_controller()
+    module.controller.scrollback = scrollback
+    module.vim = FakeVim()
+    module.vim.add_buffer('/tmp/a.py')
+    return module
+
+
+def setup_feedback_buffer(scrollback):
+    module = setup_vim(scrollback)
+    feedback = module.vim.add_buffer('/home/user/-vimpdb-')
+    return module, feedback
+
+
+def test_buffer_write():
+    module, feedback = setup_feedback_buffer(0)
+
+    module._PDB_buffer_write(['a', 'b'], '')
+    module._PDB_buffer_write(['c'], '')
+
+    assert feedback == ['c']
+
+
+def test_buffer_write_scrollback():
+    module, feedback = setup_feedback_buffer(3)
+
+    module._PDB_buffer_write(['a', 'b'], '')
+    assert feedback == ['a', 'b']
+
+    module._PDB_buffer_write(['c', 'd'], '')
+    assert feedback == ['b', 'c', 'd']
+    assert module.vim.windows[1].cursor == (3, 0)
+
+
+def test_tracker_finds_buffer_by_number():
+    module, feedback = setup_feedback_buffer(0)
+
+    assert module.buffer_find() is feedback
+    assert module.controller.buffers.numbers == {'-vimpdb-': 2}
+
+    # buffers are not walked anymore
+    module.vim.buffers = ListWithoutIteration(module.vim.buffers)
+    assert module.buffer_find() is feedback
+    assert module.vim.evaluated[-2:] == ['bufexists(2)', 'bufwinnr(2)']
+
+
+class ListWithoutIteration(list):
+
+    def __iter__(self):
+        raise AssertionError('buffers walked')
+
+
+def test_tracker_buffer_wiped_out():
+    module, feedback = setup_feedback_buffer(0)
+    assert module.buffer_find() is feedback
+
+    module.vim.buffers.pop()
+    module.vim.windows.pop()
+
+    assert module.buffer_find() is None
+    assert module.controller.buffers.numbers == {}
+
+
+def test_tracker_buffer_hidden():
+    module, feedback = setup_feedback_buffer(0)
+    module.vim.windows.pop()
+
+    assert module.buffer_find() is None
+    assert module.controller.buffers.number('-vimpdb-') == 2
+
+
+def test_window_return_by_id():
+    module = setup_vim()
+
+    mark = module.window_mark()
+    module.window_return(mark)
+
+    assert module.vim.commands == ['call win_gotoid(1000)']
+
+
+def test_window_return_without_ids():
+    module = setup_vim()
+    module.vim.window_ids = False
+    module.vim.current.buffer.name = '/tmp/a.py'
+
+    mark = module.window_mark()
+    module.window_return(mark)
+
+    assert mark == '/tmp/a.py'
+    assert module.vim.commands == ['wincmd w']
+
+
+def test_buffer_append():
+    module, feedback = setup_feedback_buffer(0)
+
+    module._PDB_buffer_write(['a'], '')
+    module._PDB_buffer_append(['b', 'c'], '')
+
+    assert feedback == ['a', 'b', 'c']
+    assert module.vim.windows[1].cursor == (3, 0)
+
+
+def test_fake_server_session():
+    import os
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.tests.fakevim import FakeServer
+    from vimpdb.tests.fakevim import FakeVim
+    from vimpdb.tests.fakevim import start_controller
+
+    configuration = Mock()
+    configuration.command_protocol = 'unix'
+    configuration.feedback_scrollback = 0
+    vim = FakeVim()
+    vim.add_buffer('/tmp/a.py')
+    server = FakeServer(start_controller(vim, configuration))
+    to_vim = ProxyToVim(server)
+
+    to_vim.registerSession('12', '/tmp/vimpdb-0/12.sock')
+    to_vim.showFileAtLine(__file__, 3)
+    to_vim.showFeedback('first\nsecond')
+    to_vim.updateLocals(['a = ', '    1', 'b = ', '    2'])
+    to_vim.updateLocals(['a = ', '    1', 'b = ', '    3'])
+
+    names = [os.path.basename(buffer.name) for buffer in vim.buffers]
+    assert names == ['a.py', '-vimpdb-12-', '-watch-12-']
+    assert vim.buffers[1] == ['first', 'second']
+    assert vim.buffers[2] == ['a = ', '    1', 'b = ', '    3']
+    assert server.location == (__file__.replace('\\', '/'), 3)
+    assert server.sourced
+    # the second update of locals is a patch
+    assert server.evaluated == 2
+
+
+def test_signs_placed_in_loaded_files():
+    module = setup_vim()
+
+    module._PDB_update_signs([['/tmp/a.py', [['3', '1'], ['5', '0']], []],
+        ['/tmp/b.py', [['1', '1']], []]], '')
+
+    assert module.vim.signs == {
+        ('/tmp/a.py', module.SIGN_ID_BASE + 3): (3, 'PdbBreakpoint'),
+        ('/tmp/a.py', module.SIGN_ID_BASE + 5): (5, 'PdbBreakpointDisabled')}
+
+    module._PDB_update_signs([['/tmp/a.py', [['5', '1']], ['3']]], '')
+
+    assert module.vim.signs == {
+        ('/tmp/a.py', module.SIGN_ID_BASE + 5): (5, 'PdbBreakpoint')}
+
+
+def test_signs_placed_when_file_loaded():
+    module = setup_vim()
+    module._PDB_update_signs([['/tmp/b.py', [['1', '1']], []]], '')
+    module._PDB_update_signs([['/tmp/b.py', [['2', '1']], []]], '')
+    assert module.vim.signs == {}
+
+    module.vim.add_buffer('/tmp/b.py')
+    module._PDB_signs_loaded('/tmp/b.py')
+
+    assert sorted(module.vim.signs.values()) == [(1, 'PdbBreakpoint'),
+        (2, 'PdbBreakpoint')]
+
+    # signs are placed again when the file is loaded again
+    module._PDB_signs_unloaded('/tmp/b.py')
+    module.vim.signs.clear()
+    module._PDB_signs_loaded('/tmp/b.py')
+    assert len(module.vim.signs) == 2
+
+
+def test_signs_clear():
+    module = setup_vim()
+    module._PDB_update_signs([['/tmp/a.py', [['3', '1']], []],
+        ['/tmp/b.py', [['1', '1']], []]], '')
+
+    module._PDB_signs_clear()
+
+    assert module.vim.signs == {}
+    assert module.controller.signs.wanted == {}
+    module.vim.add_buffer('/tmp/b.py')
+    module._PDB_signs_loaded('/tmp/b.py')
+    assert module.vim.signs == {}
+
+
+def test_signs_of_sessions():
+    module = setup_vim()
+    module.controller.register('12', '/tmp/vimpdb-0/12.sock')
+    module.controller.register('34', '/tmp/vimpdb-0/34.sock')
+    module._PDB_update_signs([['/tmp/a.py', [['3', '0'], ['5', '1']], []]],
+        '12')
+    module._PDB_update_signs([['/tmp/a.py', [['3', '1']], []]], '34')
+
+    # a line keeps its sign while a session has a breakpoint there
+    module._PDB_update_signs([['/tmp/a.py', [], ['5']]], '34')
+    assert module.vim.signs == {
+        ('/tmp/a.py', module.SIGN_ID_BASE + 3): (3, 'PdbBreakpoint'),
+        ('/tmp/a.py', module.SIGN_ID_BASE + 5): (5, 'PdbBreakpoint')}
+
+    # the exiting session removes its own signs only
+    module._PDB_signs_clear()
+    assert module.vim.signs == {
+        ('/tmp/a.py', module.SIGN_ID_BASE + 3): (3, 'PdbBreakpoint')}
+    assert module.controller.signs.wanted.keys() == ['34']
+
+
+def setup_breakpoints():
+    module = setup_vim()
+    module._PDB_update_breakpoints([
+        ['1', '/tmp/a.py', '3', '', '0', '1', '0'],
+        ['2', '/tmp/b.py', '5', 'x > 1', '2', '0', '1']], [], '')
+    return module
+
+
+def test_breakpoint_list_window():
+    module = setup_breakpoints()
+
+    module._PDB_show_breakpoints('')
+
+    buffer = module.vim.buffers[-1]
+    assert buffer.name == '-breakpoints-'
+    assert buffer == [
+        '  1 yes keep /tmp/a.py:3 hits 0',
+        '  2 no  once /tmp/b.py:5 hits 2 if x > 1']
+
+    module._PDB_update_breakpoints([['1', '/tmp/a.py', '3', '', '1', '1',
+        '0']], ['2'], '')
+
+    assert buffer == ['  1 yes keep /tmp/a.py:3 hits 1']
+
+
+def test_breakpoint_list_filter():
+    module = setup_breakpoints()
+
+    module._PDB_show_breakpoints(' b.py ')
+
+    buffer = module.vim.buffers[-1]
+    assert buffer == ['  2 no  once /tmp/b.py:5 hits 2 if x > 1']
+    assert module._PDB_breakpoint_number('1') == 2
+    assert module._PDB_breakpoint_location('1') == ['/tmp/b.py', 5]
+    assert module._PDB_breakpoint_number('2') == 0
+    assert module._PDB_breakpoint_location('2') == []
+
+    module._PDB_show_breakpoints('nothing')
+    assert buffer == ['no breakpoint']
+
+
+def test_breakpoint_list_other_session():
+    module = setup_breakpoints()
+    module._PDB_show_breakpoints('')
+    buffer = module.vim.buffers[-1]
+    module.controller.register('12', '/tmp/vimpdb-0/12.sock')
+    module.controller.register('34', '/tmp/vimpdb-0/34.sock')
+
+    module._PDB_update_breakpoints([['1', '/tmp/c.py', '7', '', '0', '1',
+        '0']], [], '34')
+    assert len(buffer) == 2
+
+    module._PDB_select_session('34')
+    module._PDB_show_session_buffers()
+    assert buffer == ['  1 yes keep /tmp/c.py:7 hits 0']
+
+
+def test_breakpoint_list_close():
+    module = setup_breakpoints()
+    module._PDB_show_breakpoints('')
+
+    module._PDB_breakpoints_close()
+
+    assert module.vim.buffers[-1].name == '/tmp/a.py'
+    assert module.controller.breakpoint_lists == {}
@@ -2,50 +2,7 @@ from mock import Mock
 from mock import patch
 
 
-def test_klass_after_setup_method():
-    from vimpdb.debugger import setupMethod
-
-    mocked_method = Mock(name='orig')
-
-    class Klass:
-
-        method = mocked_method
-
-    new_method = Mock(name='new')
-    new_method.__name__ = 'method'
-
-    setupMethod(Klass, new_method)
-
-    assert hasattr(Klass, '_orig_method')
-    assert Klass._orig_method == mocked_method
-    assert hasattr(Klass, 'method')
-    assert Klass.method == new_method
-
-
-def test_instance_of_klass_after_setup_method():
-    from vimpdb.debugger import setupMethod
-
-    mocked_method = Mock(name='orig')
-
-    class Klass:
-
-        method = mocked_method
-
-    new_method = Mock(name='new')
-    new_method.__name__ = 'method'
-
-    setupMethod(Klass, new_method)
-    instance = Klass()
-    instance.method()
-
-    assert new_method.called
-
-    instance._orig_method()
-    assert mocked_method.called
-
-
-@patch('vimpdb.debugger.trace_dispatch')
-def test_hook(mocked_trace_dispatch):
+def test_hook():
     from vimpdb.debugger import hook
     from vimpdb.debugger import SwitcherToVimpdb
 
@@ -55,17 +12,14 @@ def test_hook(mocked_trace_dispatch):
             pass
 
     orig_trace_dispatch = Klass.trace_dispatch
-    mocked_trace_dispatch.__name__ = 'trace_dispatch'
 
     hook(Klass)
 
-    assert Klass._orig_trace_dispatch == orig_trace_dispatch
     assert SwitcherToVimpdb in Klass.__bases__
-    assert Klass.trace_dispatch == mocked_trace_dispatch
+    assert Klass.trace_dispatch == orig_trace_dispatch
 
 
-@patch('vimpdb.debugger.setupMethod')
-def test_hook_do_nothing(mocked_setupMethod):
+def test_hook_do_nothing():
     from vimpdb.debugger import hook
     from vimpdb.debugger import SwitcherToVimpdb
 
@@ -77,24 +31,59 @@ def test_hook_do_nothing(mocked_setupMethod):
 
     hook(Klass)
 
-    assert not mocked_setupMethod.called
     assert SwitcherToVimpdb not in Klass.__bases__
 
 
-@patch('vimpdb.debugger.trace_dispatch')
-def test_get_hooked_pdb(mocked_trace_dispatch):
+def test_get_hooked_pdb():
+    from bdb import Bdb
     from pdb import Pdb
     from vimpdb.debugger import get_hooked_pdb
     from vimpdb.debugger import SwitcherToVimpdb
 
-    mocked_trace_dispatch.__name__ = 'trace_dispatch'
-
     debugger = get_hooked_pdb()
 
     assert isinstance(debugger, Pdb)
     assert isinstance(debugger, SwitcherToVimpdb)
     assert hasattr(debugger, 'do_vim')
-    assert debugger.trace_dispatch == mocked_trace_dispatch
+    assert debugger.trace_dispatch.im_func is Bdb.trace_dispatch.im_func
+
+
+def test_switch_tracer():
+    from vimpdb.debugger import get_hooked_pdb
+
+    debugger = get_hooked_pdb()
+    other = get_hooked_pdb()
+
+    debugger.stack = []
+    debugger.switch_tracer(other)
+    assert debugger.trace_dispatch == other.trace_dispatch
+    assert debugger.trace_dispatch.im_self is other
+
+
+def test_switch_tracer_retraces_stack_frames():
+    import sys
+    from vimpdb.debugger import get_hooked_pdb
+
+    debugger = get_hooked_pdb()
+    other = get_hooked_pdb()
+
+    def callee():
+        return sys._getframe()
+
+    def caller():
+        return callee(), sys._getframe()
+
+    # frames between the current frame and botframe,
+    # still traced by debugger
+    inner, outer = caller()
+    inner.f_trace = debugger.trace_dispatch
+    outer.f_trace = debugger.trace_dispatch
+    debugger.stack = [(outer, 1), (inner, 1)]
+
+    debugger.switch_tracer(other)
+
+    assert inner.f_trace.im_self is other
+    assert outer.f_trace.im_self is other
 
 
 @patch('vimpdb.config.get_configuration')
@@ -112,3 +101,552 @@ def test_make_instance(mocked_get_configuration):
     assert instance.from_vim.port == 6666
     assert instance.to_vim.communicator.script == 'client'
     assert instance.to_vim.communicator.server_name == 'name'
+
+
+@patch('vimpdb.config.get_configuration')
+def test_make_instance_async(mocked_get_configuration):
+    from vimpdb.config import Config
+    from vimpdb.debugger import make_instance
+    from vimpdb.proxy import AsyncProxyToVim
+
+    mocked_get_configuration.return_value = Config(
+        'client', 'server', 'name', 6666, async_send=True)
+
+    instance = make_instance()
+
+    assert isinstance(instance.to_vim, AsyncProxyToVim)
+
+
+def test_continue_discards_updates():
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.set_continue = Mock()
+
+    debugger.do_continue('')
+
+    assert to_vim.discardPending.called
+
+
+@patch('vimpdb.config.Detector')
+@patch('vimpdb.config.get_configuration')
+def test_session_reuse(mocked_get_configuration, mocked_Detector):
+    from vimpdb.config import Config
+    from vimpdb.debugger import Session
+    from vimpdb.debugger import VimPdb
+
+    mocked_get_configuration.return_value = Config(
+        'client', 'server', 'name', 6666)
+    mocked_Detector.return_value.launched = False
+
+    session = Session()
+    instance = session.get_instance()
+    assert isinstance(instance, VimPdb)
+    assert instance.from_vim.persistent
+    assert mocked_get_configuration.call_count == 1
+
+    instance.pdb = Mock()
+    instance._textOutput = 'pending'
+    instance.to_vim.watch_lines = ['a = ', '    1']
+
+    assert session.get_instance() is instance
+    assert mocked_get_configuration.call_count == 1
+    assert mocked_Detector.return_value.check_serverlist.called
+    assert not hasattr(instance, 'pdb')
+    assert instance._textOutput == ''
+    assert instance.to_vim.watch_lines is None
+
+
+@patch('vimpdb.config.Detector')
+@patch('vimpdb.config.get_configuration')
+def test_session_server_launched(mocked_get_configuration, mocked_Detector):
+    from vimpdb.config import Config
+    from vimpdb.debugger import Session
+    from vimpdb.proxy import REMOTE_READY
+    from vimpdb.proxy import REMOTE_UNKNOWN
+
+    mocked_get_configuration.return_value = Config(
+        'client', 'server', 'name', 6666)
+    session = Session()
+    instance = session.get_instance()
+    instance.to_vim.remote_state = REMOTE_READY
+
+    mocked_Detector.return_value.launched = True
+    session.get_instance()
+    assert instance.to_vim.remote_state == REMOTE_UNKNOWN
+
+
+@patch('vimpdb.config.get_configuration')
+def test_session_active_instance(mocked_get_configuration):
+    from vimpdb.config import Config
+    from vimpdb.debugger import Session
+
+    mocked_get_configuration.return_value = Config(
+        'client', 'server', 'name', 6666)
+    session = Session()
+    instance = session.get_instance()
+    instance.active = True
+
+    other = session.get_instance()
+    assert other is not instance
+    assert not other.from_vim.persistent
+    assert session.instance is instance
+
+
+@patch('vimpdb.debugger.session')
+def test_set_trace_not_enabled(mocked_session):
+    from vimpdb.debugger import set_trace
+
+    set_trace(enabled=False)
+    set_trace(condition=False)
+    set_trace(condition=lambda: 0)
+
+    assert not mocked_session.get_instance.called
+
+
+@patch('vimpdb.debugger.session')
+def test_set_trace_disabled(mocked_session):
+    from vimpdb import debugger
+
+    debugger.disable()
+    try:
+        debugger.set_trace()
+    finally:
+        debugger.enable()
+    assert not mocked_session.get_instance.called
+
+    debugger.set_trace()
+    assert mocked_session.get_instance.called
+
+
+def test_disabled_by_environment():
+    from vimpdb.trigger import disabled_by
+
+    for value in ('1', 'true', 'yes', 'on'):
+        assert disabled_by(value)
+    for value in ('', '0', 'false', 'False', 'NO', ' no '):
+        assert not disabled_by(value)
+
+
+@patch('vimpdb.debugger.session')
+def test_set_trace_hit_count(mocked_session):
+    import sys
+    from vimpdb.debugger import set_trace
+
+    instance = mocked_session.get_instance.return_value
+    for i in range(5):
+        set_trace(condition=lambda: i % 2 == 0, hit_count=2)
+
+    # condition is true for i = 0, 2 and 4; break from second time
+    assert instance.set_trace.call_count == 2
+    args, kwargs = instance.set_trace.call_args
+    assert args[0] is sys._getframe()
+
+
+def test_breakpoint_change_invalidates_index():
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    debugger.breakpoints = Mock()
+    filename = debugger.canonic(__file__)
+
+    debugger.set_break(filename, 1)
+    debugger.clear_all_breaks()
+
+    assert debugger.breakpoints.invalidate.call_count == 2
+
+
+def test_breakpoint_commands_update_vim():
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    filename = debugger.canonic(__file__)
+    debugger.set_break(filename, 1)
+    breakpoint = debugger.get_breaks(filename, 1)[0]
+    try:
+        for command in ('condition %d x > 1', 'ignore %d 2', 'disable %d',
+            'enable %d'):
+            debugger.signs_outdated = False
+            debugger.list_outdated = False
+            debugger.onecmd(command % breakpoint.number)
+            assert debugger.signs_outdated
+            assert debugger.list_outdated
+        assert breakpoint.cond == 'x > 1'
+        assert breakpoint.ignore == 2
+    finally:
+        debugger.clear_all_breaks()
+
+
+def test_continue_skips_frames_without_breakpoints():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    debugger.reset()
+    debugger.set_break(debugger.canonic(__file__),
+        test_breakpoint_change_invalidates_index.func_code.co_firstlineno
+        + 2)
+    debugger.botframe = sys._getframe()
+    debugger.set_continue()
+    try:
+        assert debugger.continuing
+        assert debugger.dispatch_call(sys._getframe(), None) is None
+    finally:
+        debugger.clear_all_breaks()
+
+
+def test_continue_standard_mode():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    debugger.fast_continue = False
+    debugger.reset()
+    debugger.botframe = sys._getframe()
+    debugger.set_continue()
+
+    assert not debugger.continuing
+
+
+def test_continue_without_breakpoints_stops_tracing():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    debugger.reset()
+    debugger.botframe = sys._getframe().f_back
+    sys.settrace(lambda frame, event, arg: None)
+    debugger.set_continue()
+
+    assert sys.gettrace() is None
+
+
+def step_out_inner():
+    value = 1
+    return value
+
+
+def step_out_outer():
+    value = step_out_inner()
+    return value
+
+
+def test_step_out_after_breakpoint():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    commands = ['c', 'r', 'n', 'c']
+    stops = []
+
+    def waitFor(debugger):
+        stops.append(debugger.curframe.f_code.co_name)
+        return commands.pop(0)
+
+    from_vim = Mock()
+    from_vim.waitFor.side_effect = waitFor
+    debugger = VimPdb(Mock(), from_vim)
+    debugger.set_break(debugger.canonic(__file__),
+        step_out_inner.func_code.co_firstlineno + 2)
+    try:
+        debugger.set_trace(sys._getframe())
+        step_out_outer()
+    finally:
+        sys.settrace(None)
+        debugger.clear_all_breaks()
+
+    # c(ontinue) untraced callers: r(eturn) then n(ext) stop in the caller
+    assert stops == ['test_step_out_after_breakpoint', 'step_out_inner',
+        'step_out_inner', 'step_out_outer']
+
+
+def test_preloop_registers_session():
+    import os
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    from_vim = Mock()
+    from_vim.getAddress.return_value = '/tmp/vimpdb-0/12.sock'
+    debugger = VimPdb(to_vim, from_vim)
+    debugger.showFileAtLine = Mock()
+
+    debugger.preloop()
+
+    to_vim.registerSession.assert_called_with(str(os.getpid()),
+        '/tmp/vimpdb-0/12.sock')
+
+    from_vim.getAddress.return_value = None
+    to_vim.registerSession.reset_mock()
+    debugger.preloop()
+
+    assert not to_vim.registerSession.called
+
+
+def test_output_sink_chunks():
+    from vimpdb.debugger import OutputSink
+
+    to_vim = Mock()
+    sink = OutputSink(to_vim)
+    sink.CHUNK_SIZE = 10
+
+    sink.write('frame 1\nframe')
+    to_vim.showFeedback.assert_called_with('frame 1\n')
+    sink.write(' 2\nframe 3\n')
+    to_vim.appendFeedback.assert_called_with('frame 2\nframe 3\n')
+    sink.write('end')
+    assert to_vim.appendFeedback.call_count == 1
+
+    sink.close()
+
+    to_vim.appendFeedback.assert_called_with('end')
+
+
+def test_output_sink_truncated():
+    from vimpdb.debugger import OutputSink
+
+    to_vim = Mock()
+    sink = OutputSink(to_vim, max_size=8)
+
+    sink.write('12345')
+    sink.write('67890')
+    sink.write('abc')
+    sink.close()
+
+    to_vim.showFeedback.assert_called_with(
+        '12345678\n*** output truncated: 5 bytes dropped ***')
+
+
+def test_output_sink_long_line():
+    from vimpdb.debugger import OutputSink
+
+    to_vim = Mock()
+    sink = OutputSink(to_vim)
+    sink.CHUNK_SIZE = 4
+    sink.MAX_LINE_SIZE = 8
+
+    sink.write('x' * 6)
+    assert not to_vim.showFeedback.called
+    sink.write('x' * 6)
+
+    to_vim.showFeedback.assert_called_with('x' * 12)
+
+
+def test_default_streams_feedback():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    value = 42
+    debugger.curframe = sys._getframe()
+    debugger.curframe_locals = debugger.curframe.f_locals
+
+    debugger.default('!value')
+
+    first_call = to_vim.showFeedback.call_args_list[0]
+    assert first_call[0] == ('value = 42\n',)
+
+
+def test_where_captured_as_a_whole():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.reset()
+    frame = sys._getframe()
+    debugger.stack, debugger.curindex = debugger.get_stack(frame, None)
+    debugger.curframe = frame
+
+    debugger.do_where('')
+
+    feedback = to_vim.showFeedback.call_args_list[0][0][0]
+    assert feedback.count('\n-> ') == len(debugger.stack)
+
+
+def test_capture_stopped_on_error():
+    import sys
+    import py
+    from vimpdb.debugger import capture_self_stdout
+    from vimpdb.debugger import capture_sys_stdout
+    from vimpdb.debugger import VimPdb
+
+    def failing(self, line):
+        raise ValueError(line)
+
+    debugger = VimPdb(Mock(), Mock())
+    stdout = debugger.stdout
+    py.test.raises(ValueError, capture_self_stdout(failing), debugger, 'x')
+    assert not debugger.capturing
+    assert debugger.stdout is stdout
+
+    stdout = sys.stdout
+    py.test.raises(ValueError, capture_sys_stdout(failing), debugger, 'x')
+    assert not debugger.capturing
+    assert sys.stdout is stdout
+
+
+def test_reset_session_stops_capture():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    stdout = debugger.stdout
+    debugger.capture_self_stdout()
+    debugger.reset_session()
+    assert not debugger.capturing
+    assert debugger.stdout is stdout
+
+    stdout = sys.stdout
+    debugger.capture_sys_stdout()
+    debugger.reset_session()
+    assert not debugger.capturing
+    assert sys.stdout is stdout
+    assert not to_vim.showFeedback.called
+
+
+def test_cmdloop_records_commands():
+    from vimpdb.debugger import VimPdb
+
+    from_vim = Mock()
+    from_vim.waitFor.side_effect = ['p 1', 'c']
+    debugger = VimPdb(Mock(), from_vim)
+    debugger.preloop = Mock()
+    debugger.onecmd = Mock(side_effect=[None, 1])
+
+    debugger.cmdloop()
+
+    assert [record['command'] for record in debugger.stats.records] == [
+        '(stop)', 'p', 'c']
+
+
+def test_stats_command():
+    import os
+    import tempfile
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.stats.start('n')
+    debugger.stats.stop()
+
+    debugger.do_stats('')
+    feedback = to_vim.showFeedback.call_args[0][0]
+    assert feedback.splitlines()[1].split()[:2] == ['n', '1']
+
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        debugger.do_stats('dump %s' % name)
+        assert len(open(name).readlines()) == 2
+    finally:
+        os.remove(name)
+    to_vim.showFeedback.assert_called_with('1 records written to %s' % name)
+
+    debugger.do_stats('clear')
+    assert debugger.stats.records == []
+
+    debugger.do_stats('dump')
+    to_vim.showFeedback.assert_called_with(
+        '*** usage: stats [dump <filename> | clear]')
+
+
+def test_breakpoint_signs_sent_once_per_frame():
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    from_vim = Mock()
+    debugger = VimPdb(to_vim, from_vim)
+    debugger.reset()
+    debugger.signs_outdated = False
+    filename = debugger.canonic(__file__)
+    try:
+        from_vim.hasPending.return_value = True
+        debugger.set_break(filename, 3)
+        debugger.postcmd(None, 'b %s:3' % filename)
+        assert not to_vim.showBreakpoints.called
+
+        from_vim.hasPending.return_value = False
+        debugger.set_break(filename, 4)
+        debugger.postcmd(None, 'b %s:4' % filename)
+        to_vim.showBreakpoints.assert_called_with({filename: {3: True,
+            4: True}})
+
+        debugger.postcmd(None, 'n')
+        assert to_vim.showBreakpoints.call_count == 1
+    finally:
+        debugger.clear_all_breaks()
+
+
+def test_quit_forgets_signs():
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.set_quit = Mock()
+    debugger.signs_outdated = False
+
+    debugger.do_quit('')
+
+    assert to_vim.forgetBreakpoints.called
+    assert debugger.signs_outdated
+
+
+def test_breakpoint_list_refreshed_at_stops():
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.reset()
+    debugger.showFileAtLine = Mock()
+    debugger.preloop()
+    assert to_vim.showBreakpointList.call_count == 1
+
+    # no breakpoint: nothing to refresh
+    debugger.preloop()
+    assert to_vim.showBreakpointList.call_count == 1
+
+    filename = debugger.canonic(__file__)
+    try:
+        debugger.set_break(filename, 3)
+        debugger.preloop()
+        debugger.preloop()
+        assert to_vim.showBreakpointList.call_count == 3
+        assert to_vim.showBreakpoints.call_count == 2
+    finally:
+        debugger.clear_all_breaks()
+
+
+def test_stack_files():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    debugger = VimPdb(Mock(), Mock())
+    debugger.reset()
+    frame = sys._getframe()
+    debugger.stack, debugger.curindex = debugger.get_stack(frame, None)
+
+    filenames = debugger.stackFiles()
+
+    assert filenames[0] == debugger.canonic(__file__)
+    assert len(filenames) == len(dict.fromkeys(filenames))
+
+    debugger.PRELOADED_FILES = 1
+    assert debugger.stackFiles() == filenames[:1]
+
+
+def test_show_file_preloads_stack_files():
+    import sys
+    from vimpdb.debugger import VimPdb
+
+    to_vim = Mock()
+    debugger = VimPdb(to_vim, Mock())
+    debugger.reset()
+    frame = sys._getframe()
+    debugger.stack, debugger.curindex = debugger.get_stack(frame, None)
+    debugger.curframe = frame
+
+    debugger.showFileAtLine()
+
+    to_vim.preloadFiles.assert_called_with(debugger.stackFiles())
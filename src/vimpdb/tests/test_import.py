@@ -0,0 +1,48 @@
+# modules that importing vimpdb or a set_trace() that does not fire
+# must not load
+HEAVY_MODULES = ['vimpdb.debugger', 'vimpdb.config', 'vimpdb.proxy',
+    'pdb', 'logging', 'subprocess', 'socket', 'ConfigParser', 'vim_bridge']
+
+
+def loaded_modules(code):
+    """
+    heavy modules loaded by code, run in a new interpreter
+    """
+    import os
+    import subprocess
+    import sys
+    script = ("import sys\n%s\n"
+        "print ' '.join([name for name in %r if name in sys.modules])\n"
+        % (code, HEAVY_MODULES))
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+    process = subprocess.Popen([sys.executable, '-c', script],
+        stdout=subprocess.PIPE, env=environment)
+    output = process.communicate()[0]
+    assert process.returncode == 0
+    return output.split()
+
+
+def test_import_vimpdb():
+    assert loaded_modules('import vimpdb') == []
+
+
+def test_set_trace_not_fired():
+    assert loaded_modules(
+        'import vimpdb\n'
+        'vimpdb.set_trace(condition=False)\n'
+        'vimpdb.disable()\n'
+        'vimpdb.set_trace()') == []
+
+
+def test_set_trace_fired():
+    from mock import patch
+
+    patcher = patch('vimpdb.debugger.session')
+    mocked_session = patcher.start()
+    try:
+        import vimpdb
+        vimpdb.set_trace()
+    finally:
+        patcher.stop()
+    assert mocked_session.get_instance.return_value.set_trace.called
@@ -0,0 +1,29 @@
+def test_encode_frame():
+    from vimpdb.protocol import encode_frame
+
+    assert encode_frame(['n']) == '\x00\x00\x00\x01n'
+    assert encode_frame(['b a.py:1', 'b a.py:2']) == (
+        '\x00\x00\x00\x11b a.py:1\nb a.py:2')
+
+
+def test_FrameReader_split_frames():
+    from vimpdb.protocol import encode_frame
+    from vimpdb.protocol import FrameReader
+
+    data = encode_frame(['n']) + encode_frame(['s', 'c'])
+    reader = FrameReader()
+
+    assert reader.feed(data[:3]) == []
+    assert reader.feed(data[3:7]) == ['n']
+    assert reader.feed(data[7:]) == ['s', 'c']
+    assert reader.data == ''
+
+
+def test_FrameReader_large_command():
+    from vimpdb.protocol import encode_frame
+    from vimpdb.protocol import FrameReader
+
+    command = '!' + 'x' * 100000
+    reader = FrameReader()
+
+    assert reader.feed(encode_frame([command])) == [command]
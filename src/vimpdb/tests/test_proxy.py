@@ -283,3 +283,748 @@ def test_ProxyFromVim_waitFor():
 
     assert message == 'message'
     assert from_vim.socket.recvfrom.called
+
+
+def test_keys_to_ex():
+    from vimpdb.proxy import keys_to_ex
+
+    assert keys_to_ex(':call PDB_reset_watch()<CR>') == (
+        'call PDB_reset_watch()')
+    assert keys_to_ex('<C-\\><C-N>:source vimpdb.vim<CR>') == (
+        'source vimpdb.vim')
+    assert keys_to_ex(':call PDB_init_controller()') == (
+        'call PDB_init_controller()')
+
+
+def test_get_communicator():
+    from vimpdb.config import Config
+    from vimpdb.config import CHANNEL
+    from vimpdb.proxy import get_communicator
+    from vimpdb.proxy import Communicator
+    from vimpdb.proxy import ChannelCommunicator
+
+    configuration = Config('client', 'server', 'name', 6666)
+    communicator = get_communicator(configuration)
+    assert type(communicator) is Communicator
+    assert communicator.script == 'client'
+
+    configuration.transport = CHANNEL
+    communicator = get_communicator(configuration)
+    assert isinstance(communicator, ChannelCommunicator)
+    assert communicator.server_name == 'name'
+
+
+def test_ChannelCommunicator_fallback():
+    from vimpdb.proxy import ChannelCommunicator
+    script = build_script("communicator.py")
+
+    communicator = ChannelCommunicator(script, 'server_name')
+    communicator.channel_failed = True
+    result = communicator._remote_expr('expr')
+
+    assert 'expr' in result
+    assert communicator.channel is None
+
+
+def test_ChannelCommunicator_channel():
+    import socket
+    from vimpdb.proxy import ChannelCommunicator
+
+    if not hasattr(socket, 'socketpair'):
+        py.test.skip("needs socket.socketpair")
+    vim_side, debugger_side = socket.socketpair()
+    communicator = ChannelCommunicator('script', 'server_name')
+    if communicator.channel_failed:
+        py.test.skip("needs json module")
+    communicator.channel = debugger_side
+
+    communicator._send(':call PDB_reset_watch()<CR>')
+    received = vim_side.recv(1024)
+    assert received == ('["ex", "call PDB_reset_watch()"]'
+        '["redraw", ""]')
+
+    vim_side.sendall('[0, "unsolicited"]\n[-1, 1]\n')
+    assert communicator._remote_expr("exists('*PDB_setup_egg')") == '1'
+    assert vim_side.recv(1024) == (
+        '["expr", "exists(\'*PDB_setup_egg\')", -1]')
+
+    vim_side.close()
+    from vimpdb.errors import RemoteUnavailable
+    py.test.raises(RemoteUnavailable, communicator._remote_expr, 'expr')
+    assert communicator.channel is None
+    debugger_side.close()
+
+
+def test_split_lines():
+    from vimpdb.proxy import split_lines
+
+    assert split_lines([], 100) == [[]]
+    assert split_lines(['a', 'b'], 100) == [['a', 'b']]
+    lines = ['x' * 10] * 10
+    chunks = split_lines(lines, 50)
+    assert sum(chunks, []) == lines
+    for chunk in chunks:
+        assert len(repr(chunk)) <= 50
+
+
+def test_ProxyToVim_displayLocals_single_call():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.displayLocals('a = \n    1\nb = \n    2\n')
+
+    assert communicator._send.call_count == 1
+    communicator._send.assert_called_with(
+        ":call PDB_write_watch(['a = ', '    1', 'b = ', '    2'])<CR>")
+
+
+def test_ProxyToVim_displayLocals_chunked():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.MAX_COMMAND_LENGTH = 40
+    to_vim.displayLocals('\n'.join(['line %d' % i for i in range(10)]))
+
+    call_args_list = communicator._send.call_args_list
+    assert len(call_args_list) > 1
+    call_args, call_kwargs = call_args_list[0]
+    assert call_args[0].startswith(':call PDB_write_watch([')
+    for call_args, call_kwargs in call_args_list[1:]:
+        assert call_args[0].startswith(':call PDB_append_watch([')
+
+
+def test_ProxyToVim_setupRemote_cached():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.showFeedback('first')
+    to_vim.showFeedback('second')
+    to_vim.displayLocals('a = \n    1')
+
+    assert communicator._remote_expr.call_count == 1
+    assert to_vim.avoided_setup_probes == 2
+
+
+def test_ProxyToVim_setupRemote_after_remote_unavailable():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+    from vimpdb.proxy import REMOTE_READY
+    from vimpdb.proxy import REMOTE_UNKNOWN
+    from vimpdb.errors import RemoteUnavailable
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.setupRemote()
+    assert to_vim.remote_state == REMOTE_READY
+
+    communicator._send.side_effect = RemoteUnavailable()
+    py.test.raises(RemoteUnavailable, to_vim.showFeedback, 'first')
+    assert to_vim.remote_state == REMOTE_UNKNOWN
+
+    communicator._send.side_effect = None
+    to_vim.showFeedback('first')
+    assert communicator._remote_expr.call_count == 2
+
+
+def test_ProxyToVim_updateLocals_patch():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.updateLocals(['a = ', '    1'])
+    communicator._send.assert_called_with(
+        ":call PDB_write_watch(['a = ', '    1'])<CR>")
+
+    to_vim.updateLocals(['a = ', '    2'])
+    communicator._remote_expr.assert_called_with(
+        "PDB_patch_watch(2, [[1, 2, ['    2']]])")
+    assert communicator._send.call_count == 1
+    assert to_vim.watch_lines == ['a = ', '    2']
+
+    to_vim.updateLocals(['a = ', '    2'])
+    assert communicator._remote_expr.call_count == 2
+
+
+def test_ProxyToVim_updateLocals_out_of_sync():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+
+    to_vim = ProxyToVim(communicator)
+    to_vim.updateLocals(['a = ', '    1'])
+
+    communicator._remote_expr.return_value = '0'
+    to_vim.updateLocals(['a = ', '    2'])
+    communicator._send.assert_called_with(
+        ":call PDB_write_watch(['a = ', '    2'])<CR>")
+
+    to_vim.forgetLocals()
+    to_vim.updateLocals(['a = ', '    2'])
+    assert communicator._send.call_count == 3
+
+
+def test_ProxyFromVim_releaseSocket():
+    from vimpdb.proxy import ProxyFromVim
+    from_vim = ProxyFromVim(6666)
+
+    from_vim.socket = Mock()
+    from_vim.socket_inactive = False
+
+    from_vim.releaseSocket()
+
+    assert from_vim.socket_inactive
+    assert from_vim.socket.close.called
+
+
+def test_ProxyFromVim_releaseSocket_persistent():
+    from vimpdb.proxy import ProxyFromVim
+    from socket import socket
+
+    # the UDP port is shared by the debugged processes: closed anyway
+    from_vim = ProxyFromVim(6666)
+    from_vim.persistent = True
+    from_vim.socket = Mock(socket)
+    from_vim.socket_inactive = False
+
+    from_vim.releaseSocket()
+
+    assert from_vim.socket_inactive
+    assert from_vim.socket.close.called
+    assert not from_vim.stale
+
+
+def test_ProxyFromVim_sequential_processes():
+    import socket
+    from vimpdb.proxy import ProxyFromVim
+
+    # two processes stop and continue in turn, then the first stops again
+    first = ProxyFromVim(16667)
+    second = ProxyFromVim(16667)
+    first.persistent = second.persistent = True
+    vim_end = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        first.bindSocket()
+        first.releaseSocket()
+        second.bindSocket()
+        second.releaseSocket()
+        first.bindSocket()
+        first.socket.settimeout(2)
+
+        vim_end.sendto('n', ('127.0.0.1', 16667))
+        assert first.waitFor(None) == 'n'
+    finally:
+        vim_end.close()
+        first.closeSocket()
+        second.closeSocket()
+
+
+def test_get_receiver():
+    from vimpdb.proxy import get_receiver
+    from vimpdb.proxy import ProxyFromVim
+    from vimpdb.proxy import StreamProxyFromVim
+    from vimpdb.config import TCP
+
+    configuration = Mock()
+    configuration.port = 6666
+    configuration.command_protocol = TCP
+    from_vim = get_receiver(configuration)
+    assert isinstance(from_vim, StreamProxyFromVim)
+
+    configuration.command_protocol = 'udp'
+    from_vim = get_receiver(configuration)
+    assert type(from_vim) is ProxyFromVim
+
+
+def test_StreamProxyFromVim_releaseSocket_shared_port():
+    from vimpdb.proxy import StreamProxyFromVim
+
+    first = StreamProxyFromVim(0)
+    first.bindSocket()
+    port = first.socket.getsockname()[1]
+    shared = StreamProxyFromVim(port)
+    first.closeSocket()
+    shared.persistent = True
+    try:
+        shared.bindSocket()
+        assert not shared.private
+        shared.releaseSocket()
+        assert shared.socket_inactive
+    finally:
+        shared.closeSocket()
+
+
+def test_StreamProxyFromVim_waitFor():
+    import socket
+    from vimpdb.proxy import StreamProxyFromVim
+    from vimpdb.protocol import encode_frame
+
+    from_vim = StreamProxyFromVim(6666)
+    from_vim.socket = Mock()
+    from_vim.socket_inactive = False
+    vim_end, vimpdb_end = socket.socketpair()
+    from_vim.connection = vimpdb_end
+    from_vim.BUFLEN = 5
+
+    long_expression = '!' + 'x' * 1000
+    vim_end.sendall(encode_frame(['b a.py:1', 'b a.py:2']) +
+        encode_frame([long_expression]))
+
+    assert from_vim.waitFor(None) == 'b a.py:1'
+    assert from_vim.waitFor(None) == 'b a.py:2'
+    assert from_vim.waitFor(None) == long_expression
+    assert not from_vim.socket.accept.called
+
+    # VIM reconnects after closing its end
+    vim_end.close()
+    other_vim_end, other_vimpdb_end = socket.socketpair()
+    from_vim.socket.accept.return_value = (other_vimpdb_end, None)
+    other_vim_end.sendall(encode_frame(['c']))
+
+    assert from_vim.waitFor(None) == 'c'
+    assert from_vim.socket.accept.call_count == 1
+    from_vim.closeSocket()
+    other_vim_end.close()
+
+
+def test_StreamProxyFromVim_releaseSocket_persistent():
+    from socket import socket
+    from socket import error
+    from vimpdb.proxy import StreamProxyFromVim
+
+    from_vim = StreamProxyFromVim(6666)
+    from_vim.persistent = True
+    # bound to a port chosen by the system
+    from_vim.private = True
+    from_vim.socket = Mock(socket)
+    from_vim.socket_inactive = False
+    connection = Mock(socket)
+    from_vim.connection = connection
+    from_vim.pending = ['n']
+
+    from_vim.releaseSocket()
+
+    assert from_vim.stale
+
+    stale_connection = Mock(socket)
+    new_connection = Mock(socket)
+    new_connection.recv.return_value = '\x00\x00\x00\x01s'
+    from_vim.socket.accept.side_effect = [(stale_connection, None), error(),
+        (new_connection, None)]
+
+    assert from_vim.waitFor(None) == 's'
+    assert connection.close.called
+    assert stale_connection.close.called
+    assert not from_vim.stale
+
+
+def test_ProxyToVim_registerSession():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import REMOTE_READY
+
+    communicator = Mock()
+    to_vim = ProxyToVim(communicator)
+    to_vim.remote_state = REMOTE_READY
+
+    to_vim.registerSession('12', '/tmp/vimpdb-0/12.sock')
+
+    communicator._send.assert_called_with(
+        ":call PDB_register_session('12', '/tmp/vimpdb-0/12.sock')<CR>")
+
+    # later calls name the session
+    to_vim._showFileAtLine('/tmp/a.py', 3)
+
+    communicator._send.assert_called_with(
+        ":call PDB_show_file_at_line(\"/tmp/a.py\", \"3\", '12')<CR>")
+
+    to_vim.showFeedback('error')
+
+    communicator._send.assert_called_with(
+        ":call PDB_show_feedback(['error'], '12')<CR>")
+
+
+def test_UnixProxyFromVim_waitFor():
+    import shutil
+    import socket
+    import tempfile
+    from mock import patch
+    from vimpdb.proxy import UnixProxyFromVim
+    from vimpdb.protocol import encode_frame
+
+    directory = os.path.join(tempfile.mkdtemp(), 'vimpdb-0')
+    patcher = patch('vimpdb.config.socket_directory',
+        Mock(return_value=directory))
+    patcher.start()
+    try:
+        from_vim = UnixProxyFromVim(6666)
+        path = from_vim.getAddress()
+        assert path == os.path.join(directory, '%d.sock' % os.getpid())
+        assert os.path.exists(path)
+
+        vim_end = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        vim_end.connect(path)
+        vim_end.sendall(encode_frame(['n', 's']))
+        assert from_vim.waitFor(None) == 'n'
+        assert from_vim.waitFor(None) == 's'
+        vim_end.close()
+
+        from_vim.closeSocket()
+        assert not os.path.exists(path)
+    finally:
+        patcher.stop()
+        shutil.rmtree(os.path.dirname(directory))
+
+
+def test_UnixProxyFromVim_not_private():
+    import shutil
+    import tempfile
+    from mock import patch
+    from vimpdb.proxy import UnixProxyFromVim
+
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0777)
+    patcher = patch('vimpdb.config.socket_directory',
+        Mock(return_value=directory))
+    patcher.start()
+    try:
+        from_vim = UnixProxyFromVim(6666)
+        path = from_vim.getAddress()
+        # bound in a private directory of its own
+        assert os.path.dirname(path) != directory
+        assert os.stat(os.path.dirname(path)).st_mode & 0777 == 0700
+
+        from_vim.closeSocket()
+        assert not os.path.exists(os.path.dirname(path))
+        assert os.listdir(directory) == []
+    finally:
+        patcher.stop()
+        shutil.rmtree(directory)
+
+
+def test_UnixProxyFromVim_forked():
+    import shutil
+    import tempfile
+    from socket import socket
+    from mock import patch
+    from vimpdb.proxy import UnixProxyFromVim
+
+    from_vim = UnixProxyFromVim(6666)
+    inherited = Mock(socket)
+    from_vim.socket = inherited
+    from_vim.socket_inactive = False
+    from_vim.pid = -1
+    from_vim.path = '/tmp/vimpdb-0/parent.sock'
+    from_vim.pending = ['n']
+    from_vim.socket_factory = Mock()
+
+    directory = tempfile.mkdtemp()
+    patcher = patch('vimpdb.config.socket_directory',
+        Mock(return_value=directory))
+    patcher.start()
+    try:
+        path = from_vim.getAddress()
+    finally:
+        patcher.stop()
+        shutil.rmtree(directory)
+
+    # parent socket is closed in the child, its file is left alone
+    assert inherited.close.called
+    assert path == os.path.join(directory, '%d.sock' % os.getpid())
+    assert from_vim.pid == os.getpid()
+    assert from_vim.pending == []
+    from_vim.socket.bind.assert_called_with(path)
+
+
+def test_StreamProxyFromVim_port_taken():
+    from vimpdb.proxy import StreamProxyFromVim
+
+    first = StreamProxyFromVim(0)
+    port = int(first.getAddress().split(':')[1])
+    second = StreamProxyFromVim(port)
+    try:
+        address = second.getAddress()
+        assert address.startswith('127.0.0.1:')
+        assert address != '127.0.0.1:%d' % port
+    finally:
+        first.closeSocket()
+        second.closeSocket()
+
+
+class BlockingCommunicator(object):
+    """
+    records commands; the first one blocks until released
+    """
+
+    def __init__(self):
+        import threading
+        self.sent = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def _send(self, command):
+        self.started.set()
+        self.released.wait()
+        self.sent.append(command)
+
+    def _remote_expr(self, expr):
+        return '1'
+
+
+def test_AsyncProxyToVim_coalesces_updates():
+    from vimpdb.proxy import AsyncProxyToVim
+    from vimpdb.proxy import REMOTE_READY
+
+    filename = os.path.abspath(__file__)
+    communicator = BlockingCommunicator()
+    to_vim = AsyncProxyToVim(communicator)
+    to_vim.remote_state = REMOTE_READY
+    to_vim.showFeedback('hold')
+    communicator.started.wait()
+
+    for lineno in (2, 3, 4):
+        to_vim.showFileAtLine(filename, lineno)
+        to_vim.showFeedback('line %d' % lineno)
+    communicator.released.set()
+    to_vim.flush()
+
+    assert communicator.sent == [
+        ":call PDB_show_feedback(['hold'])<CR>",
+        ":call PDB_show_feedback(['line 2'])<CR>",
+        ":call PDB_show_feedback(['line 3'])<CR>",
+        ':call PDB_show_file_at_line("%s", "4")<CR>' % filename,
+        ":call PDB_show_feedback(['line 4'])<CR>"]
+    assert to_vim.coalesced == 2
+
+
+def test_AsyncProxyToVim_discardPending():
+    from vimpdb.proxy import AsyncProxyToVim
+    from vimpdb.proxy import REMOTE_READY
+
+    communicator = BlockingCommunicator()
+    to_vim = AsyncProxyToVim(communicator)
+    to_vim.remote_state = REMOTE_READY
+    to_vim.showFeedback('hold')
+    communicator.started.wait()
+    to_vim.updateLocals(['a = ', '    1'])
+
+    to_vim.discardPending()
+    communicator.released.set()
+    to_vim.flush()
+
+    assert communicator.sent == [":call PDB_show_feedback(['hold'])<CR>"]
+    assert to_vim.watch_lines is None
+
+
+def test_AsyncProxyToVim_failed_update():
+    from vimpdb.errors import RemoteUnavailable
+    from vimpdb.proxy import AsyncProxyToVim
+    from vimpdb.proxy import REMOTE_READY
+
+    communicator = Mock()
+    communicator._send.side_effect = [RemoteUnavailable(), None]
+    to_vim = AsyncProxyToVim(communicator)
+    to_vim.remote_state = REMOTE_READY
+
+    to_vim.showFeedback('lost')
+    to_vim.flush()
+
+    # worker survives; next update checks the Vim setup again
+    assert to_vim.remote_state != REMOTE_READY
+
+
+def test_ProxyToVim_server_lost():
+    from vimpdb.errors import RemoteUnavailable
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    communicator._send.side_effect = [RemoteUnavailable(), None, None]
+    detector = Mock()
+    to_vim = ProxyToVim(communicator, detector=detector)
+
+    py.test.raises(RemoteUnavailable, to_vim.showFeedback, 'lost')
+    assert detector.forget_server.called
+    assert not detector.check_serverlist.called
+
+    # server list checked again, once, before setting up Vim
+    to_vim.showFeedback('found')
+    to_vim.showFeedback('again')
+    assert detector.check_serverlist.call_count == 1
+
+
+def test_ProxyToVim_counts_round_trips():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+    from vimpdb.stats import Recorder
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    recorder = Recorder()
+    to_vim = ProxyToVim(communicator, recorder)
+
+    recorder.start('n')
+    to_vim.showFeedback('first')
+    recorder.stop()
+
+    record = recorder.records[0]
+    assert record['round_trips'] == 2
+    assert record['bytes'] == (len("exists('*PDB_setup_egg')") +
+        len(":call PDB_show_feedback(['first'])<CR>"))
+
+
+def test_ProxyToVim_showBreakpoints_delta():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = ProxyToVim(communicator)
+
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+    communicator._send.assert_called_with(
+        ":call PDB_update_signs([['/tmp/a.py', [[3, 1]], []]])<CR>")
+
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}, '/tmp/b.py': {1: False}})
+    assert communicator._send.call_count == 2
+    communicator._send.assert_called_with(
+        ":call PDB_update_signs([['/tmp/b.py', [[1, 0]], []]])<CR>")
+
+    to_vim.forgetBreakpoints()
+    to_vim.showBreakpoints({'/tmp/b.py': {1: False}})
+    communicator._send.assert_called_with(
+        ":call PDB_update_signs([['/tmp/b.py', [[1, 0]], []]])<CR>")
+
+
+def test_ProxyToVim_showBreakpoints_session():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = ProxyToVim(communicator)
+    to_vim.session = '12'
+
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+    communicator._send.assert_called_with(
+        ":call PDB_update_signs([['/tmp/a.py', [[3, 1]], []]], '12')<CR>")
+
+
+def test_ProxyToVim_showBreakpoints_new_vim():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = ProxyToVim(communicator)
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+
+    # Vim restarted without vimpdb.vim, nor signs
+    to_vim.invalidateRemoteSetup()
+    communicator._remote_expr.return_value = '0'
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}, '/tmp/b.py': {1: True}})
+
+    communicator._send.assert_called_with(":call PDB_update_signs("
+        "[['/tmp/a.py', [[3, 1]], []], ['/tmp/b.py', [[1, 1]], []]])<CR>")
+
+
+def test_AsyncProxyToVim_showBreakpoints_new_vim():
+    from vimpdb.proxy import AsyncProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = AsyncProxyToVim(communicator)
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+    to_vim.flush()
+
+    # Vim restarted without vimpdb.vim, nor signs: the file shown
+    # sources vimpdb.vim, pending signs are sent again
+    to_vim.invalidateRemoteSetup()
+    communicator._remote_expr.return_value = '0'
+    to_vim.showFileAtLine(os.path.abspath(__file__), 1)
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+    to_vim.flush()
+
+    communicator._send.assert_called_with(
+        ":call PDB_update_signs([['/tmp/a.py', [[3, 1]], []]])<CR>")
+
+
+def test_AsyncProxyToVim_discardPending_keeps_signs():
+    from vimpdb.proxy import AsyncProxyToVim
+    from vimpdb.proxy import REMOTE_READY
+
+    communicator = BlockingCommunicator()
+    to_vim = AsyncProxyToVim(communicator)
+    to_vim.remote_state = REMOTE_READY
+    to_vim.showFeedback('hold')
+    communicator.started.wait()
+    to_vim.updateLocals(['a = ', '    1'])
+    to_vim.showBreakpoints({'/tmp/a.py': {3: True}})
+
+    to_vim.discardPending()
+    communicator.released.set()
+    to_vim.flush()
+
+    assert communicator.sent == [":call PDB_show_feedback(['hold'])<CR>",
+        ":call PDB_update_signs([['/tmp/a.py', [[3, 1]], []]])<CR>"]
+
+
+def test_ProxyToVim_showBreakpointList_delta():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = ProxyToVim(communicator)
+    to_vim.session = '12'
+
+    to_vim.showBreakpointList({1: ('/tmp/a.py', 3, '', 0, 1, 0)})
+    communicator._send.assert_called_with(":call PDB_update_breakpoints("
+        "[[1, '/tmp/a.py', 3, '', 0, 1, 0]], [], '12')<CR>")
+
+    to_vim.showBreakpointList({1: ('/tmp/a.py', 3, '', 0, 1, 0)})
+    assert communicator._send.call_count == 1
+
+    to_vim.showBreakpointList({2: ('/tmp/a.py', 5, '', 0, 1, 0)})
+    communicator._send.assert_called_with(":call PDB_update_breakpoints("
+        "[[2, '/tmp/a.py', 5, '', 0, 1, 0]], [1], '12')<CR>")
+
+
+def test_ProxyToVim_preloadFiles():
+    from vimpdb.proxy import ProxyToVim
+    from vimpdb.proxy import Communicator
+
+    communicator = Mock(spec=Communicator)
+    communicator._remote_expr.return_value = '1'
+    to_vim = ProxyToVim(communicator)
+    filename = os.path.abspath(__file__)
+
+    to_vim.preloadFiles([filename, '/nonexistent/file.py'])
+    to_vim.preloadFiles([filename, '/nonexistent/file.py'])
+
+    assert communicator._send.call_count == 1
+    communicator._send.assert_called_with(':call PDB_preload_files(%s)<CR>'
+        % repr([filename.replace('\\', '/')]))
+
+    to_vim.preloadFiles(['/nonexistent/file.py'])
+    assert communicator._send.call_count == 1
@@ -0,0 +1,99 @@
+import os
+
+
+def fake_clock(*times):
+    times = list(times)
+    return lambda: times.pop(0)
+
+
+def test_percentile():
+    from vimpdb.stats import percentile
+
+    values = range(1, 101)
+    assert percentile(values, 50) == 50
+    assert percentile(values, 90) == 90
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == 0
+
+
+def test_command_name():
+    from vimpdb.stats import command_name
+
+    assert command_name('n') == 'n'
+    assert command_name('b a.py:12 ') == 'b'
+    assert command_name('!x = 1') == '!'
+    assert command_name('') == '(empty)'
+
+
+def test_Recorder_records():
+    from vimpdb.stats import Recorder
+
+    recorder = Recorder(fake_clock(10.0, 10.5))
+    recorder.round_trip(12)
+    recorder.start('n')
+    recorder.round_trip(10)
+    recorder.round_trip(20)
+    recorder.rendered(0.125)
+    recorder.stop()
+    recorder.stop()
+
+    assert recorder.records == [dict(command='n', wall=0.5, round_trips=2,
+        bytes=30, render=0.125)]
+
+
+def test_Recorder_keeps_last_records():
+    from vimpdb.stats import Recorder
+
+    recorder = Recorder(lambda: 0.0)
+    recorder.MAX_RECORDS = 2
+    for name in 'abc':
+        recorder.start(name)
+        recorder.stop()
+
+    assert [record['command'] for record in recorder.records] == ['b', 'c']
+
+
+def test_Recorder_summary():
+    from vimpdb.stats import Recorder
+
+    recorder = Recorder(fake_clock(0.0, 0.001, 0.0, 0.003, 0.0, 0.002))
+    for name in 'nns':
+        recorder.start(name)
+        recorder.stop()
+
+    lines = recorder.summary()
+
+    assert lines[0].split() == ['command', 'count', 'metric', 'p50', 'p90',
+        'p99', 'max']
+    assert lines[1].split() == ['n', '2', 'wall', 'ms', '1.0', '3.0', '3.0',
+        '3.0']
+    assert lines[2].split()[:2] == ['round-trips', '0.0']
+    assert lines[5].split()[:2] == ['s', '1']
+    assert len(lines) == 9
+
+
+def test_Recorder_summary_empty():
+    from vimpdb.stats import Recorder
+
+    assert Recorder().summary() == ['no command recorded']
+
+
+def test_Recorder_dump():
+    import tempfile
+    from vimpdb.stats import Recorder
+
+    recorder = Recorder(fake_clock(0.0, 0.25))
+    recorder.start('n')
+    recorder.round_trip(5)
+    recorder.stop()
+    handle, name = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        recorder.dump(name)
+        lines = open(name).read().splitlines()
+    finally:
+        os.remove(name)
+
+    assert lines == ['command\twall\tround_trips\tbytes\trender',
+        'n\t0.25\t1\t5\t0.0']
@@ -0,0 +1,165 @@
+import sys
+
+
+def test_snapshot_scalar():
+    from vimpdb.watch import snapshot
+    from vimpdb.watch import same_snapshot
+
+    value = 'text'
+    assert same_snapshot(snapshot(value), snapshot(value))
+    assert not same_snapshot(snapshot(value), snapshot('other'))
+    assert not same_snapshot(snapshot(1), snapshot(1.0))
+
+
+def test_snapshot_container():
+    from vimpdb.watch import snapshot
+    from vimpdb.watch import same_snapshot
+
+    value = [1, 2, 3]
+    before = snapshot(value)
+    assert same_snapshot(before, snapshot(value))
+    value[1] = 5
+    assert not same_snapshot(before, snapshot(value))
+    value.append(4)
+    assert not same_snapshot(before, snapshot(value))
+
+    mapping = {'a': 1}
+    before = snapshot(mapping)
+    assert same_snapshot(before, snapshot(mapping))
+    mapping['a'] = 2
+    assert not same_snapshot(before, snapshot(mapping))
+
+
+def test_snapshot_not_available():
+    from vimpdb.watch import snapshot
+    from vimpdb.watch import same_snapshot
+
+    class Klass:
+        pass
+
+    assert snapshot(Klass()) is None
+    assert snapshot([[1]]) is None
+    assert not same_snapshot(None, None)
+
+
+def test_diff_lines():
+    from vimpdb.watch import diff_lines
+
+    old = ['a = ', '    1', 'b = ', '    2']
+    new = ['a = ', '    1', 'b = ', '    3', 'c = ', '    4']
+    ops = diff_lines(old, new)
+    assert ops == [[3, 4, ['    3', 'c = ', '    4']]]
+
+    patched = list(old)
+    ops.reverse()
+    for start, end, lines in ops:
+        patched[start:end] = lines
+    assert patched == new
+    assert diff_lines(new, new) == []
+
+
+def test_WatchEngine_render():
+    from vimpdb.watch import WatchEngine
+
+    def function():
+        b = [1, 2]
+        a = 'text'
+        return sys._getframe()
+
+    engine = WatchEngine()
+    frame = function()
+    lines = engine.render(frame)
+    assert lines == ["a = ", "    'text'", "b = ", "    [1, 2]"]
+    assert engine.formatted == 2
+
+    assert engine.render(frame) == lines
+    assert engine.formatted == 2
+    assert engine.reused == 2
+
+    frame.f_locals['b'].append(3)
+    lines = engine.render(frame)
+    assert lines[-1] == "    [1, 2, 3]"
+    assert engine.formatted == 3
+
+
+def test_WatchEngine_prune():
+    from vimpdb.watch import WatchEngine
+
+    frame = sys._getframe()
+    other = sys._getframe().f_back
+    engine = WatchEngine()
+    engine.cache[(id(other), 'name')] = (None, [])
+    engine.render(frame)
+    assert (id(other), 'name') not in engine.cache
+
+
+def test_Renderer_small_values():
+    import pprint
+    from vimpdb.watch import Renderer
+
+    renderer = Renderer()
+    for value in [1, 'text', [1, 2], (1,), {'a': 1}, set([1]), [], {}]:
+        assert renderer.format(value) == [pprint.pformat(value, width=36)]
+
+
+def test_Renderer_multiline():
+    import pprint
+    from vimpdb.watch import Renderer
+
+    renderer = Renderer()
+    value = {'a': range(5), 'b': 'x' * 30}
+    assert renderer.format(value) == pprint.pformat(value,
+        width=36).splitlines()
+
+
+def test_Renderer_maxlength():
+    from vimpdb.watch import Renderer
+
+    renderer = Renderer(maxlength=3)
+    assert renderer.format(range(10 ** 6)) == ['[0, 1, 2, ...]']
+    lines = renderer.format(['x' * 20] * 10 ** 6)
+    assert lines == ["['xxxxxxxxxxxxxxxxxxxx',"] + [
+        " 'xxxxxxxxxxxxxxxxxxxx',"] * 2 + [' ...]']
+
+
+def test_Renderer_maxdepth():
+    from vimpdb.watch import Renderer
+
+    renderer = Renderer(maxdepth=2)
+    assert renderer.format([[[[1]]]]) == ['[[[...]]]']
+    assert renderer.format([[[[1]]]], expansion=2) == ['[[[[1]]]]']
+
+
+def test_Renderer_maxbytes():
+    from vimpdb.watch import Renderer
+
+    renderer = Renderer(maxlength=1000, maxbytes=20)
+    lines = renderer.format(['x' * 10] * 100)
+    assert lines[-1] == ' ...]'
+    assert len(lines) < 10
+
+
+def test_WatchEngine_expand():
+    from vimpdb.watch import WatchEngine
+    from vimpdb.watch import Renderer
+
+    def function():
+        value = [[[[1]]]]
+        return sys._getframe()
+
+    engine = WatchEngine(Renderer(maxdepth=2))
+    frame = function()
+    assert engine.render(frame) == ['value = ', '    [[[...]]]']
+    engine.expand(frame, 'value')
+    engine.expand(frame, 'value')
+    assert engine.render(frame) == ['value = ', '    [[[[1]]]]']
+
+    # same name in another function is not expanded
+    def other():
+        value = [[[[1]]]]
+        return sys._getframe()
+
+    assert engine.render(other()) == ['value = ', '    [[[...]]]']
+
+    engine.clear()
+    assert engine.render(frame) == ['value = ', '    [[[...]]]']
@@ -0,0 +1,53 @@
+"""
+decides if set_trace() starts debugging
+
+Kept free of heavy imports: importing vimpdb loads only this module,
+the debugger is imported when debugging starts.
+"""
+import os
+
+# values of VIMPDB_DISABLED that leave set_trace() enabled
+ENABLED_VALUES = ('', '0', 'false', 'no')
+
+
+def disabled_by(value):
+    """
+    tells if value of VIMPDB_DISABLED disables set_trace()
+    """
+    return value.strip().lower() not in ENABLED_VALUES
+
+
+# when true, set_trace() returns immediately
+disabled = disabled_by(os.environ.get('VIMPDB_DISABLED', ''))
+
+# number of times each set_trace() call has been reached with a true
+# condition, by (code, line number) of the caller
+hits = dict()
+
+
+def disable():
+    global disabled
+    disabled = True
+
+
+def enable():
+    global disabled
+    disabled = False
+
+
+def should_trace(frame, condition=True, hit_count=None, enabled=True):
+    """
+    tells if set_trace() called from frame starts debugging
+    """
+    if disabled or not enabled:
+        return False
+    if callable(condition):
+        condition = condition()
+    if not condition:
+        return False
+    if hit_count is not None:
+        key = (frame.f_code, frame.f_lineno)
+        count = hits[key] = hits.get(key, 0) + 1
+        if count < hit_count:
+            return False
+    return True
@@ -1,5 +1,11 @@
 highlight link PdbCurrentLine Cursor
 
+" breakpoint signs
+if has('signs')
+    sign define PdbBreakpoint text=B> texthl=Error
+    sign define PdbBreakpointDisabled text=b> texthl=Comment
+endif
+
 function! PDB_setup_egg(path)
 python <<EOT
 import sys
@@ -16,6 +22,12 @@ from vimpdb.controller import initialize
 import vim
 initialize(vim)
 EOT
+    " breakpoint signs of files loaded later
+    augroup vimpdb_signs
+        autocmd!
+        autocmd BufReadPost * call s:PDBSignsLoaded(expand('<afile>:p'))
+        autocmd BufUnload * call s:PDBSignsUnloaded(expand('<afile>:p'))
+    augroup END
 endfunction
 
 function! s:PDB_init_display()
@@ -25,7 +37,20 @@ function! s:PDB_init_display()
     call foreground()
 endfunction
 
-function! PDB_show_file_at_line(filename, line)
+" vimpdb gives the name of its session as optional last argument
+" once registered
+function! s:PDB_session(args)
+    if len(a:args) > 0
+        return a:args[0]
+    endif
+    return ""
+endfunction
+
+function! PDB_show_file_at_line(filename, line, ...)
+    " other sessions than the current one are shown with :PDBSession
+    if !s:PDBSessionStopped(s:PDB_session(a:000), a:filename, a:line)
+        return
+    endif
     call s:PDB_init_display()
     let current_filename = expand('%:p')
     if current_filename != a:filename
@@ -39,24 +64,126 @@ function! PDB_show_file_at_line(filename, line)
     execute 'match PdbCurrentLine /\%' . a:line . 'l\s*\zs.\+/'
 endfunction
 
+" buffers of files shown by vimpdb, by filename: they stay loaded and
+" showing them again does not read the file nor set up syntax again
+let s:pdb_buffers = {}
+
+function! s:PDB_file_buffer(filename)
+    let number = get(s:pdb_buffers, a:filename, -1)
+    if number > 0 && bufloaded(number)
+        return number
+    endif
+    return -1
+endfunction
+
 function! s:PDB_load_file(filename)
     call s:PDB_reset_original_map()
-    execute "view " . a:filename
+    let number = s:PDB_file_buffer(a:filename)
+    if number > 0
+        execute "buffer " . number
+    else
+        execute "view " . a:filename
+        let s:pdb_buffers[a:filename] = bufnr('%')
+    endif
+    setlocal bufhidden=hide
     setlocal cursorline
     highlight PdbCurrentLine
 endfunction
 
-function! PDB_show_feedback(message)
+" files of the stack, that vimpdb may show next:
+" loaded in the background, one at a time
+let s:pdb_preload = []
+
+function! PDB_preload_files(filenames)
+    let s:pdb_preload = copy(a:filenames)
+    if exists('*timer_start') && exists('*bufload')
+        call timer_start(0, function('s:PDB_preload_next'))
+    endif
+endfunction
+
+function! s:PDB_preload_next(timer)
+    while len(s:pdb_preload) > 0
+        let filename = remove(s:pdb_preload, 0)
+        " buffers already there may be the user's own: their options
+        " are left alone
+        if !bufexists(filename) && filereadable(filename)
+            let number = bufadd(filename)
+            call setbufvar(number, '&bufhidden', 'hide')
+            call bufload(number)
+            call setbufvar(number, '&readonly', 1)
+            let s:pdb_buffers[filename] = number
+            if len(s:pdb_preload) > 0
+                call timer_start(0, function('s:PDB_preload_next'))
+            endif
+            return
+        endif
+    endwhile
+endfunction
+
+function! PDB_show_feedback(message, ...)
     call s:PDB_init_display()
-    call s:PDBBufferWrite(a:message)
+    call s:PDBBufferWrite(a:message, s:PDB_session(a:000))
+endfunction
+
+function! PDB_append_feedback(message, ...)
+    call s:PDBBufferAppend(a:message, s:PDB_session(a:000))
+endfunction
+
+function! PDB_reset_watch(...)
+    call s:PDBWatchReset(s:PDB_session(a:000))
+endfunction
+
+function! PDB_write_watch(message, ...)
+    call s:PDBWatchWrite(a:message, s:PDB_session(a:000))
+endfunction
+
+function! PDB_append_watch(message, ...)
+    call s:PDBWatchAppend(a:message, s:PDB_session(a:000))
+endfunction
+
+function! PDB_patch_watch(length, ops, ...)
+    return s:PDBWatchPatch(a:length, a:ops, s:PDB_session(a:000))
+endfunction
+
+function! PDB_update_signs(changes, ...)
+    call s:PDBUpdateSigns(a:changes, s:PDB_session(a:000))
+endfunction
+
+"---------------------------------------------------------------------
+" breakpoint list window
+function! PDB_update_breakpoints(changed, removed, ...)
+    call s:PDBUpdateBreakpoints(a:changed, a:removed, s:PDB_session(a:000))
 endfunction
 
-function! PDB_reset_watch()
-    call s:PDBWatchReset()
+function! PDB_breakpoints(pattern)
+    call s:PDBShowBreakpoints(a:pattern)
 endfunction
 
-function! PDB_append_watch(message)
-    call s:PDBWatchWrite(a:message)
+" enable, disable or clear the breakpoint under the cursor
+function! PDB_breakpoint_action(command)
+    let number = s:PDBBreakpointNumber(line('.'))
+    if number != 0
+        call PDBSendCommand(a:command . " " . number)
+    endif
+endfunction
+
+function! PDB_breakpoint_jump()
+    let location = s:PDBBreakpointLocation(line('.'))
+    if len(location) == 0
+        return
+    endif
+    wincmd p
+    execute "view " . fnameescape(location[0])
+    execute "normal " . location[1] . "ggz."
+endfunction
+
+function! PDB_watch_expand()
+    " find the name of the local whose value is under the cursor
+    let lnum = search('^\S\+ = $', 'bcnW')
+    if lnum != 0
+        let name = matchstr(getline(lnum), '^\S\+\ze = $')
+        call PDBSendCommand("expand " . name)
+    endif
 endfunction
 
 "---------------------------------------------------------------------
@@ -145,9 +272,12 @@ endfunction
 " ex mode commands support
 function! PDB_continue()
     call PDBSendCommand('c')
+    " vimpdb closes its end when continuing
+    call s:PDBSocketClose()
     call s:PDB_reset_original_map()
     call s:PDBBufferClose()
     call s:PDBWatchClose()
+    call s:PDB_next_session()
 endfunction
 
 function! PDB_reset()
@@ -165,10 +295,13 @@ function! PDB_eval()
     call PDBSendCommand("!" . expr)
 endfunction
 
-function! PDB_break()
-    let line = line('.')
+function! PDB_break() range
     let filename = expand('%:p')
-    call PDBSendCommand("b " . filename . ":" . line)
+    let commands = []
+    for line in range(a:firstline, a:lastline)
+        call add(commands, "b " . filename . ":" . line)
+    endfor
+    call PDBSendCommands(commands)
 endfunction
 
 function! PDB_clear()
@@ -181,12 +314,47 @@ function! PDB_exit()
     call s:PDB_reset_original_map()
     call s:PDBBufferClose()
     call s:PDBWatchClose()
+    call s:PDBSignsClear()
+    call s:PDBBreakpointsClose()
     call s:PDBSocketClose()
+    call s:PDB_next_session()
     echohl ErrorMsg
     echo "Switch back to shell.\n\n"
     echohl None
 endfunction
 
+"---------------------------------------------------------------------
+" sessions: one per paused debugged process
+function! PDB_register_session(name, address)
+    call s:PDBRegisterSession(a:name, a:address)
+endfunction
+
+" the current session is done; show the next paused one if any
+function! s:PDB_next_session()
+    let name = s:PDBUnregisterSession()
+    if name != ""
+        call PDB_select_session(name)
+    endif
+endfunction
+
+function! PDB_sessions()
+    for line in s:PDBSessionList()
+        echo line
+    endfor
+endfunction
+
+function! PDB_select_session(name)
+    let location = s:PDBSelectSession(a:name)
+    if len(location) == 0
+        echohl ErrorMsg
+        echo "vimpdb: no paused session " . a:name
+        echohl None
+        return
+    endif
+    call PDB_show_file_at_line(location[0], location[1])
+    call s:PDBShowSessionBuffers()
+endfunction
+
 "---------------------------------------------------------------------
 " ex mode commands
 if !exists(":PDBNext")
@@ -208,7 +376,7 @@ if !exists(":PDBEval")
   command! PDBEval :call PDB_eval()
 endif
 if !exists(":PDBBreak")
-  command! PDBBreak :call PDB_break()
+  command! -range PDBBreak :<line1>,<line2>call PDB_break()
 endif
 if !exists(":PDBClear")
   command! PDBClear :call PDB_clear()
@@ -228,3 +396,15 @@ endif
 if !exists("PDBWord")
   command! PDBWord :call PDBSendCommand("!".expand("<cword>"))
 endif  
+if !exists(":PDBBreakpoints")
+  command! -nargs=? PDBBreakpoints :call PDB_breakpoints(<q-args>)
+endif
+if !exists(":PDBStats")
+  command! PDBStats :call PDBSendCommand("stats")
+endif
+if !exists(":PDBSessions")
+  command! PDBSessions :call PDB_sessions()
+endif
+if !exists(":PDBSession")
+  command! -nargs=1 PDBSession :call PDB_select_session(<q-args>)
+endif
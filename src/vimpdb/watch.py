@@ -0,0 +1,224 @@
+import difflib
+import itertools
+from repr import Repr
+
+from vimpdb import config
+
+# types whose instances never change once built
+SCALAR_TYPES = frozenset([int, long, float, complex, bool, str, unicode,
+    type(None)])
+
+CONTAINER_TYPES = frozenset([list, tuple, set, frozenset])
+
+
+def snapshot(value):
+    """
+    cheap snapshot of value, to find out later if it may have changed
+
+    Returns None when no cheap snapshot can be taken; value must then
+    be formatted again.
+    The snapshot holds references to the objects it is made of so that
+    their ids cannot be reused while it is alive.
+    """
+    kind = type(value)
+    if kind in SCALAR_TYPES:
+        return kind, [value]
+    if kind is dict:
+        items = value.keys() + value.values()
+    elif kind in CONTAINER_TYPES:
+        items = list(value)
+    else:
+        return None
+    if not set(map(type, items)) <= SCALAR_TYPES:
+        return None
+    return kind, items
+
+
+def same_snapshot(old, new):
+    if old is None or new is None:
+        return False
+    old_kind, old_items = old
+    new_kind, new_items = new
+    if old_kind is not new_kind or len(old_items) != len(new_items):
+        return False
+    return map(id, old_items) == map(id, new_items)
+
+
+def diff_lines(old, new):
+    """
+    line ranges of old to replace to get new
+
+    Returns a list of [start, end, lines] to apply from last to first.
+    """
+    matcher = difflib.SequenceMatcher(None, old, new)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            ops.append([i1, i2, new[j1:j2]])
+    return ops
+
+
+# containers spread over several lines when too wide
+BRACKETS = {
+    list: ('[', ']'),
+    tuple: ('(', ')'),
+    dict: ('{', '}'),
+    set: ('set([', '])'),
+    frozenset: ('frozenset([', '])'),
+    }
+
+ELLIPSIS = '...'
+
+
+class Renderer(object):
+    """
+    pprint-like formatting bounded in depth, number of items and size
+
+    Each expansion level adds one level of depth and doubles
+    the number of items and the size allowed.
+    """
+
+    def __init__(self, width=36, maxdepth=config.DEFAULT_WATCH_MAXDEPTH,
+        maxlength=config.DEFAULT_WATCH_MAXLENGTH,
+        maxbytes=config.DEFAULT_WATCH_MAXBYTES):
+        self.width = width
+        self.maxdepth = maxdepth
+        self.maxlength = maxlength
+        self.maxbytes = maxbytes
+
+    def format(self, value, expansion=0):
+        factor = 2 ** expansion
+        self.depth = self.maxdepth + expansion
+        self.length = self.maxlength * factor
+        self.remaining = self.maxbytes * factor
+        self.repr = Repr()
+        self.repr.maxlist = self.repr.maxtuple = self.length
+        self.repr.maxdict = self.repr.maxset = self.length
+        self.repr.maxfrozenset = self.repr.maxdeque = self.length
+        self.repr.maxarray = self.length
+        self.repr.maxstring = self.repr.maxlong = self.remaining
+        self.repr.maxother = self.remaining
+        return self._format(value, 0, 0)
+
+    def short_repr(self, value, level):
+        self.repr.maxlevel = max(self.depth - level, 0)
+        return self.repr.repr(value)
+
+    def _format(self, value, level, indent):
+        text = self.short_repr(value, level)
+        brackets = BRACKETS.get(type(value))
+        if (brackets is None or len(text) + indent <= self.width or
+            level >= self.depth or not value):
+            self.remaining -= len(text)
+            return [text]
+        opening, closing = brackets
+        indent += len(opening)
+        if type(value) is dict:
+            items = self.dict_items(value, level, indent)
+        else:
+            items = [self._format(item, level + 1, indent)
+                for item in self.first_items(value)]
+        if len(items) < len(value):
+            items.append([ELLIPSIS])
+        elif type(value) is tuple and len(value) == 1:
+            items[0][-1] += ','
+        lines = []
+        for item_lines in items[:-1]:
+            item_lines[-1] += ','
+            lines.extend(item_lines)
+        lines.extend(items[-1])
+        lines[0] = opening + lines[0]
+        lines[1:] = [' ' * len(opening) + line for line in lines[1:]]
+        lines[-1] += closing
+        return lines
+
+    def first_items(self, value):
+        """
+        items to format, until the number of items or the size is exhausted
+        """
+        for item in itertools.islice(value, self.length):
+            if self.remaining <= 0:
+                break
+            yield item
+
+    def dict_items(self, value, level, indent):
+        if len(value) <= self.length:
+            try:
+                keys = sorted(value)
+            except TypeError:
+                keys = value.keys()
+        else:
+            keys = value.iterkeys()
+        items = []
+        for key in self.first_items(keys):
+            key_text = self.short_repr(key, level + 1) + ': '
+            item_lines = self._format(value[key], level + 1,
+                indent + len(key_text))
+            item_lines[0] = key_text + item_lines[0]
+            item_lines[1:] = [' ' * len(key_text) + line
+                for line in item_lines[1:]]
+            items.append(item_lines)
+        return items
+
+
+class WatchEngine(object):
+    """
+    format locals of a frame for the watch window
+
+    Keeps the lines formatted for each (frame, name) at previous step and
+    reuses them when the value did not change.
+    """
+
+    def __init__(self, renderer=None):
+        if renderer is None:
+            renderer = Renderer()
+        self.renderer = renderer
+        self.cache = dict()
+        # expansion level asked by the user for each (code, name)
+        self.expanded = dict()
+        self.reused = 0
+        self.formatted = 0
+
+    def expand(self, frame, name):
+        key = (frame.f_code, name)
+        self.expanded[key] = self.expanded.get(key, 0) + 1
+
+    def value_lines(self, frame, name, value):
+        key = (id(frame), name)
+        expansion = self.expanded.get((frame.f_code, name), 0)
+        current = snapshot(value)
+        cached = self.cache.get(key)
+        if (cached is not None and cached[1] == expansion and
+            same_snapshot(cached[0], current)):
+            self.reused += 1
+            return cached[2]
+        lines = self.renderer.format(value, expansion)
+        self.formatted += 1
+        self.cache[key] = (current, expansion, lines)
+        return lines
+
+    def render(self, frame, stack_frames=()):
+        """
+        lines of the watch window for frame;
+        cache entries of frames not in stack_frames are dropped.
+        """
+        self.prune([frame] + list(stack_frames))
+        locals = frame.f_locals
+        keys = locals.keys()
+        keys.sort()
+        lines = []
+        for key in keys:
+            lines.append('%s = ' % key)
+            for line in self.value_lines(frame, key, locals[key]):
+                lines.append('    %s' % line)
+        return lines
+
+    def prune(self, frames):
+        alive = dict.fromkeys([id(frame) for frame in frames])
+        for key in self.cache.keys():
+            if key[0] not in alive:
+                del self.cache[key]
+
+    def clear(self):
+        self.cache.clear()
+        self.expanded.clear()